@@ -1,5 +1,6 @@
 import requests
 from assistant.badger_api.config import urls
+from assistant.rewards.classes.InputBundle import inputBundle
 import concurrent.futures
 
 
@@ -13,6 +14,14 @@ def fetch_account_data(address):
 
 
 def fetch_claimable_balances(addresses):
+    return inputBundle.fetch(
+        lambda: _fetch_claimable_balances(addresses),
+        "claimable balances",
+        list(addresses),
+    )
+
+
+def _fetch_claimable_balances(addresses):
     results = {}
     with concurrent.futures.ThreadPoolExecutor(max_workers=100) as executor:
         futures_to_addr = {
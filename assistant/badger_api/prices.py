@@ -1,5 +1,6 @@
 import requests
 from assistant.badger_api.config import urls
+from assistant.rewards.classes.InputBundle import inputBundle
 
 
 def fetch_ppfs():
@@ -10,5 +11,6 @@ def fetch_ppfs():
 
 
 def fetch_token_prices():
-    response = requests.get("{}/prices".format(urls["staging"])).json()
-    return response
+    return inputBundle.fetch(
+        lambda: requests.get("{}/prices".format(urls["staging"])).json(), "prices"
+    )
@@ -0,0 +1,82 @@
+import os
+
+from assistant.indexer.indexer import index_events
+from assistant.indexer.store import EventStore
+from assistant.rewards.balance_timeline import ZERO_ADDRESS, subgraph_order
+from config.env_config import env_config
+
+"""
+Subgraph-free versions of the assistant.subgraph.client fetchers,
+answered from locally indexed events. Events are indexed up to the
+requested block on demand
+"""
+
+_store = None
+
+
+def event_store():
+    global _store
+    if _store is None:
+        directory = os.path.dirname(env_config.indexer_db)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _store = EventStore(env_config.indexer_db)
+    return _store
+
+
+def fetch_sett_balances(key, settId, startBlock, store=None):
+    """
+    Sett share balances at a block, in the shape and order fetch_sett_balances
+    returns them from the subgraph
+    """
+    store = store or event_store()
+    settId = settId.lower()
+    index_events(store, "transfers", settId, startBlock)
+    balances = {}
+    for sender, recipient, value in store.transfers(settId, startBlock):
+        value = int(value)
+        if sender != ZERO_ADDRESS:
+            balances[sender] = balances.get(sender, 0) - value
+        if recipient != ZERO_ADDRESS:
+            balances[recipient] = balances.get(recipient, 0) + value
+    return subgraph_order(balances)
+
+
+def fetch_geyser_events(geyserId, startBlock, store=None):
+    store = store or event_store()
+    geyserId = geyserId.lower()
+    index_events(store, "geyser", geyserId, startBlock)
+    events = {"stake": [], "unstake": []}
+    totals = {}
+    for txHash, logIndex, kind, user, amount, total, timestamp in store.geyser_events(
+        geyserId, startBlock
+    ):
+        events[kind].append(
+            {
+                "id": "{}-{}".format(txHash, logIndex),
+                "user": user,
+                "amount": amount,
+                "timestamp": str(timestamp),
+                "total": total,
+            }
+        )
+        totals[user] = int(total)
+    return {
+        "stakes": events["stake"],
+        "unstakes": events["unstake"],
+        "totalStaked": sum(totals.values()),
+    }
+
+
+def fetch_claimed(treeId, startBlock, store=None):
+    """
+    Total amount claimed from the tree per user and token up to a block
+    """
+    store = store or event_store()
+    treeId = treeId.lower()
+    index_events(store, "claims", treeId, startBlock)
+    claimed = {}
+    for user, token, amount, cycle, block in store.claims(treeId, startBlock):
+        userClaims = claimed.setdefault(user, {})
+        userClaims[token] = userClaims.get(token, 0) + int(amount)
+    return claimed
@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from brownie import web3
+from rich.console import Console
+
+from assistant.rewards.balance_timeline import (
+    LOG_BLOCK_RANGE,
+    TRANSFER_TOPIC,
+    topic_to_address,
+)
+
+console = Console()
+
+STAKED_TOPIC = web3.keccak(
+    text="Staked(address,uint256,uint256,uint256,uint256,bytes)"
+).hex()
+UNSTAKED_TOPIC = web3.keccak(
+    text="Unstaked(address,uint256,uint256,uint256,uint256,bytes)"
+).hex()
+CLAIMED_TOPIC = web3.keccak(
+    text="Claimed(address,address,uint256,uint256,uint256,uint256)"
+).hex()
+
+# Block ranges fetched concurrently during a backfill
+INDEX_WORKERS = 4
+
+
+def topic_int(topic):
+    return int(topic.hex(), 16)
+
+
+def data_words(data):
+    data = data[2:] if data.startswith("0x") else data
+    return [int(data[i : i + 64], 16) for i in range(0, len(data), 64)]
+
+
+def decode_transfer(contract, log):
+    value = data_words(log["data"])[0]
+    return (
+        contract,
+        log["blockNumber"],
+        log["logIndex"],
+        topic_to_address(log["topics"][1]),
+        topic_to_address(log["topics"][2]),
+        str(value),
+    )
+
+
+def decode_geyser_event(contract, log):
+    kind = "stake" if log["topics"][0].hex() == STAKED_TOPIC else "unstake"
+    amount, total = data_words(log["data"])[:2]
+    return (
+        contract,
+        log["blockNumber"],
+        log["logIndex"],
+        log["transactionHash"].hex(),
+        kind,
+        topic_to_address(log["topics"][1]),
+        str(amount),
+        str(total),
+        topic_int(log["topics"][2]),
+    )
+
+
+def decode_claim(contract, log):
+    amount, timestamp, _ = data_words(log["data"])
+    return (
+        contract,
+        log["blockNumber"],
+        log["logIndex"],
+        topic_to_address(log["topics"][1]),
+        topic_to_address(log["topics"][2]),
+        str(amount),
+        topic_int(log["topics"][3]),
+        timestamp,
+    )
+
+
+# Event kind -> (store table, log topics filter, decoder)
+SOURCES = {
+    "transfers": ("transfers", [TRANSFER_TOPIC], decode_transfer),
+    "geyser": (
+        "geyser_events",
+        [[STAKED_TOPIC, UNSTAKED_TOPIC]],
+        decode_geyser_event,
+    ),
+    "claims": ("claims", [CLAIMED_TOPIC], decode_claim),
+}
+
+
+def block_ranges(fromBlock, toBlock, size):
+    return [
+        (start, min(start + size - 1, toBlock))
+        for start in range(fromBlock, toBlock + 1, size)
+    ]
+
+
+def index_events(
+    store,
+    kind,
+    contract,
+    toBlock,
+    fromBlock=0,
+    workers=INDEX_WORKERS,
+    blockRange=LOG_BLOCK_RANGE,
+):
+    """
+    Index a contract's events of the given kind up to toBlock, resuming after the
+    last indexed block. Block ranges are fetched concurrently but written in
+    order, so an interrupted backfill resumes without gaps
+    """
+    table, topics, decode = SOURCES[kind]
+    contract = contract.lower()
+    lastBlock = store.last_block(contract, kind)
+    if lastBlock is not None:
+        fromBlock = lastBlock + 1
+    if fromBlock > toBlock:
+        return
+
+    address = web3.toChecksumAddress(contract)
+    ranges = block_ranges(fromBlock, toBlock, blockRange)
+    console.log(
+        "Indexing {} {} events from {} to {} in {} ranges".format(
+            contract, kind, fromBlock, toBlock, len(ranges)
+        )
+    )
+
+    def fetch(blocks):
+        logs = web3.eth.getLogs(
+            {
+                "address": address,
+                "fromBlock": blocks[0],
+                "toBlock": blocks[1],
+                "topics": topics,
+            }
+        )
+        logs = sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"]))
+        return [decode(contract, log) for log in logs]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for blocks, rows in zip(ranges, pool.map(fetch, ranges)):
+            store.write(table, contract, kind, rows, blocks[1])
@@ -0,0 +1,133 @@
+import sqlite3
+
+"""
+SQLite store for indexed contract events.
+Token amounts are kept as TEXT, they don't fit in SQLite integers
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    token TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (token, block, log_index)
+);
+CREATE TABLE IF NOT EXISTS geyser_events (
+    geyser TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    user TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    total TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    PRIMARY KEY (geyser, block, log_index)
+);
+CREATE TABLE IF NOT EXISTS claims (
+    tree TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    user TEXT NOT NULL,
+    token TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    cycle INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    PRIMARY KEY (tree, block, log_index)
+);
+CREATE TABLE IF NOT EXISTS progress (
+    contract TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    PRIMARY KEY (contract, kind)
+);
+"""
+
+COLUMNS = {
+    "transfers": ["token", "block", "log_index", "sender", "recipient", "value"],
+    "geyser_events": [
+        "geyser",
+        "block",
+        "log_index",
+        "tx_hash",
+        "kind",
+        "user",
+        "amount",
+        "total",
+        "timestamp",
+    ],
+    "claims": [
+        "tree",
+        "block",
+        "log_index",
+        "user",
+        "token",
+        "amount",
+        "cycle",
+        "timestamp",
+    ],
+}
+
+
+class EventStore:
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def last_block(self, contract, kind):
+        """
+        Last block indexed for a contract's events, None if never indexed
+        """
+        row = self.db.execute(
+            "SELECT block FROM progress WHERE contract = ? AND kind = ?",
+            (contract, kind),
+        ).fetchone()
+        return row[0] if row else None
+
+    def write(self, table, contract, kind, rows, toBlock):
+        """
+        Store the rows decoded from a block range and mark every block up to
+        toBlock as indexed, in one transaction
+        """
+        columns = COLUMNS[table]
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO {} ({}) VALUES ({})".format(
+                    table, ", ".join(columns), ", ".join("?" * len(columns))
+                ),
+                rows,
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO progress (contract, kind, block) "
+                "VALUES (?, ?, ?)",
+                (contract, kind, toBlock),
+            )
+
+    def transfers(self, token, block):
+        return self.db.execute(
+            "SELECT sender, recipient, value FROM transfers "
+            "WHERE token = ? AND block <= ? ORDER BY block, log_index",
+            (token, block),
+        ).fetchall()
+
+    def geyser_events(self, geyser, block):
+        return self.db.execute(
+            "SELECT tx_hash, log_index, kind, user, amount, total, timestamp "
+            "FROM geyser_events WHERE geyser = ? AND block <= ? "
+            "ORDER BY block, log_index",
+            (geyser, block),
+        ).fetchall()
+
+    def claims(self, tree, block):
+        return self.db.execute(
+            "SELECT user, token, amount, cycle, block FROM claims "
+            "WHERE tree = ? AND block <= ? ORDER BY block, log_index",
+            (tree, block),
+        ).fetchall()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,58 @@
+from functools import lru_cache
+from typing import NamedTuple
+
+from brownie import web3
+
+"""
+Address interning for the rewards hot loops. Each address is normalized once,
+later lookups of any of its forms come from the cache instead of hashing
+it again for the checksum
+"""
+
+# Distinct address spellings kept, well above the users seen in a cycle
+ADDRESS_CACHE_SIZE = 1 << 20
+
+
+class AddressTable:
+    """
+    Interns addresses to small integer ids, shared by every RewardsList in the process
+    """
+
+    __slots__ = ("ids", "addresses")
+
+    def __init__(self):
+        self.ids = {}
+        self.addresses = []
+
+    def id(self, address):
+        addressId = self.ids.get(address)
+        if addressId is None:
+            addressId = len(self.addresses)
+            self.ids[address] = addressId
+            self.addresses.append(address)
+        return addressId
+
+
+addressTable = AddressTable()
+
+
+class Address(NamedTuple):
+    lower: str
+    checksum: str
+    # Id of the checksum address in addressTable
+    id: int
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def intern_address(address):
+    lower = address.lower()
+    checksum = web3.toChecksumAddress(lower)
+    return Address(lower, checksum, addressTable.id(checksum))
+
+
+def checksum_address(address):
+    return intern_address(address).checksum
+
+
+def lower_address(address):
+    return intern_address(address).lower
@@ -1,6 +1,11 @@
+import io
+import os
+import tempfile
+
 import boto3
 from brownie import *
 from rich.console import Console
+from assistant.rewards.tree_io import write_tree
 from config.env_config import env_config
 import json
 
@@ -55,6 +60,61 @@ def download_tree(fileName):
     return s3_clientdata
 
 
+def download_tree_file(fileName):
+    """
+    Download a rewards file into the local tree cache and return its path.
+    Files are named by content hash, so a cached copy is never stale
+    """
+    path = os.path.join(env_config.tree_cache_dir, fileName)
+    if os.path.exists(path):
+        console.print("Using cached rewards file: " + path)
+        return path
+
+    s3 = boto3.client(
+        "s3",
+        aws_access_key_id=env_config.aws_access_key_id,
+        aws_secret_access_key=env_config.aws_secret_access_key,
+    )
+
+    upload_bucket = "badger-json"
+    upload_file_key = "rewards/" + fileName
+
+    console.print("Downloading file from s3: " + upload_file_key)
+
+    os.makedirs(env_config.tree_cache_dir, exist_ok=True)
+    partial = path + ".partial"
+    s3.download_file(upload_bucket, upload_file_key, partial)
+    os.replace(partial, path)
+    return path
+
+
+def download_input_bundle(fileName):
+    """
+    Download the input bundle of a cycle into the local bundle cache and
+    return its path
+    """
+    path = os.path.join(env_config.input_bundle_dir, fileName)
+    if os.path.exists(path):
+        console.print("Using cached input bundle: " + path)
+        return path
+
+    upload_file_key = "inputs/" + fileName
+    console.print("Downloading file from s3: " + upload_file_key)
+
+    os.makedirs(env_config.input_bundle_dir, exist_ok=True)
+    partial = path + ".partial"
+    s3.download_file(rewards_bucket, upload_file_key, partial)
+    os.replace(partial, path)
+    return path
+
+
+def upload_input_bundle(path, fileName):
+    key = "inputs/" + fileName
+    console.print("Uploading file to s3://" + rewards_bucket + "/" + key)
+    s3.upload_file(path, rewards_bucket, key)
+    console.print("✅ Uploaded file to s3://" + rewards_bucket + "/" + key)
+
+
 def download_past_trees(number):
     trees = []
     key = "badger-tree.json"
@@ -96,16 +156,21 @@ def upload(fileName, data, bucket="badger-json", publish=True):
             }  # badger-api production
         )
 
-    for target in upload_targets:
-        console.print(
-            "Uploading file to s3://" + target["bucket"] + "/" + target["key"]
-        )
-        s3.put_object(
-            Body=str(json.dumps(data)), Bucket=target["bucket"], Key=target["key"]
-        )
-        console.print(
-            "✅ Uploaded file to s3://" + target["bucket"] + "/" + target["key"]
-        )
+    # Stream the tree to a temporary file rather than one string in memory
+    with tempfile.TemporaryFile() as body:
+        text = io.TextIOWrapper(body, encoding="utf-8")
+        write_tree(data, text)
+        text.flush()
+        text.detach()
+        for target in upload_targets:
+            console.print(
+                "Uploading file to s3://" + target["bucket"] + "/" + target["key"]
+            )
+            body.seek(0)
+            s3.put_object(Body=body, Bucket=target["bucket"], Key=target["key"])
+            console.print(
+                "✅ Uploaded file to s3://" + target["bucket"] + "/" + target["key"]
+            )
 
 
 def upload_boosts(test):
@@ -125,3 +190,10 @@ def upload_analytics(cycle, data):
     console.log("Uploading file to s3://" + analytics_bucket + "/" + jsonKey)
     s3.put_object(Body=str(json.dumps(data)), Bucket=analytics_bucket, Key=jsonKey)
     console.log("✅ Uploaded file to s3://" + analytics_bucket + "/" + jsonKey)
+
+
+def upload_profile(cycle, data):
+    jsonKey = "logs/{}-profile.json".format(cycle)
+    console.log("Uploading file to s3://" + analytics_bucket + "/" + jsonKey)
+    s3.put_object(Body=str(json.dumps(data)), Bucket=analytics_bucket, Key=jsonKey)
+    console.log("✅ Uploaded file to s3://" + analytics_bucket + "/" + jsonKey)
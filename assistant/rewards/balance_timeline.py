@@ -0,0 +1,181 @@
+from brownie import web3
+from rich.console import Console
+
+from assistant.rewards.block_cache import block_timestamp, block_timestamps
+from assistant.rewards.rewards_utils import (
+    build_sett_balances,
+    calc_balances_from_geyser_events,
+    calculate_sett_balances,
+    prefetch_sett_balances,
+)
+from assistant.subgraph.client import fetch_geyser_events, fetch_sett_balances
+from helpers.constants import NO_GEYSERS
+
+console = Console()
+
+TRANSFER_TOPIC = web3.keccak(text="Transfer(address,address,uint256)").hex()
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+# Block range per eth_getLogs request, larger ranges get rejected by providers
+LOG_BLOCK_RANGE = 10000
+# Page size of the sett balances subgraph query
+SUBGRAPH_PAGE = 1000
+
+
+def topic_to_address(topic):
+    return "0x" + topic.hex()[-40:]
+
+
+def fetch_transfers(token, fromBlock, toBlock):
+    """
+    Transfer logs of an ERC20 token between two blocks (inclusive),
+    as (blockNumber, from, to, value) in chain order
+    """
+    logs = []
+    for start in range(fromBlock, toBlock + 1, LOG_BLOCK_RANGE):
+        logs.extend(
+            web3.eth.getLogs(
+                {
+                    "address": token,
+                    "fromBlock": start,
+                    "toBlock": min(start + LOG_BLOCK_RANGE - 1, toBlock),
+                    "topics": [TRANSFER_TOPIC],
+                }
+            )
+        )
+    logs = sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"]))
+    return [
+        (
+            log["blockNumber"],
+            topic_to_address(log["topics"][1]),
+            topic_to_address(log["topics"][2]),
+            int(log["data"], 16),
+        )
+        for log in logs
+    ]
+
+
+def subgraph_order(balances):
+    """
+    Order balances like fetch_sett_balances does: pages of ids in ascending order,
+    with later pages first
+    """
+    accounts = sorted(balances)
+    pages = [
+        accounts[i : i + SUBGRAPH_PAGE] for i in range(0, len(accounts), SUBGRAPH_PAGE)
+    ]
+    return {account: balances[account] for page in reversed(pages) for account in page}
+
+
+class SettBalanceTimeline:
+    """
+    Sett balances at any of a set of blocks, replayed from a single balance snapshot
+    at the first block and the sett token transfers after it.
+    The replay is checked against a snapshot at the last block, on a mismatch
+    every block falls back to calculate_sett_balances
+    """
+
+    def __init__(self, badger, name, blocks):
+        self.badger = badger
+        self.name = name
+        self.blocks = sorted(set(blocks))
+        self.settId = badger.getSett(name).address.lower()
+        self.verified = None
+        self.transfers = []
+        self.geyserEvents = None
+        self.cursor = (None, {}, 0)
+        self.cache = {}
+
+    def load(self):
+        firstBlock, lastBlock = self.blocks[0], self.blocks[-1]
+        self.snapshot = fetch_sett_balances(self.name, self.settId, firstBlock)
+        if lastBlock > firstBlock:
+            self.transfers = fetch_transfers(
+                web3.toChecksumAddress(self.settId), firstBlock + 1, lastBlock
+            )
+        if self.name not in NO_GEYSERS:
+            geyserAddr = self.badger.getGeyser(self.name).address.lower()
+            self.geyserEvents = fetch_geyser_events(geyserAddr, lastBlock)
+
+        expected = fetch_sett_balances(self.name, self.settId, lastBlock)
+        self.verified = list(self.replay(lastBlock).items()) == list(expected.items())
+        if not self.verified:
+            console.log(
+                "[bold red]{} balance replay does not match subgraph at {}, "
+                "fetching every block[/bold red]".format(self.name, lastBlock)
+            )
+
+    def replay(self, block):
+        """
+        Raw sett balances at a block, replaying transfers forward from the
+        closest earlier replay
+        """
+        cursorBlock, balances, position = self.cursor
+        if cursorBlock is None or block < cursorBlock:
+            balances, position = dict(self.snapshot), 0
+        else:
+            balances = dict(balances)
+
+        while position < len(self.transfers) and self.transfers[position][0] <= block:
+            _, sender, recipient, value = self.transfers[position]
+            if sender != ZERO_ADDRESS:
+                balances[sender] = balances.get(sender, 0) - value
+            if recipient != ZERO_ADDRESS:
+                balances[recipient] = balances.get(recipient, 0) + value
+            position += 1
+
+        self.cursor = (block, balances, position)
+        return subgraph_order(balances)
+
+    def geyser_balances(self, block):
+        if self.geyserEvents is None:
+            return {}
+        timestamp = block_timestamp(block)
+
+        def before(events):
+            return [e for e in events if int(e["timestamp"]) <= timestamp]
+
+        return calc_balances_from_geyser_events(
+            {
+                "stakes": before(self.geyserEvents["stakes"]),
+                "unstakes": before(self.geyserEvents["unstakes"]),
+            }
+        )
+
+    def balances_at(self, block):
+        if self.verified is None:
+            self.load()
+        if not self.verified:
+            return calculate_sett_balances(self.badger, self.name, block)
+        if block not in self.cache:
+            console.log("Replaying {} sett balances at {}".format(self.name, block))
+            self.cache[block] = build_sett_balances(
+                self.badger,
+                self.name,
+                self.replay(block),
+                self.geyser_balances(block),
+            )
+        return self.cache[block]
+
+
+def sett_balance_timelines(badger, requests):
+    """
+    A SettBalanceTimeline per sett for a list of (sett name, block) lookups,
+    with the snapshots they start from and verify against prefetched
+    """
+    blocks = {}
+    for name, block in requests:
+        blocks.setdefault(name, []).append(block)
+    # Geyser balances are replayed up to each block's timestamp
+    block_timestamps([block for _, block in requests])
+    prefetch_sett_balances(
+        badger,
+        [
+            (name, block)
+            for name, settBlocks in blocks.items()
+            for block in (min(settBlocks), max(settBlocks))
+        ],
+    )
+    return {
+        name: SettBalanceTimeline(badger, name, settBlocks)
+        for name, settBlocks in blocks.items()
+    }
@@ -3,100 +3,76 @@ import json
 from rich.console import Console
 from assistant.rewards.aws_utils import upload_boosts
 from assistant.subgraph.client import fetch_wallet_balances
-from helpers.constants import BADGER, DIGG, SETT_BOOST_RATIOS, MAX_BOOST
-from collections import OrderedDict
-from assistant.rewards.rewards_utils import combine_balances, calculate_sett_balances
+from helpers.constants import BADGER, DIGG, SETT_BOOST_RATIOS
+import numpy as np
+from assistant.rewards.rewards_utils import (
+    calculate_sett_balances,
+    prefetch_sett_balances,
+)
 from assistant.badger_api.prices import (
     fetch_token_prices,
     fetch_ppfs,
 )
 
-from assistant.rewards.classes.UserBalance import UserBalance, UserBalances
+from assistant.rewards.boost_calc import (
+    balance_column,
+    calc_boosts,
+    snapshot_balances,
+    usd_balances,
+)
+from assistant.rewards.addresses import AddressTable
+from assistant.rewards.classes.UserBalance import BalanceAccumulator
 
-prices = fetch_token_prices()
 console = Console()
 
 boostInfo = {}
 
 
-def convert_balances_to_usd(sett, name, userBalances):
+def convert_balances_to_usd(sett, name, userBalances, prices):
     tokenAddress = sett.address
     price = prices[tokenAddress]
     decimals = interface.IERC20(tokenAddress).decimals()
     price_ratio = SETT_BOOST_RATIOS[name]
 
-    for user in userBalances:
-        user.balance = (price_ratio * price * user.balance) / (pow(10, decimals))
-
-    return userBalances
-
-
-def calc_cumulative(l):
-    result = [None] * len(l)
-    cumulative = 0
-    for idx, val in enumerate(l):
-        cumulative += val
-        result[idx] = cumulative
-    return result
-
-
-def calc_boost(percentages):
-    boosts = []
-    for p in percentages:
-        boost = MAX_BOOST - (p * (MAX_BOOST - 1))
-        if boost < 1:
-            boost = 1
-        boosts.append(boost)
-    return boosts
-
-
-def calc_stake_ratio(address, diggSetts, badgerSetts, nonNativeSetts):
-    diggBalance = getattr(diggSetts[address], "balance", 0)
-    badgerBalance = getattr(badgerSetts[address], "balance", 0)
-    nonNativeBalance = getattr(nonNativeSetts[address], "balance", 0)
-    if nonNativeBalance == 0:
-        stakeRatio = 0
-    else:
-        stakeRatio = (diggBalance + badgerBalance) / nonNativeBalance
-    return stakeRatio
-
-
-def calc_union_addresses(diggSetts, badgerSetts, nonNativeSetts):
-    return set.union(
-        *[
-            {user.address for user in diggSetts},
-            {user.address for user in badgerSetts},
-            {user.address for user in nonNativeSetts},
-        ]
-    )
-
-
-def filter_dust(balances):
-    return UserBalances(list(filter(lambda user: user.balance > 1, balances)))
+    balances = usd_balances(userBalances.balances, price_ratio, price, decimals)
+    return userBalances.with_balances(balances.tolist())
 
 
 def badger_boost(badger, currentBlock):
     console.log("Calculating boost ...")
+    # Fetched per cycle, so a recorded cycle replays with the same prices
+    prices = fetch_token_prices()
     allSetts = badger.sett_system.vaults
-    diggSetts = UserBalances()
-    badgerSetts = UserBalances()
-    nonNativeSetts = UserBalances()
-    boostInfo = {}
+    diggSetts = BalanceAccumulator()
+    badgerSetts = BalanceAccumulator()
+    nonNativeSetts = BalanceAccumulator()
+    diggUsd, badgerUsd, nonNativeUsd = {}, {}, {}
+    prefetch_sett_balances(
+        badger,
+        [
+            (name, currentBlock)
+            for name in allSetts
+            if name not in ["experimental.digg"]
+        ],
+    )
     for name, sett in allSetts.items():
         if name in ["experimental.digg"]:
             continue
         balances = calculate_sett_balances(badger, name, currentBlock)
-        balances = convert_balances_to_usd(sett, name, balances)
+        balances = convert_balances_to_usd(sett, name, balances, prices)
         if name in ["native.uniDiggWbtc", "native.sushiDiggWbtc", "native.digg"]:
-            diggSetts = combine_balances([diggSetts, balances])
+            diggSetts.add_many(balances)
+            diggUsd[name] = balances
         elif name in [
             "native.badger",
             "native.uniBadgerWbtc",
             "native.sushiBadgerWbtc",
         ]:
-            badgerSetts = combine_balances([badgerSetts, balances])
+            badgerSetts.add_many(balances)
+            badgerUsd[name] = balances
         else:
-            nonNativeSetts = combine_balances([nonNativeSetts, balances])
+            nonNativeSetts.add_many(balances)
+            nonNativeUsd[name] = balances
 
     sharesPerFragment = badger.digg.logic.UFragments._sharesPerFragment()
     badger_wallet_balances, digg_wallet_balances, _ = fetch_wallet_balances(
@@ -108,84 +84,42 @@ def badger_boost(badger, currentBlock):
             len(badger_wallet_balances), len(digg_wallet_balances)
         )
     )
-    badger_wallet_balances = UserBalances(
-        [
-            UserBalance(addr, bal * prices[BADGER], BADGER)
-            for addr, bal in badger_wallet_balances.items()
-        ]
+    for addr, bal in badger_wallet_balances.items():
+        badgerSetts.add(addr, bal * prices[BADGER], BADGER)
+    for addr, bal in digg_wallet_balances.items():
+        diggSetts.add(addr, bal * prices[DIGG], DIGG)
+    diggSetts, badgerSetts, nonNativeSetts = (
+        diggSetts.freeze(),
+        badgerSetts.freeze(),
+        nonNativeSetts.freeze(),
     )
-
-    digg_wallet_balances = UserBalances(
-        [
-            UserBalance(addr, bal * prices[DIGG], DIGG)
-            for addr, bal in digg_wallet_balances.items()
-        ]
-    )
-    badgerSetts = filter_dust(combine_balances([badgerSetts, badger_wallet_balances]))
-    diggSetts = filter_dust(combine_balances([diggSetts, digg_wallet_balances]))
-    allAddresses = calc_union_addresses(diggSetts, badgerSetts, nonNativeSetts)
-
+    settBalances = {}
+    for usd, groupBalances in (
+        (diggUsd, diggSetts),
+        (badgerUsd, badgerSetts),
+        (nonNativeUsd, nonNativeSetts),
+    ):
+        settBalances.update(snapshot_balances(usd, groupBalances))
+
+    table = AddressTable()
+    diggColumn, badgerColumn, nonNativeColumn = [
+        balance_column(table, balances)
+        for balances in (diggSetts, badgerSetts, nonNativeSetts)
+    ]
     console.log("Non native Setts before filter {}".format(len(nonNativeSetts)))
-    nonNativeSetts = filter_dust(nonNativeSetts)
-    console.log("Non native Setts after filter {}".format(len(nonNativeSetts)))
-
-    console.log("Filtered balances < $1")
-
     console.log(
-        "{} addresses collected for boost calculation".format(len(allAddresses))
-    )
-    stakeRatiosList = [
-        calc_stake_ratio(addr, diggSetts, badgerSetts, nonNativeSetts)
-        for addr in allAddresses
-    ]
-    stakeRatios = dict(zip(allAddresses, stakeRatiosList))
-    stakeRatios = OrderedDict(
-        sorted(stakeRatios.items(), key=lambda t: t[1], reverse=True)
-    )
-
-    for addr in allAddresses:
-        boostInfo[addr.lower()] = {
-            "nativeBalance": 0,
-            "nonNativeBalance": 0,
-            "stakeRatio": 0,
-        }
-
-    for user in badgerSetts:
-        boostInfo[user.address.lower()]["nativeBalance"] += user.balance
-
-    for user in diggSetts:
-        boostInfo[user.address.lower()]["nativeBalance"] += user.balance
-
-    for user in nonNativeSetts:
-        boostInfo[user.address.lower()]["nonNativeBalance"] += user.balance
-
-    for addr, ratio in stakeRatios.items():
-        boostInfo[addr.lower()]["stakeRatio"] = ratio
-
-    sortedNonNative = UserBalances(
-        sorted(
-            nonNativeSetts.userBalances.values(),
-            key=lambda u: stakeRatios[u.address],
-            reverse=True,
+        "Non native Setts after filter {}".format(
+            np.count_nonzero(nonNativeColumn[1] > 1)
         )
     )
-    nonNativeTotal = sortedNonNative.total_balance()
-    percentageNonNative = {}
-    for user in sortedNonNative:
-        percentage = user.balance / nonNativeTotal
-        percentageNonNative[user.address] = percentage
 
-    cumulativePercentages = dict(
-        zip(percentageNonNative.keys(), calc_cumulative(percentageNonNative.values()))
-    )
-    badgerBoost = dict(
-        zip(cumulativePercentages.keys(), calc_boost(cumulativePercentages.values()))
+    console.log("Filtered balances < $1")
+
+    badgerBoost, boostInfo = calc_boosts(
+        table.addresses, diggColumn, badgerColumn, nonNativeColumn
     )
-    for addr, boost in badgerBoost.items():
-        # Users with no stake ratio have a boost of 1
-        if stakeRatios[addr] == 0:
-            badgerBoost[addr] = 1
+    console.log("{} addresses collected for boost calculation".format(len(boostInfo)))
 
     console.log(len(badgerBoost))
 
-    return badgerBoost, boostInfo
+    return badgerBoost, boostInfo, settBalances
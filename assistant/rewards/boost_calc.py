@@ -0,0 +1,137 @@
+import numpy as np
+
+from assistant.rewards.addresses import lower_address
+
+from helpers.constants import MAX_BOOST
+
+"""
+Badger boost over aligned arrays. Every balance column is indexed by the
+ids of one AddressTable, so joins between the native and non native
+balances of a user are array lookups rather than dict lookups
+"""
+
+
+def usd_balances(balances, priceRatio, price, decimals):
+    """
+    Boost weighted USD value of a column of token balances
+    """
+    return priceRatio * price * np.array(balances, dtype=float) / pow(10, decimals)
+
+
+def balance_column(table, userBalances):
+    """
+    (ids, balances) arrays of a UserBalances, in its insertion order
+    """
+    ids = np.array(
+        [table.id(address) for address in userBalances.addresses], dtype=np.int64
+    )
+    balances = np.array(userBalances.balances, dtype=float)
+    return ids, balances
+
+
+def filter_dust(column):
+    ids, balances = column
+    keep = balances > 1
+    return ids[keep], balances[keep]
+
+
+def dense(column, size):
+    """
+    Spread a column over the whole table, with a mask of the users it holds
+    """
+    ids, balances = column
+    values = np.zeros(size)
+    values[ids] = balances
+    present = np.zeros(size, dtype=bool)
+    present[ids] = True
+    return values, present
+
+
+def calc_boosts(addresses, digg, badger, nonNative):
+    """
+    badgerBoost and boostInfo from the digg, badger and non native USD balance
+    columns of the addresses in a table. Non native users are ranked by stake
+    ratio and boosted from MAX_BOOST down to 1 along their cumulative share
+    of the non native balance
+    """
+    size = len(addresses)
+    # Non native dust is left out of the boost, but still gets a boostInfo entry
+    _, hasAnyNonNative = dense(nonNative, size)
+    digg, badger, nonNative = (
+        filter_dust(digg),
+        filter_dust(badger),
+        filter_dust(nonNative),
+    )
+    diggBalance, hasDigg = dense(digg, size)
+    badgerBalance, hasBadger = dense(badger, size)
+    nonNativeBalance, hasNonNative = dense(nonNative, size)
+
+    stakeRatio = np.zeros(size)
+    np.divide(
+        diggBalance + badgerBalance,
+        nonNativeBalance,
+        out=stakeRatio,
+        where=hasNonNative,
+    )
+    hasNative = hasBadger | hasDigg
+    # Absent balances stay int 0, as they were before they were arrays
+    nativeBalance = (badgerBalance + diggBalance).astype(object)
+    nativeBalance[~hasNative] = 0
+    nonNativeValues = nonNativeBalance.astype(object)
+    nonNativeValues[~hasNonNative] = 0
+    ratioValues = stakeRatio.astype(object)
+    ratioValues[~hasNonNative] = 0
+
+    users = np.flatnonzero(hasNative | hasAnyNonNative)
+    boostInfo = {
+        lower_address(addresses[userId]): {
+            "nativeBalance": native,
+            "nonNativeBalance": nonNativeValue,
+            "stakeRatio": ratio,
+        }
+        for userId, native, nonNativeValue, ratio in zip(
+            users.tolist(),
+            nativeBalance[users].tolist(),
+            nonNativeValues[users].tolist(),
+            ratioValues[users].tolist(),
+        )
+    }
+
+    ids, balances = nonNative
+    if len(ids) == 0:
+        return {}, boostInfo
+    # Stable, so users with equal ratios keep their balance order
+    order = np.argsort(-stakeRatio[ids], kind="stable")
+    ids, balances = ids[order], balances[order]
+    # Sequential sum, as the percentages depend on the summation order
+    nonNativeTotal = sum(balances.tolist())
+    cumulativePercentages = np.cumsum(balances / nonNativeTotal)
+    boostCurve = MAX_BOOST - cumulativePercentages * (MAX_BOOST - 1)
+    boosts = boostCurve.astype(object)
+    boosts[boostCurve < 1] = 1
+    # Users with no stake ratio have a boost of 1
+    boosts[stakeRatio[ids] == 0] = 1
+
+    users = [addresses[userId] for userId in ids.tolist()]
+    return dict(zip(users, boosts.tolist())), boostInfo
+
+
+def snapshot_balances(settBalances, groupBalances):
+    """
+    The USD balances the snapshots of a group of setts distribute on. A user's
+    total across the group (wallet included) is credited in the first sett of
+    the group they hold, their balances in the other setts stay their own
+    """
+    totals = dict(zip(groupBalances.addresses, groupBalances.balances))
+    seen = set()
+    balancesByName = {}
+    for name, userBalances in settBalances.items():
+        balances = []
+        for address, balance in zip(userBalances.addresses, userBalances.balances):
+            if address in seen:
+                balances.append(balance)
+            else:
+                seen.add(address)
+                balances.append(totals[address])
+        balancesByName[name] = userBalances.with_balances(balances)
+    return balancesByName
@@ -1,54 +1,65 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from assistant.rewards.addresses import checksum_address
+from assistant.rewards.block_cache import block_timestamps
 from assistant.rewards.rewards_utils import calculate_sett_balances
 from assistant.rewards.classes.RewardsList import RewardsList
 from assistant.rewards.classes.RewardsLog import rewardsLog
 from assistant.rewards.classes.Schedule import Schedule
+from assistant.rewards.classes.UserBalance import UserBalances
+from assistant.rewards.distribution import distribute
 from helpers.time_utils import to_days, to_hours, to_utc_date
 from helpers.constants import NON_NATIVE_SETTS, NATIVE_DIGG_SETTS, DIGG, BADGER_TREE
+from config.rewards_config import rewards_config
 from brownie import *
 from rich.console import Console
 
 console = Console()
 
 
+@dataclass
+class SnapshotInputs:
+    """
+    Everything a sett snapshot reads from the chain and subgraph
+    """
+
+    name: str
+    userBalances: UserBalances
+    # (token, amount) to distribute, in schedule order
+    tokenDistributions: List[Tuple[str, int]]
+
+
 def calc_snapshot(
     badger, name, startBlock, endBlock, nextCycle, boosts, unclaimedBalances
 ):
+    inputs = snapshot_inputs(badger, name, startBlock, endBlock)
+    rewards, apyBoosts = compute_snapshot(inputs, nextCycle, boosts, unclaimedBalances)
+    rewards.badgerTree = badger.badgerTree
+    return rewards, apyBoosts
+
+
+def snapshot_inputs(badger, name, startBlock, endBlock, userBalances=None):
+    """
+    userBalances are the balances to distribute on, badger_boost's USD
+    balances of the sett, or its balances at endBlock when not given
+    """
     digg = interface.IDigg(DIGG)
 
     console.log("==== Processing rewards for {} at {} ====".format(name, endBlock))
 
-    rewards = RewardsList(nextCycle, badger.badgerTree)
-
     sett = badger.getSett(name)
-    startTime = web3.eth.getBlock(startBlock)["timestamp"]
-
-    endTime = web3.eth.getBlock(endBlock)["timestamp"]
+    startTime, endTime = block_timestamps([startBlock, endBlock])
 
-    userBalances = calculate_sett_balances(badger, name, endBlock)
-
-    apyBoosts = {}
-    if name in NON_NATIVE_SETTS:
-        console.log(
-            "{} users out of {} boosted in {}".format(
-                len(userBalances), len(boosts), name
-            )
-        )
-        preBoost = {}
-        for user in userBalances:
-            preBoost[user.address] = userBalances.percentage_of_total(user.address)
-
-        for user in userBalances:
-            boostAmount = boosts.get(user.address, 1)
-            user.boost_balance(boostAmount)
-
-        for user in userBalances:
-            postBoost = userBalances.percentage_of_total(user.address)
-            apyBoosts[user.address] = postBoost / preBoost[user.address]
+    if userBalances is None:
+        userBalances = calculate_sett_balances(badger, name, endBlock)
 
     schedulesByToken = parse_schedules(
         badger.rewardsLogger.getAllUnlockSchedulesFor(sett)
     )
 
+    tokenDistributions = []
     for token, schedules in schedulesByToken.items():
         endDist = get_distributed_for_token_at(token, endTime, schedules, name)
         startDist = get_distributed_for_token_at(token, startTime, schedules, name)
@@ -76,53 +87,70 @@ def calc_snapshot(
             badgerAmount = tokenDistribution / 1e18
             console.log("{} Badger token distributed".format(badgerAmount))
             rewardsLog.add_total_token_dist(name, token, tokenDistribution / 1e18)
+        tokenDistributions.append((str(token), tokenDistribution))
+
+    return SnapshotInputs(name, userBalances, tokenDistributions)
+
+
+def compute_snapshot(inputs, nextCycle, boosts, unclaimedBalances):
+    """
+    Boost and distribute a sett's rewards from its prefetched inputs,
+    without touching the chain
+    """
+    name = inputs.name
+    userBalances = inputs.userBalances
+    rewards = RewardsList(nextCycle, None)
 
+    apyBoosts = {}
+    if name in NON_NATIVE_SETTS:
+        console.log(
+            "{} users out of {} boosted in {}".format(
+                len(userBalances), len(boosts), name
+            )
+        )
+        preBoost = {}
+        for address in userBalances.addresses:
+            preBoost[address] = userBalances.percentage_of_total(address)
+
+        userBalances = userBalances.boost_balances(boosts)
+
+        for address in userBalances.addresses:
+            postBoost = userBalances.percentage_of_total(address)
+            apyBoosts[address] = postBoost / preBoost[address]
+
+    addresses = [checksum_address(address) for address in userBalances.addresses]
+    balances = list(userBalances.balances)
+
+    for token, tokenDistribution in inputs.tokenDistributions:
         if tokenDistribution > 0:
-            sumBalances = sum([b.balance for b in userBalances])
-            rewardsUnit = tokenDistribution / sumBalances
-            totalRewards = 0
-            console.log("Processing rewards for {} addresses".format(len(userBalances)))
-            for user in userBalances:
-                addr = web3.toChecksumAddress(user.address)
-
-                token = web3.toChecksumAddress(token)
-                rewardAmount = user.balance * rewardsUnit
-                totalRewards += rewardAmount
-                ## If giving rewards to tree , distribute them to users with unlcaimed bals
-                if addr == BADGER_TREE:
-                    if name == "native.cvx":
-                        console.log(
-                            "Distributing {} rewards to {} unclaimed bCvx holders".format(
-                                rewardAmount / 1e18, len(unclaimedBalances["bCvx"])
-                            )
-                        )
-                        totalbCvxBal = sum(unclaimedBalances["bCvx"].values())
-                        cvxRewardsUnit = rewardAmount / totalbCvxBal
-                        for addr, bal in unclaimedBalances["bCvx"].items():
-                            rewards.increase_user_rewards(
-                                web3.toChecksumAddress(addr),
-                                token,
-                                int(cvxRewardsUnit * bal),
-                            )
-                    if name == "native.cvxCrv":
-
-                        console.log(
-                            "Distributing {} rewards to {} unclaimed bCvxCrv holders".format(
-                                rewardAmount / 1e18, len(unclaimedBalances["bCvxCrv"])
-                            )
-                        )
-
-                        totalbCvxCrvBal = sum(unclaimedBalances["bCvxCrv"].values())
-                        bCvxCrvRewardsUnit = rewardAmount / totalbCvxCrvBal
-                        for addr, bal in unclaimedBalances["bCvxCrv"].items():
-                            rewards.increase_user_rewards(
-                                web3.toChecksumAddress(addr),
-                                token,
-                                int(bCvxCrvRewardsUnit * bal),
-                            )
-                else:
-                    rewards.increase_user_rewards(addr, token, int(rewardAmount))
+            token = checksum_address(token)
+            amounts = distribute(
+                balances, tokenDistribution, rewards_config.exactDistribution
+            )
+            console.log("Processing rewards for {} addresses".format(len(addresses)))
+            ## If giving rewards to tree , distribute them to users with unlcaimed bals
+            treeIndex = (
+                addresses.index(BADGER_TREE) if BADGER_TREE in addresses else None
+            )
+            if treeIndex is None:
+                rewards.increase_users_rewards(addresses, token, amounts)
+            else:
+                rewards.increase_users_rewards(
+                    addresses[:treeIndex], token, amounts[:treeIndex]
+                )
+                treeReward = amounts[treeIndex]
+                if not rewards_config.exactDistribution:
+                    treeReward = balances[treeIndex] * (
+                        tokenDistribution / sum(balances)
+                    )
+                distribute_unclaimed(
+                    rewards, name, token, treeReward, unclaimedBalances
+                )
+                rewards.increase_users_rewards(
+                    addresses[treeIndex + 1 :], token, amounts[treeIndex + 1 :]
+                )
 
+            totalRewards = sum(amounts)
             console.log(
                 "Token Distribution: {}\nRewards Released: {}".format(
                     tokenDistribution / 1e18, totalRewards / 1e18
@@ -133,6 +161,57 @@ def calc_snapshot(
     return rewards, apyBoosts
 
 
+_workerArgs = None
+
+
+def _init_snapshot_worker(nextCycle, boosts, unclaimedBalances):
+    global _workerArgs
+    _workerArgs = (nextCycle, boosts, unclaimedBalances)
+
+
+def _snapshot_worker(inputs):
+    return compute_snapshot(inputs, *_workerArgs)
+
+
+def compute_snapshots(inputs, nextCycle, boosts, unclaimedBalances, workers=1):
+    """
+    compute_snapshot for a list of sett inputs, fanned out over a process pool
+    when workers > 1. Results come back in the order of the inputs
+    """
+    if workers <= 1 or len(inputs) <= 1:
+        return [
+            compute_snapshot(settInputs, nextCycle, boosts, unclaimedBalances)
+            for settInputs in inputs
+        ]
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(inputs)),
+        initializer=_init_snapshot_worker,
+        initargs=(nextCycle, boosts, unclaimedBalances),
+    ) as pool:
+        return list(pool.map(_snapshot_worker, inputs))
+
+
+def distribute_unclaimed(rewards, name, token, rewardAmount, unclaimedBalances):
+    """
+    Pass the tree's share of a distribution on to holders of unclaimed
+    rewards in the vault
+    """
+    unclaimedKeys = {"native.cvx": "bCvx", "native.cvxCrv": "bCvxCrv"}
+    if name not in unclaimedKeys:
+        return
+    unclaimed = unclaimedBalances[unclaimedKeys[name]]
+    console.log(
+        "Distributing {} rewards to {} unclaimed {} holders".format(
+            rewardAmount / 1e18, len(unclaimed), unclaimedKeys[name]
+        )
+    )
+    unclaimedRewardsUnit = rewardAmount / sum(unclaimed.values())
+    for addr, bal in unclaimed.items():
+        rewards.increase_user_rewards(
+            checksum_address(addr), token, int(unclaimedRewardsUnit * bal)
+        )
+
+
 def get_distributed_for_token_at(token, endTime, schedules, name):
     totalToDistribute = 0
     for index, schedule in enumerate(schedules):
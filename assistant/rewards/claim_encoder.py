@@ -0,0 +1,90 @@
+from eth_utils import decode_hex
+
+"""
+Encoder for the BadgerTree claim leaf, abi.encode of
+(uint index, address user, uint cycle, address[] tokens, uint[] cumulativeAmounts)
+
+The layout never changes, so claims are written straight into a preallocated buffer
+instead of going through the generic eth_abi encoder.
+"""
+
+WORD = 32
+HEAD_WORDS = 5
+ADDRESS_SIZE = 20
+
+
+def claim_size(tokenCount):
+    # head, two array lengths and one word per token and per amount
+    return WORD * (HEAD_WORDS + 2 + 2 * tokenCount)
+
+
+def _uint(value):
+    return value.to_bytes(WORD, "big")
+
+
+def _address(address):
+    raw = decode_hex(address) if isinstance(address, str) else bytes(address)
+    if len(raw) != ADDRESS_SIZE:
+        raise ValueError("Invalid address {}".format(address))
+    return raw
+
+
+def write_claim(buffer, offset, index, user, cycle, tokens, amounts):
+    """
+    Write one encoded claim into a zeroed buffer at offset, returning the offset past it
+    """
+    count = len(tokens)
+    if len(amounts) != count:
+        raise ValueError(
+            "Claim for {} has {} tokens and {} amounts".format(
+                user, count, len(amounts)
+            )
+        )
+    tokensOffset = HEAD_WORDS * WORD
+    amountsOffset = tokensOffset + WORD * (count + 1)
+
+    buffer[offset : offset + WORD] = _uint(index)
+    buffer[offset + 2 * WORD - ADDRESS_SIZE : offset + 2 * WORD] = _address(user)
+    buffer[offset + 2 * WORD : offset + 3 * WORD] = _uint(cycle)
+    buffer[offset + 3 * WORD : offset + 4 * WORD] = _uint(tokensOffset)
+    buffer[offset + 4 * WORD : offset + 5 * WORD] = _uint(amountsOffset)
+
+    position = offset + tokensOffset
+    buffer[position : position + WORD] = _uint(count)
+    for token in tokens:
+        position += WORD
+        buffer[position + WORD - ADDRESS_SIZE : position + WORD] = _address(token)
+
+    position = offset + amountsOffset
+    buffer[position : position + WORD] = _uint(count)
+    for amount in amounts:
+        position += WORD
+        buffer[position : position + WORD] = _uint(amount)
+
+    return offset + claim_size(count)
+
+
+def encode_claim(index, user, cycle, tokens, amounts):
+    buffer = bytearray(claim_size(len(tokens)))
+    write_claim(buffer, 0, index, user, cycle, tokens, amounts)
+    return "0x" + buffer.hex()
+
+
+def encode_claims(claims):
+    """
+    Encode a list of (index, user, cycle, tokens, amounts) tuples in one pass over a
+    single buffer, returning the hex encoded leaves in the same order
+    """
+    claims = list(claims)
+    bounds = [0]
+    for claim in claims:
+        bounds.append(bounds[-1] + claim_size(len(claim[3])))
+
+    buffer = bytearray(bounds[-1])
+    for claim, offset in zip(claims, bounds):
+        write_claim(buffer, offset, *claim)
+
+    encoded = buffer.hex()
+    return [
+        "0x" + encoded[2 * start : 2 * end] for start, end in zip(bounds, bounds[1:])
+    ]
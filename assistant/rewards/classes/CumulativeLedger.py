@@ -0,0 +1,164 @@
+import os
+import pickle
+
+from assistant.rewards.addresses import addressTable
+from assistant.rewards.file_cache import prune_files
+from config.env_config import env_config
+
+"""
+Cumulative claims of a published tree in compact form: interned ids and int
+amounts, without the proofs and decimal strings of the tree file. Saved
+next to each tree built, so the next cycle loads it instead of reading the
+previous tree claim by claim
+"""
+
+LEDGER_VERSION = 1
+
+
+class CumulativeLedger:
+    """
+    userId -> {tokenId: amount} claims in tree order, with the int total of
+    each token in the order tokens first appear
+    """
+
+    __slots__ = ("claims", "totals")
+
+    def __init__(self, claims, totals):
+        self.claims = claims
+        self.totals = totals
+
+    @classmethod
+    def from_claims(cls, pastClaims):
+        """
+        Ledger of a tree's claims (user -> tokens, cumulativeAmounts), with
+        negative amounts read as 0 like increase_user_rewards does
+        """
+        table = addressTable
+        tokenIds = {}
+        totals = {}
+        claims = {}
+        for user, userData in pastClaims.items():
+            tokens = userData["tokens"]
+            if len(tokens) == 0:
+                continue
+            userClaims = claims.setdefault(table.id(user), {})
+            for token, amount in zip(tokens, userData["cumulativeAmounts"]):
+                tokenId = tokenIds.get(token)
+                if tokenId is None:
+                    tokenId = tokenIds[token] = table.id(token)
+                    totals[tokenId] = 0
+                amount = max(int(amount), 0)
+                userClaims[tokenId] = userClaims.get(tokenId, 0) + amount
+                totals[tokenId] += amount
+        return cls(claims, totals)
+
+    @classmethod
+    def from_rewards(cls, rewards):
+        """
+        Ledger of the tree built from a RewardsList, amounts as the tree has them
+        """
+        totals = {}
+        claims = {}
+        for userId, userClaims in rewards._claims.items():
+            if not userClaims:
+                continue
+            amounts = {
+                tokenId: max(int(amount), 0) for tokenId, amount in userClaims.items()
+            }
+            for tokenId, amount in amounts.items():
+                totals[tokenId] = totals.get(tokenId, 0) + amount
+            claims[userId] = amounts
+        return cls(claims, totals)
+
+    def token_amounts(self, tokenId):
+        """
+        Amounts of a token in claim order
+        """
+        return [
+            userClaims[tokenId]
+            for userClaims in self.claims.values()
+            if tokenId in userClaims
+        ]
+
+    def holders(self, tokens):
+        """
+        Users with a claim of any of these tokens, in claim order
+        """
+        tokenIds = {addressTable.ids.get(token) for token in tokens}
+        addresses = addressTable.addresses
+        return [
+            addresses[userId]
+            for userId, userClaims in self.claims.items()
+            if not tokenIds.isdisjoint(userClaims)
+        ]
+
+    def save(self, path):
+        """
+        Ids are only valid in this process, the addresses they stand for are saved
+        """
+        addresses = addressTable.addresses
+        state = {
+            "version": LEDGER_VERSION,
+            "users": [addresses[userId] for userId in self.claims],
+            "claims": [
+                (
+                    [addresses[tokenId] for tokenId in userClaims],
+                    list(userClaims.values()),
+                )
+                for userClaims in self.claims.values()
+            ],
+            "totals": [
+                (addresses[tokenId], total) for tokenId, total in self.totals.items()
+            ],
+        }
+        partial = path + ".partial"
+        with open(partial, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != LEDGER_VERSION:
+            raise ValueError(
+                "{} is not a version {} ledger".format(path, LEDGER_VERSION)
+            )
+        table = addressTable
+        tokenIds = {token: table.id(token) for token, _ in state["totals"]}
+        claims = {
+            table.id(user): dict(zip(map(tokenIds.get, tokens), amounts))
+            for user, (tokens, amounts) in zip(state["users"], state["claims"])
+        }
+        totals = {tokenIds[token]: total for token, total in state["totals"]}
+        return cls(claims, totals)
+
+
+def ledger_path(merkleRoot):
+    return os.path.join(
+        env_config.ledger_dir, "ledger-{}.pickle".format(merkleRoot.lower())
+    )
+
+
+def load_ledger(tree):
+    """
+    Ledger of a tree, from the file saved when it was built or else from
+    its claims
+    """
+    path = ledger_path(tree["merkleRoot"])
+    if os.path.exists(path):
+        return CumulativeLedger.load(path)
+    return CumulativeLedger.from_claims(tree["claims"])
+
+
+def save_ledger(rewards, merkleRoot):
+    """
+    Save the ledger of the tree with this root for the next cycle. Only the
+    env_config.ledger_keep most recent ledgers are kept
+    """
+    os.makedirs(env_config.ledger_dir, exist_ok=True)
+    CumulativeLedger.from_rewards(rewards).save(ledger_path(merkleRoot))
+    prune_files(
+        os.path.join(env_config.ledger_dir, "ledger-*.pickle"),
+        env_config.ledger_keep,
+    )
@@ -0,0 +1,288 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from assistant.rewards.file_cache import prune_files
+from config.env_config import env_config
+
+"""
+Every external input of a rewards cycle (subgraph results, JSON-RPC reads,
+block headers, prices and unclaimed balances) captured into a content
+addressed bundle. The manifest maps each input, named by its kind and
+arguments, to the sha256 of its JSON value, the values are stored once per
+hash. Replaying a bundle answers the same requests from it without any
+network access
+"""
+
+BUNDLE_VERSION = 1
+# JSON-RPC methods that only read chain state, anything else (transactions,
+# signing) always goes to the node
+READ_METHODS = {
+    "eth_blockNumber",
+    "eth_call",
+    "eth_chainId",
+    "eth_getBalance",
+    "eth_getBlockByHash",
+    "eth_getBlockByNumber",
+    "eth_getCode",
+    "eth_getLogs",
+    "eth_getStorageAt",
+    "net_version",
+}
+
+
+class MissingInputError(Exception):
+    """
+    A replayed cycle asked for an input its bundle doesn't have
+    """
+
+    def __init__(self, kind, args):
+        super().__init__(
+            "No recorded {} input for {}".format(kind, canonical_json(args))
+        )
+        self.kind = kind
+        self.inputArgs = args
+
+
+def _default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    return str(value)
+
+
+def canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=_default)
+
+
+def sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def input_key(kind, args):
+    return "{}:{}".format(kind, sha256(canonical_json(args)))
+
+
+def bundle_hash(meta, manifest):
+    return sha256(canonical_json({"meta": meta, "manifest": manifest}))
+
+
+class InputBundle:
+    """
+    Records the inputs of a cycle, or replays them from a bundle. Outside of
+    record() and replay() inputs are fetched live and nothing is kept
+    """
+
+    def __init__(self):
+        self.recording = False
+        self.replaying = False
+        self.meta = {}
+        self.manifest = {}
+        self.blobs = {}
+        self.used = set()
+        self._lock = threading.Lock()
+        self._web3 = None
+        self._caches = []
+
+    def register_cache(self, clear):
+        """
+        Register the clear function of a cache that outlives a cycle. Inputs
+        served from it never reach the bundle, so every registered cache is
+        emptied when a cycle starts and ends recording or replaying
+        """
+        self._caches.append(clear)
+
+    def clear_caches(self):
+        for clear in self._caches:
+            clear()
+
+    def _reset(self, meta=None, manifest=None, blobs=None):
+        self.meta = meta or {}
+        self.manifest = manifest or {}
+        self.blobs = blobs or {}
+        self.used = set()
+        self.clear_caches()
+
+    @contextmanager
+    def record(self, meta=None):
+        self._reset(meta)
+        self.recording = True
+        try:
+            yield self
+        finally:
+            self.recording = False
+            self.clear_caches()
+
+    @contextmanager
+    def replay(self, bundle):
+        """
+        Answer inputs from a bundle returned by load_bundle
+        """
+        self._reset(bundle["meta"], bundle["manifest"], bundle["blobs"])
+        self.replaying = True
+        try:
+            yield self
+        finally:
+            self.replaying = False
+            self.clear_caches()
+
+    def replayed(self, kind, *args):
+        key = input_key(kind, args)
+        entry = self.manifest.get(key)
+        if entry is None:
+            raise MissingInputError(kind, args)
+        with self._lock:
+            self.used.add(key)
+        return json.loads(self.blobs[entry["blob"]])
+
+    def captured(self, value, kind, *args):
+        """
+        Record a fetched input. The value comes back as it will be replayed,
+        and an input asked for again keeps its first value for the whole cycle
+        """
+        if not self.recording:
+            return value
+        key = input_key(kind, args)
+        text = json.dumps(value)
+        with self._lock:
+            entry = self.manifest.get(key)
+            if entry is None:
+                blob = sha256(text)
+                self.blobs.setdefault(blob, text)
+                entry = {
+                    "kind": kind,
+                    "args": json.loads(canonical_json(args)),
+                    "blob": blob,
+                }
+                self.manifest[key] = entry
+            text = self.blobs[entry["blob"]]
+        return json.loads(text)
+
+    def fetch(self, fetcher, kind, *args):
+        """
+        fetcher() recorded under (kind, args), or its value from the bundle
+        when replaying
+        """
+        if self.replaying:
+            return self.replayed(kind, *args)
+        return self.captured(fetcher(), kind, *args)
+
+    def unused(self):
+        """
+        Recorded inputs a replay never asked for, a sign it took another path
+        """
+        return [self.manifest[key] for key in self.manifest if key not in self.used]
+
+    def capture_rpc(self, web3):
+        """
+        Record and replay JSON-RPC reads. Injected as the innermost middleware,
+        so it sees the requests and responses as they go over the wire
+        """
+        if self._web3 is web3:
+            return
+        bundle = self
+
+        def rpc_bundle(make_request, w3):
+            def middleware(method, params):
+                if method not in READ_METHODS:
+                    return make_request(method, params)
+                if bundle.replaying:
+                    response = bundle.replayed("rpc", method, params)
+                else:
+                    response = make_request(method, params)
+                    if not bundle.recording:
+                        return response
+                    response = bundle.captured(
+                        {k: response[k] for k in ("result", "error") if k in response},
+                        "rpc",
+                        method,
+                        params,
+                    )
+                return {"jsonrpc": "2.0", **response}
+
+            return middleware
+
+        web3.middleware_onion.inject(
+            rpc_bundle, "input_bundle_{}".format(id(self)), layer=0
+        )
+        self._web3 = web3
+
+    def save(self, directory, keep=None):
+        """
+        Write the bundle as gzipped JSON named by its hash, returns the path.
+        Only the keep most recent bundles of the directory are kept
+        """
+        digest = bundle_hash(self.meta, self.manifest)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, bundle_filename(digest))
+        partial = path + ".partial"
+        with gzip.open(partial, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write('{{"version": {}, "hash": "{}", '.format(BUNDLE_VERSION, digest))
+            f.write('"meta": {}, '.format(json.dumps(self.meta)))
+            f.write('"manifest": {}, "blobs": {{'.format(json.dumps(self.manifest)))
+            for i, (blob, text) in enumerate(self.blobs.items()):
+                f.write('{}"{}": {}'.format(", " if i else "", blob, text))
+            f.write("}}")
+        os.replace(partial, path)
+        prune_bundles(directory, env_config.input_bundle_keep if keep is None else keep)
+        return path
+
+
+def bundle_filename(digest):
+    return "inputs-{}.json.gz".format(digest)
+
+
+def prune_bundles(directory, keep):
+    """
+    Remove all but the keep most recently written bundles of a directory
+    """
+    prune_files(os.path.join(directory, "inputs-*.json.gz"), keep)
+
+
+def load_bundle(path):
+    """
+    Read a bundle, checking its hash and the hash of every value
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != BUNDLE_VERSION:
+        raise ValueError("{} is not a version {} bundle".format(path, BUNDLE_VERSION))
+    if bundle_hash(data["meta"], data["manifest"]) != data["hash"]:
+        raise ValueError("{} doesn't match its hash".format(path))
+    blobs = {}
+    for blob, value in data["blobs"].items():
+        text = json.dumps(value)
+        if sha256(text) != blob:
+            raise ValueError("Value {} of {} doesn't match its hash".format(blob, path))
+        blobs[blob] = text
+    missing = [e for e in data["manifest"].values() if e["blob"] not in blobs]
+    if missing:
+        raise ValueError("{} is missing {} values".format(path, len(missing)))
+    return {
+        "hash": data["hash"],
+        "meta": data["meta"],
+        "manifest": data["manifest"],
+        "blobs": blobs,
+    }
+
+
+def diff_bundles(before, after):
+    """
+    Inputs whose values differ between two bundles of the same cycle, and
+    the inputs only one of them has
+    """
+    a, b = before["manifest"], after["manifest"]
+    return {
+        "changed": [
+            {"kind": a[key]["kind"], "args": a[key]["args"], "key": key}
+            for key in a
+            if key in b and a[key]["blob"] != b[key]["blob"]
+        ],
+        "onlyBefore": [a[key] for key in a if key not in b],
+        "onlyAfter": [b[key] for key in b if key not in a],
+    }
+
+
+inputBundle = InputBundle()
@@ -1,10 +1,21 @@
 from assistant.rewards.classes.RewardsList import RewardsList
-from itertools import zip_longest
+from assistant.rewards.merkle_hash import (
+    INCREMENTAL_MAX_DIRTY,
+    build_layers,
+    dirty_positions,
+    hash_layer,
+    hash_leaf,
+    hash_leaves,
+    hash_pair,
+    load_layers,
+    save_layers,
+    split_nodes,
+    update_layers,
+)
+import os
+from collections.abc import Mapping
 
-from brownie import *
 from eth_utils import encode_hex
-from eth_utils.hexadecimal import encode_hex
-from helpers.constants import *
 from rich.console import Console
 
 console = Console()
@@ -15,9 +26,12 @@ Convert merkle_tree
 
 
 class MerkleTree:
-    def __init__(self, elements):
-        self.elements = sorted(set(web3.keccak(hexstr=el) for el in elements))
-        self.layers = MerkleTree.get_layers(self.elements)
+    def __init__(self, elements, workers=None, previousLayers=None):
+        self.leaves = hash_leaves(elements)
+        self.elements = sorted(set(self.leaves))
+        self.layers = MerkleTree.get_layers(self.elements, workers, previousLayers)
+        self.elementIndex = {el: idx for idx, el in enumerate(self.elements)}
+        self._encodedLayers = None
 
         # console.log(self.elements, self.layers)
 
@@ -26,29 +40,57 @@ class MerkleTree:
         return self.layers[-1][0]
 
     def get_proof(self, el):
-        el = web3.keccak(hexstr=el)
-        idx = self.elements.index(el)
+        return self.get_proof_at(self.elementIndex[hash_leaf(el)])
+
+    @property
+    def encodedLayers(self):
+        """
+        Hex of every node below the root, encoded once for all the proofs read
+        """
+        if self._encodedLayers is None:
+            self._encodedLayers = [
+                [encode_hex(node) for node in layer] for layer in self.layers[:-1]
+            ]
+        return self._encodedLayers
+
+    def get_proof_at(self, idx):
+        """
+        Proof of the element at idx in self.elements
+        """
         proof = []
-        for layer in self.layers:
-            pair_idx = idx + 1 if idx % 2 == 0 else idx - 1
+        for layer in self.encodedLayers:
+            pair_idx = idx ^ 1
             if pair_idx < len(layer):
-                proof.append(encode_hex(layer[pair_idx]))
-            idx //= 2
+                proof.append(layer[pair_idx])
+            idx >>= 1
         return proof
 
+    def save(self, path):
+        save_layers(path, [b"".join(layer) for layer in self.layers])
+
     @staticmethod
-    def get_layers(elements):
-        layers = [elements]
-        while len(layers[-1]) > 1:
-            layers.append(MerkleTree.get_next_layer(layers[-1]))
-        return layers
+    def get_layers(elements, workers=None, previousLayers=None):
+        """
+        Build the layers from scratch, or only recompute the paths of changed
+        leaves when the layers of a previous tree with the same leaf count are given
+        """
+        leaves = b"".join(elements)
+        dirty = None
+        if previousLayers is not None:
+            dirty = dirty_positions(previousLayers[0], leaves)
+
+        if dirty is None or len(dirty) > INCREMENTAL_MAX_DIRTY * len(elements):
+            layers = build_layers(leaves, workers)
+        else:
+            console.log(
+                "Updating {} of {} merkle leaves".format(len(dirty), len(elements))
+            )
+            layers = update_layers(previousLayers, leaves, dirty)
+        return [split_nodes(layer) for layer in layers]
 
     @staticmethod
     def get_next_layer(elements):
-        return [
-            MerkleTree.combined_hash(a, b)
-            for a, b in zip_longest(elements[::2], elements[1::2])
-        ]
+        return split_nodes(hash_layer(b"".join(elements)))
 
     @staticmethod
     def combined_hash(a, b):
@@ -56,11 +98,64 @@ class MerkleTree:
             return b
         if b is None:
             return a
-        return web3.keccak(b"".join(sorted([a, b])))
+        return hash_pair(a, b)
+
+
+class TreeClaims(Mapping):
+    """
+    Claims of a merkle tree, each claim and its proof built when it is read.
+    Streaming them to a file never holds every proof in memory at once, and
+    every pass reads proofs from the same encoded layers
+    """
+
+    def __init__(self, tree, entries):
+        self.tree = tree
+        self.entries = entries
+        self.userIndex = {
+            entry["node"]["user"]: idx for idx, entry in enumerate(entries)
+        }
+        self.positions = [tree.elementIndex[leaf] for leaf in tree.leaves]
+
+    def claim(self, entry):
+        node = entry["node"]
+        return {
+            "index": hex(node["index"]),
+            "user": node["user"],
+            "cycle": hex(node["cycle"]),
+            "tokens": node["tokens"],
+            "cumulativeAmounts": node["cumulativeAmounts"],
+            "proof": self.tree.get_proof_at(self.positions[node["index"]]),
+            "node": entry["encoded"],
+        }
+
+    def __getitem__(self, user):
+        return self.claim(self.entries[self.userIndex[user]])
+
+    def __contains__(self, user):
+        return user in self.userIndex
 
+    def __iter__(self):
+        return iter(self.userIndex)
 
-def rewards_to_merkle_tree(rewards: RewardsList, startBlock, endBlock, geyserRewards):
-    (nodes, encodedNodes, entries) = rewards.to_merkle_format()
+    def __len__(self):
+        return len(self.entries)
+
+
+def rewards_to_merkle_tree(
+    rewards: RewardsList,
+    startBlock,
+    endBlock,
+    geyserRewards,
+    layersFile=None,
+    lazyClaims=False,
+):
+    """
+    When a layersFile is given, the layers persisted there by a previous run are
+    reused for unchanged leaves and the new layers are written back to it.
+    With lazyClaims the claims are a TreeClaims mapping, to be written with
+    tree_io instead of json
+    """
+    nodes, encodedNodes, entries = rewards.to_merkle_format()
 
     # For each user, encode their data into a node
 
@@ -74,33 +169,26 @@ def rewards_to_merkle_tree(rewards: RewardsList, startBlock, endBlock, geyserRew
             for index, user, amount in elements
         },
     """
-    tree = MerkleTree(encodedNodes)
+    previousLayers = None
+    if layersFile and os.path.exists(layersFile):
+        previousLayers = load_layers(layersFile)
+    tree = MerkleTree(encodedNodes, previousLayers=previousLayers)
+    if layersFile:
+        tree.save(layersFile)
+    claims = TreeClaims(tree, entries)
     distribution = {
         "merkleRoot": encode_hex(tree.root),
         "cycle": nodes[0]["cycle"],
         "startBlock": str(startBlock),
         "endBlock": str(endBlock),
-        "tokenTotals": rewards.totals.toDict(),
-        "claims": {},
+        "tokenTotals": dict(rewards.totals),
+        "claims": claims if lazyClaims else dict(claims.items()),
         "metadata": {},
     }
 
-    for entry in entries:
-        node = entry["node"]
-        encoded = entry["encoded"]
-        # console.log(node)
-        distribution["claims"][node["user"]] = {
-            "index": hex(node["index"]),
-            "user": node["user"],
-            "cycle": hex(node["cycle"]),
-            "tokens": node["tokens"],
-            "cumulativeAmounts": node["cumulativeAmounts"],
-            "proof": tree.get_proof(encodedNodes[node["index"]]),
-            "node": encoded,
-        }
     if len(geyserRewards) > 0:
         for user, data in geyserRewards.metadata.items():
-            distribution["metadata"][user] = data.toDict()
+            distribution["metadata"][user] = dict(data)
 
     print(f"merkle root: {encode_hex(tree.root)}")
 
@@ -1,38 +1,133 @@
 from decimal import Decimal
 from brownie import *
-from dotmap import DotMap
 from rich.console import Console
 from eth_utils.hexadecimal import encode_hex
 from helpers.constants import BADGER
-from eth_abi import encode_abi
+from assistant.rewards.addresses import addressTable
+from assistant.rewards.claim_encoder import encode_claim, encode_claims
 from tabulate import tabulate
 
 console = Console()
 
 
+class Claims:
+    """
+    Read-only view of the interned claims as user -> {token: amount}.
+    Like the DotMap it replaces, reading a missing user gives an empty dict
+    """
+
+    __slots__ = ("_claims",)
+
+    def __init__(self, claims):
+        self._claims = claims
+
+    def _user_claims(self, userClaims):
+        addresses = addressTable.addresses
+        return {addresses[tokenId]: amount for tokenId, amount in userClaims.items()}
+
+    def __getitem__(self, user):
+        userClaims = self._claims.get(addressTable.ids.get(user))
+        if userClaims is None:
+            return {}
+        return self._user_claims(userClaims)
+
+    def get(self, user, default=None):
+        if user not in self:
+            return default
+        return self[user]
+
+    def __contains__(self, user):
+        return addressTable.ids.get(user) in self._claims
+
+    def __iter__(self):
+        return self.keys()
+
+    def __len__(self):
+        return len(self._claims)
+
+    def keys(self):
+        addresses = addressTable.addresses
+        return (addresses[userId] for userId in self._claims)
+
+    def values(self):
+        return (self._user_claims(userClaims) for userClaims in self._claims.values())
+
+    def items(self):
+        addresses = addressTable.addresses
+        return (
+            (addresses[userId], self._user_claims(userClaims))
+            for userId, userClaims in self._claims.items()
+        )
+
+    def toDict(self):
+        return dict(self.items())
+
+
 class RewardsList:
+    """
+    Claims are stored as userId -> {tokenId: amount} over interned addresses,
+    users and each user's tokens keep their insertion order
+    """
+
+    __slots__ = (
+        "_claims",
+        "tokens",
+        "totals",
+        "cycle",
+        "badgerTree",
+        "metadata",
+        "sources",
+        "sourceMetadata",
+        "badgerSum",
+    )
+
     def __init__(self, cycle, badgerTree) -> None:
-        self.claims = DotMap()
-        self.tokens = DotMap()
-        self.totals = DotMap()
+        self._claims = {}
+        self.tokens = {}
+        self.totals = {}
         self.cycle = cycle
         self.badgerTree = badgerTree
-        self.metadata = DotMap()
-        self.sources = DotMap()
-        self.sourceMetadata = DotMap()
+        self.metadata = {}
+        self.sources = {}
+        self.sourceMetadata = {}
+
+    @property
+    def claims(self):
+        return Claims(self._claims)
 
     def increase_user_rewards_source(self, source, user, token, toAdd):
-        if not self.sources[source][user][token]:
-            self.sources[source][user][token] = 0
-        self.sources[source][user][token] += toAdd
+        userSources = self.sources.setdefault(source, {}).setdefault(user, {})
+        userSources[token] = userSources.get(token, 0) + toAdd
 
     def __repr__(self):
-        return self.claims()
+        return "RewardsList(cycle={}, users={})".format(self.cycle, len(self._claims))
+
+    def __getstate__(self):
+        # Ids are only valid in this process, pickle addresses
+        state = {
+            slot: getattr(self, slot)
+            for slot in self.__slots__
+            if slot != "_claims" and hasattr(self, slot)
+        }
+        state["claims"] = list(self.claims.items())
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        claims = state.pop("claims")
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self._claims = {
+            addressTable.id(user): {
+                addressTable.id(token): amount for token, amount in userClaims.items()
+            }
+            for user, userClaims in claims
+        }
 
     def track_user_metadata_source(self, source, user, metadata):
-        if not self.sourceMetadata[source][user][metadata]:
-            self.sourceMetadata[source][user][metadata] = DotMap()
-        self.sourceMetadata[source][user][metadata] = metadata
+        self.sourceMetadata.setdefault(source, {}).setdefault(user, {})[
+            metadata
+        ] = metadata
 
     def increase_user_rewards(self, user, token, toAdd):
         if toAdd < 0:
@@ -42,32 +137,126 @@ class RewardsList:
         """
         If user has rewards, increase. If not, set their rewards to this initial value
         """
-        if user in self.claims and token in self.claims[user]:
-            self.claims[user][token] += toAdd
+        userId = addressTable.id(user)
+        tokenId = addressTable.id(token)
+        userClaims = self._claims.get(userId)
+        if userClaims is None:
+            self._claims[userId] = {tokenId: toAdd}
+        elif tokenId in userClaims:
+            userClaims[tokenId] += toAdd
         else:
-            self.claims[user][token] = toAdd
+            userClaims[tokenId] = toAdd
 
         if token in self.totals:
             self.totals[token] += toAdd
         else:
             self.totals[token] = toAdd
 
+    def increase_users_rewards(self, users, token, amounts):
+        """
+        increase_user_rewards for a column of users and their amounts of one token
+        """
+        claims = self._claims
+        tokenId = addressTable.id(token)
+        total = self.totals.get(token, 0)
+        for user, toAdd in zip(users, amounts):
+            if toAdd < 0:
+                print("NEGATIVE to ADD")
+                toAdd = 0
+            userId = addressTable.id(user)
+            userClaims = claims.get(userId)
+            if userClaims is None:
+                claims[userId] = {tokenId: toAdd}
+            elif tokenId in userClaims:
+                userClaims[tokenId] += toAdd
+            else:
+                userClaims[tokenId] = toAdd
+            total += toAdd
+        if len(users) > 0:
+            self.totals[token] = total
+
+    def merge(self, other):
+        """
+        Add every claim of other to this list, in the same order (and with the same
+        float totals) as calling increase_user_rewards claim by claim.
+        other may also be any object with a user -> {token: amount} claims mapping
+        """
+        if not isinstance(other, RewardsList):
+            for user, claims in other.claims.items():
+                for token, claim in claims.items():
+                    self.increase_user_rewards(user, token, claim)
+            return self
+
+        claims = self._claims
+        addresses = addressTable.addresses
+        totals = {}
+        for userId, otherClaims in other._claims.items():
+            userClaims = claims.get(userId)
+            if userClaims is None:
+                userClaims = claims[userId] = {}
+            for tokenId, toAdd in otherClaims.items():
+                if tokenId in userClaims:
+                    userClaims[tokenId] += toAdd
+                else:
+                    userClaims[tokenId] = toAdd
+                if tokenId in totals:
+                    totals[tokenId] += toAdd
+                else:
+                    totals[tokenId] = self.totals.get(addresses[tokenId], 0) + toAdd
+        for tokenId, total in totals.items():
+            self.totals[addresses[tokenId]] = total
+        return self
+
+    def add_ledger(self, ledger):
+        """
+        Add the cumulative claims of a previous tree, with the same result as
+        increase_user_rewards per claim. Only the users of this list are
+        combined claim by claim, the others take their ledger claims as they
+        are (shared with the ledger, not copied)
+        """
+        claims = self._claims
+        pastClaims = ledger.claims
+        newClaims = list(claims.items())
+        # Appends the users only in the ledger in its order, and keeps the
+        # place of the others
+        claims.update(pastClaims)
+        for userId, userClaims in newClaims:
+            past = pastClaims.get(userId)
+            if past is not None:
+                for tokenId, toAdd in past.items():
+                    if tokenId in userClaims:
+                        userClaims[tokenId] += toAdd
+                    else:
+                        userClaims[tokenId] = toAdd
+            claims[userId] = userClaims
+
+        addresses = addressTable.addresses
+        for tokenId, pastTotal in ledger.totals.items():
+            token = addresses[tokenId]
+            total = self.totals.get(token, 0)
+            if isinstance(total, int):
+                total += pastTotal
+            else:
+                # Float totals depend on the summation order
+                total = sum(ledger.token_amounts(tokenId), total)
+            self.totals[token] = total
+        return self
+
     def track_user_metadata(self, user, metadata):
         if user in self.metadata:
-            self.metadata[user].shareSeconds += metadata[user]["shareSeconds"]
-            self.metadata[user].shareSecondsInRange += metadata[user][
+            self.metadata[user]["shareSeconds"] += metadata[user]["shareSeconds"]
+            self.metadata[user]["shareSecondsInRange"] += metadata[user][
                 "shareSecondsInRange"
             ]
         else:
-            self.metadata[user] = DotMap()
-            self.metadata[user].shareSeconds = metadata[user]["shareSeconds"]
-            self.metadata[user].shareSecondsInRange = metadata[user][
-                "shareSecondsInRange"
-            ]
+            self.metadata[user] = {
+                "shareSeconds": metadata[user]["shareSeconds"],
+                "shareSecondsInRange": metadata[user]["shareSecondsInRange"],
+            }
 
     def printState(self):
         # console.log("claims", self.claims.toDict())
-        # console.log("tokens", self.tokens.toDict())
+        # console.log("tokens", self.tokens)
         # console.log("cycle", self.cycle)
         table = []
         # console.log("User State", self.users.toDict(), self.totalShareSeconds)
@@ -75,12 +264,12 @@ class RewardsList:
             shareSeconds = 0
             shareSecondsInRange = 0
             if user in self.metadata:
-                shareSeconds = self.metadata[user].shareSeconds
-                shareSecondsInRange = self.metadata[user].shareSecondsInRange
+                shareSeconds = self.metadata[user]["shareSeconds"]
+                shareSecondsInRange = self.metadata[user]["shareSecondsInRange"]
             table.append(
                 [
                     user,
-                    data[BADGER],
+                    data.get(BADGER, 0),
                     shareSeconds,
                     shareSecondsInRange,
                 ]
@@ -93,23 +282,15 @@ class RewardsList:
         )
 
     def hasToken(self, token):
-        if self.tokens[token]:
+        if self.tokens.get(token):
             return self.tokens[token]
         else:
             return False
 
     def getTokenRewards(self, user, token):
-        if self.claims[user][token]:
-            return self.claims[user][token]
-        else:
-            return 0
+        return self.claims[user].get(token, 0)
 
-    def to_node_entry(self, user, userData, cycle, index):
-        """
-        Use abi.encode() to encode data into the hex format used as raw node information in the tree
-        This is the value that will be hashed to form the rest of the tree
-        """
-        user_str = str(user).lower()
+    def to_node(self, user, userData, cycle, index):
         nodeEntry = {
             "user": user,
             "tokens": [],
@@ -122,49 +303,21 @@ class RewardsList:
             nodeEntry["tokens"].append(tokenAddress)
             nodeEntry["cumulativeAmounts"].append(str(int(cumulativeAmount)))
             intAmounts.append(int(cumulativeAmount))
+        return (nodeEntry, intAmounts)
 
-        # console.print(
-        #     "Encoding Node entry...",
-        #     {
-        #         "index": int(nodeEntry["index"]),
-        #         "account": nodeEntry["user"],
-        #         "cycle": int(nodeEntry["cycle"]),
-        #         "tokens": nodeEntry["tokens"],
-        #         "cumulativeAmounts": nodeEntry["cumulativeAmounts"],
-        #         "(integer encoded)": intAmounts,
-        #     }
-        # )
-
-        encoded_local = encode_hex(
-            encode_abi(
-                ["uint", "address", "uint", "address[]", "uint[]"],
-                (
-                    int(nodeEntry["index"]),
-                    nodeEntry["user"],
-                    int(nodeEntry["cycle"]),
-                    nodeEntry["tokens"],
-                    intAmounts,
-                ),
-            )
+    def to_node_entry(self, user, userData, cycle, index):
+        """
+        Use abi.encode() to encode data into the hex format used as raw node information in the tree
+        This is the value that will be hashed to form the rest of the tree
+        """
+        (nodeEntry, intAmounts) = self.to_node(user, userData, cycle, index)
+        encoded_local = encode_claim(
+            int(nodeEntry["index"]),
+            nodeEntry["user"],
+            int(nodeEntry["cycle"]),
+            nodeEntry["tokens"],
+            intAmounts,
         )
-
-        # encoder = BadgerTree.at(web3.toChecksumAddress("0x660802Fc641b154aBA66a62137e71f331B6d787A"))
-
-        # console.print("nodeEntry", nodeEntry)
-        # console.print("encoded_local", encoded_local)
-
-        # ===== Verify encoding on-chain =====
-        # encoded_chain = encoder.encodeClaim(
-        #     nodeEntry["tokens"],
-        #     nodeEntry["cumulativeAmounts"],
-        #     nodeEntry["user"],
-        #     nodeEntry["index"],
-        #     nodeEntry["cycle"],
-        # )[0]
-
-        # console.print("encoded_onchain", encoded_chain)
-        # assert encoded_local == encoded_chain
-
         return (nodeEntry, encoded_local)
 
     def to_merkle_format(self):
@@ -173,19 +326,29 @@ class RewardsList:
         - Node entry = [cycle, user, index, token[], cumulativeAmount[]]
         """
         cycle = self.cycle
-        dict = self.claims.toDict()
+        addresses = addressTable.addresses
 
         nodeEntries = []
-        encodedEntries = []
-        entries = []
-
-        index = 0
-
-        for user, userData in self.claims.items():
-            (nodeEntry, encoded) = self.to_node_entry(user, userData, cycle, index)
+        claims = []
+        for index, (userId, userClaims) in enumerate(self._claims.items()):
+            user = addresses[userId]
+            tokens = [addresses[tokenId] for tokenId in userClaims]
+            intAmounts = [int(amount) for amount in userClaims.values()]
+            nodeEntry = {
+                "user": user,
+                "tokens": tokens,
+                "cumulativeAmounts": [str(amount) for amount in intAmounts],
+                "cycle": cycle,
+                "index": index,
+            }
             nodeEntries.append(nodeEntry)
-            encodedEntries.append(encoded)
-            entries.append({"node": nodeEntry, "encoded": encoded})
-            index += 1
+            claims.append((index, user, cycle, tokens, intAmounts))
+
+        # Encode every node in a single pass
+        encodedEntries = encode_claims(claims)
+        entries = [
+            {"node": nodeEntry, "encoded": encoded}
+            for nodeEntry, encoded in zip(nodeEntries, encodedEntries)
+        ]
 
         return (nodeEntries, encodedEntries, entries)
@@ -0,0 +1,137 @@
+import resource
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from rich.console import Console
+from tabulate import tabulate
+
+console = Console()
+
+
+def max_rss_mb():
+    """
+    Peak resident memory so far of this process and its finished workers
+    (ru_maxrss is in KB on Linux)
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+class RewardsProfile:
+    """
+    Nested stage timers for a rewards cycle. Each stage records its wall time,
+    the counters (RPC methods, subgraph pages, ...) incremented while it ran
+    and the peak RSS when it finished
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.stages = []
+        self._stack = []
+        self._web3 = None
+
+    def reset(self):
+        self.counts = Counter()
+        self.stages = []
+        self._stack = []
+
+    def count(self, name, amount=1):
+        self.counts[name] += amount
+
+    def count_rpc(self, web3):
+        """
+        Count every JSON-RPC request web3 makes, by method
+        """
+        if self._web3 is web3:
+            return
+        profile = self
+
+        def rpc_counter(make_request, w3):
+            def middleware(method, params):
+                profile.count("rpc.{}".format(method))
+                return make_request(method, params)
+
+            return middleware
+
+        web3.middleware_onion.add(rpc_counter, "rewards_profile_{}".format(id(self)))
+        self._web3 = web3
+
+    @contextmanager
+    def stage(self, name):
+        record = {"name": name, "stages": []}
+        parent = self._stack[-1]["stages"] if self._stack else self.stages
+        parent.append(record)
+        self._stack.append(record)
+        counts = Counter(self.counts)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            record["counts"] = dict(self.counts - counts)
+            record["maxRssMb"] = max_rss_mb()
+            self._stack.pop()
+
+    def profile(self, name):
+        """
+        Decorator running a function as a stage
+        """
+
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def report(self, cycle):
+        return {
+            "cycle": cycle,
+            "stages": self.stages,
+            "counts": dict(self.counts),
+            "maxRssMb": max_rss_mb(),
+        }
+
+    def rows(self, stages=None, depth=0):
+        rows = []
+        for stage in self.stages if stages is None else stages:
+            counts = stage.get("counts", {})
+            rpc = sum(v for k, v in counts.items() if k.startswith("rpc."))
+            rows.append(
+                [
+                    "  " * depth + stage["name"],
+                    "{:.2f}".format(stage.get("seconds", 0)),
+                    rpc,
+                    counts.get("rpc.eth_call", 0),
+                    counts.get("rpc.eth_getBlockByNumber", 0),
+                    counts.get("subgraph.pages", 0),
+                    "{:.0f}".format(stage.get("maxRssMb", 0)),
+                ]
+            )
+            rows += self.rows(stage["stages"], depth + 1)
+        return rows
+
+    def print_summary(self):
+        print(
+            tabulate(
+                self.rows(),
+                headers=[
+                    "stage",
+                    "seconds",
+                    "rpc",
+                    "eth_call",
+                    "getBlock",
+                    "subgraph pages",
+                    "max rss (MB)",
+                ],
+            )
+        )
+
+
+rewardsProfile = RewardsProfile()
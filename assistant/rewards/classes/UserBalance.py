@@ -1,8 +1,8 @@
-from dataclasses import dataclass, field
-from typing import List, Dict
+from dataclasses import dataclass, field, replace
+from typing import List
 
 
-@dataclass
+@dataclass(frozen=True)
 class UserBalance:
     address: str
     balance: int
@@ -10,46 +10,148 @@ class UserBalance:
     type: List[str] = field(default_factory=lambda: [])
 
     def boost_balance(self, boost):
-        self.balance = self.balance * boost
+        return replace(self, balance=self.balance * boost)
 
 
-@dataclass
 class UserBalances:
-    userBalances: Dict[str, UserBalance] = field(default_factory=lambda: [])
+    """
+    Immutable balances of a set of users, held as address, balance, token and
+    type columns in insertion order. Balances stay Python numbers, sett share
+    balances don't fit in fixed width arrays. Use a BalanceAccumulator to
+    combine several sets
+    """
 
-    def __post_init__(self):
-        if len(self.userBalances) > 0:
-            self.userBalances = {u.address: u for u in self.userBalances}
-        else:
-            self.userBalances = {}
+    __slots__ = ("addresses", "balances", "tokens", "types", "_index", "_total")
+
+    def __init__(self, userBalances=()):
+        users = {u.address: u for u in userBalances}
+        self._set_columns(
+            tuple(users.keys()),
+            tuple(u.balance for u in users.values()),
+            tuple(u.token for u in users.values()),
+            tuple(u.type for u in users.values()),
+        )
+
+    @classmethod
+    def from_columns(cls, addresses, balances, tokens, types):
+        userBalances = cls.__new__(cls)
+        userBalances._set_columns(
+            tuple(addresses), tuple(balances), tuple(tokens), tuple(types)
+        )
+        return userBalances
+
+    def _set_columns(self, addresses, balances, tokens, types):
+        self.addresses = addresses
+        self.balances = balances
+        self.tokens = tokens
+        self.types = types
+        self._index = {address: i for i, address in enumerate(addresses)}
+        self._total = None
+
+    def with_balances(self, balances):
+        """
+        The same users with new balances
+        """
+        return UserBalances.from_columns(
+            self.addresses, balances, self.tokens, self.types
+        )
+
+    def boost_balances(self, boosts):
+        return self.with_balances(
+            [
+                balance * boosts.get(address, 1)
+                for address, balance in zip(self.addresses, self.balances)
+            ]
+        )
 
     def total_balance(self):
-        return sum([u.balance for u in self.userBalances.values()])
+        if self._total is None:
+            self._total = sum(self.balances)
+        return self._total
 
     def percentage_of_total(self, addr):
-        return self[addr].balance / self.total_balance()
+        return self.balances[self._index[addr]] / self.total_balance()
 
     def __getitem__(self, key):
-        return self.userBalances.get(key, None)
-
-    def __setitem__(self, key, value):
-        self.userBalances[key] = value
+        i = self._index.get(key)
+        if i is None:
+            return None
+        return UserBalance(
+            self.addresses[i], self.balances[i], self.tokens[i], self.types[i]
+        )
 
     def __contains__(self, key):
-        return key in self.userBalances
+        return key in self._index
 
     def __add__(self, other):
-        newUserBalances = self.userBalances
-        for user in other.userBalances.values():
-            if user.address in newUserBalances:
-                newUserBalances[user.address].balance += user.balance
-            else:
-                newUserBalances[user.address] = user
-        return UserBalances(newUserBalances.values())
+        return BalanceAccumulator().add_many(self).add_many(other).freeze()
 
     def __iter__(self):
-        for user in self.userBalances.values():
-            yield user
+        for user in zip(self.addresses, self.balances, self.tokens, self.types):
+            yield UserBalance(*user)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __repr__(self):
+        return "UserBalances(users={})".format(len(self))
+
+    def __getstate__(self):
+        return (self.addresses, self.balances, self.tokens, self.types)
+
+    def __setstate__(self, state):
+        self._set_columns(*state)
+
+
+class BalanceAccumulator:
+    """
+    Sums the balances of users across several UserBalances, in place.
+    A user keeps the token and type of the first set they appear in
+    """
+
+    def __init__(self):
+        self._index = {}
+        self.addresses = []
+        self.balances = []
+        self.tokens = []
+        self.types = []
+
+    def add(self, address, balance, token, type=None):
+        i = self._index.get(address)
+        if i is None:
+            self._index[address] = len(self.addresses)
+            self.addresses.append(address)
+            self.balances.append(balance)
+            self.tokens.append(token)
+            self.types.append([] if type is None else type)
+        else:
+            self.balances[i] += balance
+        return self
+
+    def add_many(self, userBalances):
+        index = self._index
+        balances = self.balances
+        for address, balance, token, type in zip(
+            userBalances.addresses,
+            userBalances.balances,
+            userBalances.tokens,
+            userBalances.types,
+        ):
+            i = index.get(address)
+            if i is None:
+                index[address] = len(self.addresses)
+                self.addresses.append(address)
+                balances.append(balance)
+                self.tokens.append(token)
+                self.types.append(type)
+            else:
+                balances[i] += balance
+        return self
+
+    def freeze(self):
+        return UserBalances.from_columns(
+            self.addresses, self.balances, self.tokens, self.types
+        )
 
     def __len__(self):
-        return len(self.userBalances)
+        return len(self.addresses)
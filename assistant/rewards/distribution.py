@@ -0,0 +1,34 @@
+import numpy as np
+
+"""
+Pro rata token distribution over a column of user balances
+"""
+
+
+def distribute(balances, amount, exact=False):
+    """
+    Split amount across balances pro rata, returning the integer share of each.
+    The default float mode gives the same int(balance * amount / total) shares
+    as distributing user by user. Exact mode works on integers and hands out the
+    wei lost to rounding by largest remainder, so shares always sum to amount
+    """
+    if exact:
+        return distribute_exact(balances, amount)
+
+    # Sequential sum, as the float unit depends on the summation order
+    rewardsUnit = amount / sum(balances)
+    shares = np.array(balances, dtype=float) * rewardsUnit
+    return [int(share) for share in shares.tolist()]
+
+
+def distribute_exact(balances, amount):
+    weights = np.array([int(b) for b in balances], dtype=object)
+    total = weights.sum()
+    scaled = weights * amount
+    shares = scaled // total
+    remainders = scaled - shares * total
+    leftover = amount - shares.sum()
+    # Ties go to the user listed first
+    order = np.argsort(-remainders, kind="stable")
+    shares[order[:leftover]] += 1
+    return shares.tolist()
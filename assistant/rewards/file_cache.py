@@ -0,0 +1,15 @@
+import glob
+import os
+
+"""
+Files kept across cycles under the env_config cache directories
+"""
+
+
+def prune_files(pattern, keep):
+    """
+    Remove all but the keep most recently written files matching a glob pattern
+    """
+    paths = sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        os.remove(path)
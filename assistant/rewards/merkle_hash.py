@@ -0,0 +1,160 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from eth_hash.auto import keccak
+from eth_utils import decode_hex
+
+"""
+Batch keccak hashing for merkle tree construction.
+Layers are contiguous buffers of 32 byte nodes, so a whole layer is hashed per call
+"""
+
+NODE_SIZE = 32
+# Smaller layers are hashed in-process, a pool costs more than it saves
+PARALLEL_THRESHOLD = 2 ** 16
+# Above this share of dirty leaves a full rebuild is cheaper than patching paths
+INCREMENTAL_MAX_DIRTY = 0.25
+
+
+def hash_leaf(encoded):
+    return keccak(decode_hex(encoded))
+
+
+def hash_leaves(encodedNodes):
+    return [keccak(decode_hex(el)) for el in encodedNodes]
+
+
+def hash_pair(a, b):
+    if a <= b:
+        return keccak(a + b)
+    return keccak(b + a)
+
+
+def _hash_pairs(buffer):
+    """
+    Hash consecutive pairs of nodes in a buffer holding an even number of nodes
+    """
+    out = bytearray(len(buffer) // 2)
+    pairSize = NODE_SIZE * 2
+    for offset in range(0, len(buffer), pairSize):
+        a = buffer[offset : offset + NODE_SIZE]
+        b = buffer[offset + NODE_SIZE : offset + pairSize]
+        start = offset // 2
+        out[start : start + NODE_SIZE] = keccak(a + b) if a <= b else keccak(b + a)
+    return bytes(out)
+
+
+def _split(buffer, parts):
+    pairSize = NODE_SIZE * 2
+    pairs = len(buffer) // pairSize
+    chunk = max(1, -(-pairs // parts)) * pairSize
+    return [buffer[i : i + chunk] for i in range(0, pairs * pairSize, chunk)]
+
+
+def hash_layer(layer, pool=None, workers=1):
+    """
+    Compute the next layer of the tree from a buffer of sorted-pair hashed nodes.
+    An odd node at the end of the layer is carried up unchanged
+    """
+    nodes = len(layer) // NODE_SIZE
+    pairsEnd = (nodes - nodes % 2) * NODE_SIZE
+    if pool is not None and nodes >= PARALLEL_THRESHOLD:
+        hashed = b"".join(pool.map(_hash_pairs, _split(layer[:pairsEnd], workers)))
+    else:
+        hashed = _hash_pairs(layer[:pairsEnd])
+    return hashed + layer[pairsEnd:]
+
+
+def build_layers(leaves, workers=None):
+    """
+    Build every layer of the tree from a buffer of sorted leaves, root layer last.
+    Large layers are split across a process pool of `workers` processes
+    """
+    workers = workers or os.cpu_count() or 1
+    layers = [bytes(leaves)]
+    if len(leaves) // NODE_SIZE < PARALLEL_THRESHOLD or workers == 1:
+        while len(layers[-1]) > NODE_SIZE:
+            layers.append(hash_layer(layers[-1]))
+        return layers
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while len(layers[-1]) > NODE_SIZE:
+            layers.append(hash_layer(layers[-1], pool, workers))
+    return layers
+
+
+def split_nodes(layer):
+    return [layer[i : i + NODE_SIZE] for i in range(0, len(layer), NODE_SIZE)]
+
+
+def layer_sizes(leafCount):
+    sizes = [leafCount]
+    while sizes[-1] > 1:
+        sizes.append((sizes[-1] + 1) // 2)
+    return sizes
+
+
+def dirty_positions(previousLeaves, leaves):
+    """
+    Positions of the sorted leaves that differ from the previous tree,
+    None if the leaf count changed and positions can't be compared
+    """
+    if len(previousLeaves) != len(leaves):
+        return None
+    return [
+        offset // NODE_SIZE
+        for offset in range(0, len(leaves), NODE_SIZE)
+        if leaves[offset : offset + NODE_SIZE]
+        != previousLeaves[offset : offset + NODE_SIZE]
+    ]
+
+
+def update_layers(previousLayers, leaves, dirty):
+    """
+    Rebuild only the ancestors of the dirty leaf positions on top of the
+    previous layers. The previous tree must have the same number of leaves
+    """
+    layers = [bytearray(leaves)] + [bytearray(layer) for layer in previousLayers[1:]]
+    positions = sorted(set(dirty))
+    for depth in range(len(layers) - 1):
+        layer = layers[depth]
+        nodes = len(layer) // NODE_SIZE
+        parents = sorted({idx // 2 for idx in positions})
+        for parent in parents:
+            left = 2 * parent
+            start = left * NODE_SIZE
+            if left + 1 < nodes:
+                node = hash_pair(
+                    bytes(layer[start : start + NODE_SIZE]),
+                    bytes(layer[start + NODE_SIZE : start + 2 * NODE_SIZE]),
+                )
+            else:
+                node = layer[start : start + NODE_SIZE]
+            layers[depth + 1][parent * NODE_SIZE : (parent + 1) * NODE_SIZE] = node
+        positions = parents
+    return [bytes(layer) for layer in layers]
+
+
+def save_layers(path, layers):
+    with open(path, "wb") as f:
+        f.write((len(layers[0]) // NODE_SIZE).to_bytes(8, "big"))
+        for layer in layers:
+            f.write(layer)
+
+
+def load_layers(path):
+    """
+    Load layers persisted with save_layers, None if the file is not a valid tree
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    leafCount = int.from_bytes(data[:8], "big")
+    sizes = layer_sizes(leafCount)
+    if leafCount == 0 or 8 + sum(sizes) * NODE_SIZE != len(data):
+        return None
+    layers = []
+    offset = 8
+    for size in sizes:
+        layers.append(data[offset : offset + size * NODE_SIZE])
+        offset += size * NODE_SIZE
+    return layers
@@ -1,8 +1,10 @@
 from tqdm import tqdm
 from brownie import *
+from assistant.rewards.addresses import checksum_address
 from assistant.rewards.classes.RewardsList import RewardsList
 from assistant.rewards.classes.RewardsLog import rewardsLog
 from assistant.rewards.rewards_utils import calculate_sett_balances
+from assistant.rewards.balance_timeline import sett_balance_timelines
 from rich.console import Console
 
 console = Console()
@@ -27,16 +29,21 @@ def process_rewards(badger, events, name, nextCycle, token):
     totalFromEvents = sum([int(e["rewardAmount"]) for e in events]) / 1e18
     rewards = RewardsList(nextCycle, badger.badgerTree)
     total = 0
+    timelines = sett_balance_timelines(
+        badger, [(name, int(e["blockNumber"])) for e in events]
+    )
     for event in events:
-        userState = calc_meta_farm_rewards(badger, name, event["blockNumber"])
+        userState = calc_meta_farm_rewards(
+            badger, name, event["blockNumber"], timelines[name]
+        )
         totalBalance = sum([u.balance for u in userState])
         total += int(event["rewardAmount"])
         console.log("{} total {} processed".format(total / 1e18, token))
         rewardsUnit = int(event["rewardAmount"]) / totalBalance
         for user in userState:
             rewards.increase_user_rewards(
-                web3.toChecksumAddress(user.address),
-                web3.toChecksumAddress(token),
+                checksum_address(user.address),
+                checksum_address(token),
                 rewardsUnit * user.balance,
             )
 
@@ -57,9 +64,11 @@ def process_rewards(badger, events, name, nextCycle, token):
     return rewards
 
 
-def calc_meta_farm_rewards(badger, name, harvestBlock):
+def calc_meta_farm_rewards(badger, name, harvestBlock, timeline=None):
     console.log("Calculating rewards for {} harvest at {}".format(name, harvestBlock))
     harvestBlock = int(harvestBlock)
     sett = badger.getSett(name)
+    if timeline is not None:
+        return timeline.balances_at(harvestBlock)
     balances = calculate_sett_balances(badger, name, harvestBlock)
     return balances
@@ -1,7 +1,8 @@
 from helpers.constants import PEAK_ADDRESSES
 from assistant.subgraph.client import fetch_tree_distributions
 from assistant.subgraph.client import fetch_wallet_balances
-from assistant.rewards.rewards_utils import calculate_sett_balances
+from assistant.rewards.addresses import checksum_address
+from assistant.rewards.balance_timeline import sett_balance_timelines
 from rich.console import Console
 from assistant.rewards.classes.RewardsList import RewardsList
 from assistant.rewards.classes.RewardsLog import rewardsLog
@@ -23,6 +24,16 @@ def calc_tree_rewards(badger, startBlock, endBlock, nextCycle):
     )
     rewards = RewardsList(nextCycle, badger.badgerTree)
     rewardsData = {}
+    timelines = sett_balance_timelines(
+        badger,
+        [
+            (
+                badger.getSettFromStrategy(dist["id"].split("-")[0]),
+                int(dist["blockNumber"]),
+            )
+            for dist in treeDists
+        ],
+    )
     for dist in treeDists:
         blockNumber = dist["blockNumber"]
         strategy = dist["id"].split("-")[0]
@@ -39,11 +50,11 @@ def calc_tree_rewards(badger, startBlock, endBlock, nextCycle):
 
         rewardsData[symbol] += amountToDistribute / 1e18
         settName = badger.getSettFromStrategy(strategy)
-        balances = calculate_sett_balances(badger, settName, int(blockNumber))
+        balances = timelines[settName].balances_at(int(blockNumber))
         totalBalance = sum([u.balance for u in balances])
         rewardsUnit = amountToDistribute / totalBalance
         rewardsLog.add_total_token_dist(
-            settName, web3.toChecksumAddress(token), amountToDistribute / 1e18
+            settName, checksum_address(token), amountToDistribute / 1e18
         )
         # totalIbbtcBalance = sum(ibbtc_balances.values())
         for user in balances:
@@ -67,8 +78,8 @@ def calc_tree_rewards(badger, startBlock, endBlock, nextCycle):
             #         )
             # else:
             rewards.increase_user_rewards(
-                web3.toChecksumAddress(user.address),
-                web3.toChecksumAddress(token),
+                checksum_address(user.address),
+                checksum_address(token),
                 int(userReward),
             )
 
@@ -0,0 +1,99 @@
+import json
+
+from assistant.rewards.tree_binary import (
+    ClaimTable,
+    MappedSections,
+    encode_fields,
+    encode_tree,
+    write_sections,
+)
+
+"""
+Proof index for serving single claims. The .idx file holds the tree fields,
+the token table and the fixed width claim records sorted by address, the .dat
+file the merkle root and the amounts and proofs the records point to. Both
+are mapped in memory, so a lookup is a binary search over the records and
+reads one claim
+"""
+
+INDEX_MAGIC = b"BADGRIDX"
+DATA_MAGIC = b"BADGRDAT"
+INDEX_SECTIONS = ["fields", "tokens", "claims"]
+DATA_SECTIONS = ["root", "amounts", "proofs"]
+
+
+def proof_index_paths(prefix):
+    return prefix + ".idx", prefix + ".dat"
+
+
+def build_proof_index(tree, prefix):
+    """
+    Write the .idx and .dat files of a tree next to prefix
+    """
+    indexPath, dataPath = proof_index_paths(prefix)
+    encoder = encode_tree(tree)
+    # Data first, an index is only there once what it points to is complete
+    write_sections(
+        dataPath,
+        DATA_MAGIC,
+        encoder,
+        [
+            tree["merkleRoot"].encode(),
+            bytes(encoder.amounts),
+            bytes(encoder.proofs),
+        ],
+    )
+    write_sections(
+        indexPath,
+        INDEX_MAGIC,
+        encoder,
+        [encode_fields(tree), b"".join(encoder.tokens), encoder.claims()],
+    )
+    return indexPath, dataPath
+
+
+class ProofIndex:
+    """
+    Claim lookups over the mapped .idx and .dat files of a tree
+    """
+
+    def __init__(self, prefix):
+        indexPath, dataPath = proof_index_paths(prefix)
+        self.index = MappedSections(indexPath, INDEX_MAGIC, INDEX_SECTIONS)
+        try:
+            self.data = MappedSections(dataPath, DATA_MAGIC, DATA_SECTIONS)
+        except ValueError:
+            self.index.close()
+            raise
+        self.fields = json.loads(self.index.sections["fields"].tobytes())
+        if self.data.sections["root"].tobytes().decode() != self.fields["merkleRoot"]:
+            self.close()
+            raise ValueError(
+                "{} and {} are from different trees".format(indexPath, dataPath)
+            )
+        self.claims = ClaimTable(
+            self.index.sections["claims"],
+            self.index.sections["tokens"],
+            self.data.sections["amounts"],
+            self.data.sections["proofs"],
+        )
+
+    def get_claim(self, address):
+        """
+        Claim and proof of an address in any letter case, None if it has no claim
+        """
+        position = self.claims.position(address)
+        if position is None:
+            return None
+        return self.claims.claim_at(position)
+
+    def __len__(self):
+        return len(self.claims)
+
+    def close(self):
+        self.index.close()
+        self.data.close()
+
+
+def open_proof_index(prefix):
+    return ProofIndex(prefix)
@@ -0,0 +1,103 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from eth_hash.auto import keccak
+from assistant.rewards.claim_encoder import encode_claim
+from assistant.rewards.merkle_hash import hash_pair
+
+"""
+Offline check of every claim of a tree against its merkle root. Each leaf is
+encoded again from the claim and its proof walked up with sorted pair hashing,
+as the BadgerTree contract does on claim
+"""
+
+# Claims sent to a worker at once
+VERIFY_CHUNK_SIZE = 2048
+# Smaller trees are verified in-process
+PARALLEL_THRESHOLD = 2 * VERIFY_CHUNK_SIZE
+
+
+def claim_error(user, claim, root, cycle, parents=None):
+    """
+    Why a claim doesn't verify against root, None if it does. Proofs of
+    claims checked together share their upper nodes, parents caches the
+    pair hashes across them
+    """
+    if parents is None:
+        parents = {}
+    try:
+        if claim["user"] != user:
+            return "claim is for {}".format(claim["user"])
+        if int(claim["cycle"], 16) != cycle:
+            return "cycle {} instead of {}".format(int(claim["cycle"], 16), cycle)
+        encoded = encode_claim(
+            int(claim["index"], 16),
+            user,
+            cycle,
+            claim["tokens"],
+            [int(amount) for amount in claim["cumulativeAmounts"]],
+        )
+        if encoded != claim["node"]:
+            return "node doesn't match the claim"
+        node = keccak(bytes.fromhex(encoded[2:]))
+        for sibling in claim["proof"]:
+            pair = (node, bytes.fromhex(sibling[2:]))
+            parent = parents.get(pair)
+            if parent is None:
+                parent = hash_pair(*pair)
+                parents[pair] = parent
+            node = parent
+    except (KeyError, TypeError, ValueError) as e:
+        return "malformed claim: {!r}".format(e)
+    if node != root:
+        return "proof doesn't lead to the merkle root"
+    return None
+
+
+def _verify_chunk(args):
+    claims, root, cycle = args
+    errors = []
+    parents = {}
+    for user, claim in claims:
+        error = claim_error(user, claim, root, cycle, parents)
+        if error is not None:
+            errors.append((user, error))
+    return errors
+
+
+def _chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def verify_tree(tree, workers=None):
+    """
+    Verify the proof of every claim of a tree, returning (user, reason) for
+    each one that fails. Claims are spread over a pool of workers in chunks,
+    with a bounded number in flight so lazily read claims stay lazy
+    """
+    root = bytes.fromhex(tree["merkleRoot"][2:])
+    cycle = int(tree["cycle"])
+    claims = tree["claims"]
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(claims.items(), VERIFY_CHUNK_SIZE)
+    if workers == 1 or len(claims) < PARALLEL_THRESHOLD:
+        return [
+            error for chunk in chunks for error in _verify_chunk((chunk, root, cycle))
+        ]
+
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for chunk in chunks:
+            pending.append(pool.submit(_verify_chunk, (chunk, root, cycle)))
+            if len(pending) >= 2 * workers:
+                errors += pending.pop(0).result()
+        for future in pending:
+            errors += future.result()
+    return errors
@@ -1,5 +1,6 @@
 from assistant.subgraph.client import fetch_wallet_balances
 import json
+import os
 from brownie import *
 from brownie.network.gas.strategies import GasNowStrategy
 from config.rewards_config import rewards_config
@@ -10,11 +11,14 @@ from assistant.rewards.boost import badger_boost
 from assistant.rewards.twap import digg_btc_twap, calculate_digg_allocation
 from assistant.rewards.aws_utils import (
     download_latest_tree,
-    download_tree,
+    download_input_bundle,
+    download_tree_file,
     upload,
+    upload_input_bundle,
     upload_boosts,
+    upload_profile,
 )
-from assistant.rewards.calc_snapshot import calc_snapshot
+from assistant.rewards.calc_snapshot import compute_snapshots, snapshot_inputs
 from assistant.rewards.meta_rewards.harvest import calc_farm_rewards
 from assistant.rewards.meta_rewards.sushi import calc_all_sushi_rewards
 from assistant.rewards.meta_rewards.tree_rewards import calc_tree_rewards
@@ -23,13 +27,21 @@ from assistant.rewards.rewards_utils import (
     keccak,
     process_cumulative_rewards,
     combine_rewards,
+    prefetch_sett_balances,
 )
+from assistant.rewards.file_cache import prune_files
+from assistant.rewards.classes.CumulativeLedger import load_ledger, save_ledger
 from assistant.rewards.classes.MerkleTree import rewards_to_merkle_tree
 from assistant.rewards.classes.RewardsList import RewardsList
 from assistant.rewards.classes.RewardsLog import rewardsLog
+from assistant.rewards.classes.RewardsProfile import rewardsProfile
+from assistant.rewards.classes.InputBundle import inputBundle, load_bundle
+from assistant.rewards.proof_index import build_proof_index
+from assistant.rewards.tree_io import dump_tree, load_tree
 
 from assistant.rewards.rewards_checker import compare_rewards, verify_rewards
 from scripts.systems.badger_system import BadgerSystem
+from config.env_config import env_config
 from helpers.gas_utils import gas_strategies
 from helpers.constants import BCVX, BCVXCRV
 
@@ -46,16 +58,37 @@ def calc_sett_rewards(badger, periodStartBlock, endBlock, cycle, unclaimedReward
     # diggAllocation = calculate_digg_allocation(ratio)
     rewardsBySett = {}
     noRewards = ["native.digg", "experimental.digg"]
-    boosts, boostInfo = badger_boost(badger, endBlock)
+    # Fetch every vault's balances at once, boost and snapshots reuse them
+    with rewardsProfile.stage("prefetch sett balances"):
+        prefetch_sett_balances(
+            badger,
+            [
+                (key, endBlock)
+                for key in badger.sett_system.vaults.keys()
+                if key != "experimental.digg"
+            ],
+        )
+    with rewardsProfile.stage("boost"):
+        boosts, boostInfo, settBalances = badger_boost(badger, endBlock)
     apyBoosts = {}
     multiplierData = {}
-    for key, sett in badger.sett_system.vaults.items():
-        if key in noRewards:
-            continue
-
-        settRewards, apyBoost = calc_snapshot(
-            badger, key, periodStartBlock, endBlock, cycle, boosts, unclaimedRewards
+    # Chain reads stay in this process, the boosted distributions are
+    # independent per sett and can be computed in parallel
+    settKeys = [key for key in badger.sett_system.vaults.keys() if key not in noRewards]
+    with rewardsProfile.stage("snapshot inputs"):
+        settInputs = [
+            snapshot_inputs(
+                badger, key, periodStartBlock, endBlock, settBalances.get(key)
+            )
+            for key in settKeys
+        ]
+    with rewardsProfile.stage("snapshots"):
+        snapshots = compute_snapshots(
+            settInputs, cycle, boosts, unclaimedRewards, rewards_config.snapshotWorkers
         )
+    for key, (settRewards, apyBoost) in zip(settKeys, snapshots):
+        sett = badger.sett_system.vaults[key]
+        settRewards.badgerTree = badger.badgerTree
         if len(apyBoost) > 0:
             minimum = min(apyBoost.values())
             maximum = max(apyBoost.values())
@@ -82,7 +115,10 @@ def calc_sett_rewards(badger, periodStartBlock, endBlock, cycle, unclaimedReward
     with open("badger-boosts.json", "w") as fp:
         json.dump(boostsMetadata, fp)
 
-    upload_boosts(test=False)
+    # A replayed cycle reproduces what was published, it doesn't publish again
+    if not inputBundle.replaying:
+        with rewardsProfile.stage("upload boosts"):
+            upload_boosts(test=False)
 
     return rewards
 
@@ -143,7 +179,7 @@ def fetch_pending_rewards_tree(badger, print_output=False):
             "[green]===== Loading Pending Rewards " + pastFile + " =====[/green]"
         )
 
-    currentTree = json.loads(download_tree(pastFile))
+    currentTree = load_tree(download_tree_file(pastFile))
 
     # Invariant: File shoulld have same root as latest
     assert currentTree["merkleRoot"] == merkle["root"]
@@ -175,7 +211,7 @@ def fetch_current_rewards_tree(badger, print_output=False):
         "[bold yellow]===== Loading Past Rewards " + pastFile + " =====[/bold yellow]"
     )
 
-    currentTree = json.loads(download_tree(pastFile))
+    currentTree = load_tree(download_tree_file(pastFile))
 
     # Invariant: File shoulld have same root as latest
     console.print(merkle)
@@ -196,38 +232,97 @@ def fetch_current_rewards_tree(badger, print_output=False):
     return currentTree
 
 
-def generate_rewards_in_range(badger, startBlock, endBlock, pastRewards, saveLocalFile):
+def generate_rewards_in_range(
+    badger, startBlock, endBlock, pastRewards, saveLocalFile, inputs=None
+):
+    """
+    Run a rewards cycle, recording every external input it reads into a
+    bundle. With inputs (a bundle from load_bundle) the cycle is replayed
+    from the recorded inputs instead, without any network reads
+    """
+    inputBundle.capture_rpc(web3)
+    meta = {
+        "startBlock": startBlock,
+        "endBlock": endBlock,
+        "pastRewards": content_hash_to_filename(keccak(pastRewards["merkleRoot"])),
+    }
+    if inputs is not None:
+        if inputs["meta"] != meta:
+            raise ValueError(
+                "Inputs {} were recorded for {}, not {}".format(
+                    inputs["hash"], inputs["meta"], meta
+                )
+            )
+        console.print("Replaying cycle from inputs " + inputs["hash"])
+        with inputBundle.replay(inputs):
+            rewards_data = calc_rewards_in_range(
+                badger, startBlock, endBlock, pastRewards, saveLocalFile
+            )
+        unused = inputBundle.unused()
+        if unused:
+            console.log("{} recorded inputs were not used".format(len(unused)))
+        return rewards_data
+
+    with inputBundle.record(meta):
+        rewards_data = calc_rewards_in_range(
+            badger, startBlock, endBlock, pastRewards, saveLocalFile
+        )
+    rewards_data["inputBundle"] = inputBundle.save(env_config.input_bundle_dir)
+    console.print("Cycle inputs saved to " + rewards_data["inputBundle"])
+    return rewards_data
+
+
+def calc_rewards_in_range(badger, startBlock, endBlock, pastRewards, saveLocalFile):
     endBlock = endBlock
     blockDuration = endBlock - startBlock
+    rewardsProfile.reset()
+    rewardsProfile.count_rpc(web3)
 
     nextCycle = getNextCycle(badger)
 
     currentMerkleData = fetchCurrentMerkleData(badger)
     # farmRewards = fetch_current_harvest_rewards(badger,startBlock, endBlock,nextCycle)
-    unclaimedAddresses = []
-    for addr, data in pastRewards["claims"].items():
-        tokens = data["tokens"]
-        if BCVX in tokens or BCVXCRV in tokens:
-            unclaimedAddresses.append(addr)
-
-    sushiRewards = calc_all_sushi_rewards(badger, startBlock, endBlock, nextCycle)
-    treeRewards = calc_tree_rewards(badger, startBlock, endBlock, nextCycle)
-    settRewards = calc_sett_rewards(
-        badger,
-        startBlock,
-        endBlock,
-        nextCycle,
-        get_unclaimed_rewards(unclaimedAddresses),
-    )
+    # Past claims in compact form, saved when the previous tree was built
+    with rewardsProfile.stage("load ledger"):
+        pastLedger = load_ledger(pastRewards)
+    unclaimedAddresses = pastLedger.holders([BCVX, BCVXCRV])
+
+    with rewardsProfile.stage("sushi rewards"):
+        sushiRewards = calc_all_sushi_rewards(badger, startBlock, endBlock, nextCycle)
+    with rewardsProfile.stage("tree rewards"):
+        treeRewards = calc_tree_rewards(badger, startBlock, endBlock, nextCycle)
+    with rewardsProfile.stage("unclaimed rewards"):
+        unclaimedRewards = get_unclaimed_rewards(unclaimedAddresses)
+    with rewardsProfile.stage("sett rewards"):
+        settRewards = calc_sett_rewards(
+            badger, startBlock, endBlock, nextCycle, unclaimedRewards
+        )
 
-    newRewards = combine_rewards(
-        [settRewards, treeRewards, sushiRewards], nextCycle, badger.badgerTree
-    )
-    cumulativeRewards = process_cumulative_rewards(pastRewards, newRewards)
+    with rewardsProfile.stage("combine rewards"):
+        newRewards = combine_rewards(
+            [settRewards, treeRewards, sushiRewards], nextCycle, badger.badgerTree
+        )
+        cumulativeRewards = process_cumulative_rewards(pastLedger, newRewards)
 
     # Take metadata from geyserRewards
     console.print("Processing to merkle tree")
-    merkleTree = rewards_to_merkle_tree(cumulativeRewards, startBlock, endBlock, {})
+    # Reruns of the same cycle only rehash the leaves that changed
+    layersFile = None
+    if saveLocalFile:
+        os.makedirs(env_config.merkle_layers_dir, exist_ok=True)
+        layersFile = merkle_layers_filename(nextCycle)
+    with rewardsProfile.stage("merkle tree"):
+        merkleTree = rewards_to_merkle_tree(
+            cumulativeRewards, startBlock, endBlock, {}, layersFile, lazyClaims=True
+        )
+    if layersFile:
+        prune_files(
+            os.path.join(env_config.merkle_layers_dir, "merkle-layers-*.bin"),
+            env_config.merkle_layers_keep,
+        )
+
+    with rewardsProfile.stage("save ledger"):
+        save_ledger(cumulativeRewards, merkleTree["merkleRoot"])
 
     # Publish data
     rootHash = keccak(merkleTree["merkleRoot"])
@@ -250,15 +345,24 @@ def generate_rewards_in_range(badger, startBlock, endBlock, pastRewards, saveLoc
     rewardsLog.set_end_block(endBlock)
     print("Uploading to file " + contentFileName)
 
-    rewardsLog.save(nextCycle)
+    if not inputBundle.replaying:
+        with rewardsProfile.stage("upload analytics"):
+            rewardsLog.save(nextCycle)
     # TODO: Upload file to AWS & serve from server
     if saveLocalFile:
-        with open(contentFileName, "w") as outfile:
-            json.dump(merkleTree, outfile, indent=4)
+        dump_tree(merkleTree, contentFileName)
+        # Single claim lookups for the claims api, without parsing the tree
+        with rewardsProfile.stage("proof index"):
+            build_proof_index(merkleTree, os.path.splitext(contentFileName)[0])
 
     # Sanity check new rewards file
 
-    verify_rewards(badger, startBlock, endBlock, pastRewards, merkleTree)
+    with rewardsProfile.stage("verify rewards"):
+        verify_rewards(badger, startBlock, endBlock, pastRewards, merkleTree)
+
+    rewardsProfile.print_summary()
+    if not inputBundle.replaying:
+        upload_profile(nextCycle, rewardsProfile.report(nextCycle))
 
     return {
         "contentFileName": contentFileName,
@@ -318,12 +422,23 @@ def rootUpdater(badger, startBlock, endBlock, pastRewards, saveLocalFile, test=F
         upload(
             rewards_data["contentFileName"], rewards_data["merkleTree"], publish=False
         )
+        # Guardians and post-mortems replay the cycle from these
+        upload_input_bundle(
+            rewards_data["inputBundle"],
+            content_hash_to_inputs_filename(rewards_data["rootHash"]),
+        )
 
     return rewards_data
 
 
 def guardian(
-    badger: BadgerSystem, startBlock, endBlock, pastRewards, saveLocalFile, test=False
+    badger: BadgerSystem,
+    startBlock,
+    endBlock,
+    pastRewards,
+    saveLocalFile,
+    test=False,
+    replay=False,
 ):
     """
     Guardian Role
@@ -331,6 +446,10 @@ def guardian(
     - If there is, run the rewards script at the same block height to verify the results
     - If there is a discrepency, notify admin
     (In case of a one-off failure, Script will be attempted again at the guardianInterval)
+
+    With replay the cycle is recomputed from the inputs the root updater
+    recorded instead of live data. That checks the computation only, the
+    inputs themselves are taken as recorded
     """
 
     console.print("\n[bold cyan]===== Guardian =====[/bold cyan]\n")
@@ -348,8 +467,17 @@ def guardian(
         console.print("[bold yellow]===== Result: No Pending Root =====[/bold yellow]")
         return False
 
+    inputs = None
+    if replay:
+        pending = fetchPendingMerkleData(badger)
+        inputs = load_bundle(
+            download_input_bundle(
+                content_hash_to_inputs_filename(pending["contentHash"])
+            )
+        )
+
     rewards_data = generate_rewards_in_range(
-        badger, startBlock, endBlock, pastRewards, saveLocalFile
+        badger, startBlock, endBlock, pastRewards, saveLocalFile, inputs
     )
 
     console.print("===== Guardian Complete =====")
@@ -384,9 +512,21 @@ def run_action(badger, args, test, saveLocalFile=True):
             args["pastRewards"],
             saveLocalFile,
             test,
+            args.get("replay", False),
         )
     return False
 
 
 def content_hash_to_filename(contentHash):
     return "rewards-" + str(chain.id) + "-" + str(contentHash) + ".json"
+
+
+def content_hash_to_inputs_filename(contentHash):
+    return "inputs-" + str(chain.id) + "-" + str(contentHash) + ".json.gz"
+
+
+def merkle_layers_filename(cycle):
+    return os.path.join(
+        env_config.merkle_layers_dir,
+        "merkle-layers-" + str(chain.id) + "-" + str(cycle) + ".bin",
+    )
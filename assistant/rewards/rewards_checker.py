@@ -7,6 +7,10 @@ from scripts.systems.badger_system import BadgerSystem
 from brownie import *
 from rich.console import Console
 from assistant.rewards.aws_utils import upload
+from assistant.rewards.block_cache import block_timestamps
+from assistant.rewards.classes.RewardsProfile import rewardsProfile
+from assistant.rewards.proof_verifier import verify_tree
+from assistant.rewards.tree_diff import MAX_RATIO, diff_trees
 import json
 from helpers.utils import val
 from helpers.constants import TOKENS_TO_CHECK, DIGG, BADGER
@@ -27,8 +31,7 @@ def sec(amount):
 
 
 def get_distributed_in_range(key, geyser, startBlock, endBlock):
-    periodEndTime = web3.eth.getBlock(endBlock)["timestamp"]
-    periodStartTime = web3.eth.getBlock(startBlock)["timestamp"]
+    periodStartTime, periodEndTime = block_timestamps([startBlock, endBlock])
 
     geyserMock = BadgerGeyserMock(key)
     distributionTokenss = geyser.getDistributionTokenss()
@@ -67,19 +70,50 @@ def getExpectedDistributionInRange(badger: BadgerSystem, startBlock, endBlock):
     return totals
 
 
-def sum_claims(claims):
+def claim_amount(claim, token):
+    """
+    Cumulative amount of a token in a claim, 0 if the claim doesn't hold it
+    """
+    for claimToken, amount in zip(claim["tokens"], claim["cumulativeAmounts"]):
+        if claimToken.lower() == token.lower():
+            return int(amount)
+    return 0
+
+
+def sum_claims(claims, token=BADGER):
     total = 0
     for user, claim in claims.items():
-        total += int(claim["cumulativeAmounts"][0])
+        total += claim_amount(claim, token)
     return total
 
 
 def sum_digg_claims(claims):
-    total = 0
-    for user, claim in claims.items():
-        # print(claim["cumulativeAmounts"])
-        total += int(claim["cumulativeAmounts"][1])
-    return total
+    return sum_claims(claims, DIGG)
+
+
+def print_tree_diff(diff):
+    table = [
+        [token, diff.totalsBefore[token], diff.totalsAfter[token], diff.deltas[token]]
+        for token in diff.tokens
+    ]
+    print(tabulate(table, headers=["token", "before", "after", "diff"]))
+    console.print(
+        "{} users, {} new, {} decreased claims, {} claims up more than {}x".format(
+            diff.users,
+            diff.newUsers,
+            len(diff.violations),
+            len(diff.ratioOutliers),
+            MAX_RATIO,
+        )
+    )
+    table = [
+        [token, gainer["user"], gainer["before"], gainer["after"], gainer["delta"]]
+        for token, gainers in diff.topGainers.items()
+        for gainer in gainers
+    ]
+    print(tabulate(table, headers=["token", "top gainers", "before", "after", "diff"]))
+    for violation in diff.violations[:10]:
+        console.print("[red]Claim decreased: {}[/red]".format(violation))
 
 
 def diff_rewards(
@@ -87,37 +121,13 @@ def diff_rewards(
     before_file,
     after_file,
 ):
-    a = before_file["claims"]
-    b = after_file["claims"]
+    diff = diff_trees(before_file, after_file)
+    print_tree_diff(diff)
 
-    table = []
-    # Each users' cumulative claims must only increase
-    for user, claim in b.items():
-        afterClaim = int(b[user]["cumulativeAmounts"][0])
-        beforeClaim = 0
-        if user in a:
-            beforeClaim = int(a[user]["cumulativeAmounts"][0])
-        diff = afterClaim - beforeClaim
-
-        proportionGained = afterClaim / beforeClaim
-        assert proportionGained > 0.98
-        assert proportionGained < 1.25
-
-        table.append(
-            [
-                user,
-                val(beforeClaim),
-                val(afterClaim),
-                val(diff),
-                proportionGained,
-            ]
-        )
-    print(
-        tabulate(
-            table,
-            headers=["user", "a", "b", "diff", "% gained"],
-        )
-    )
+    # Each users' cumulative claims must only increase, and not jump in one cycle
+    assert len(diff.violations) == 0
+    assert len(diff.ratioOutliers) == 0
+    return diff
 
 
 def get_expected_total_rewards(periodEndTime):
@@ -150,14 +160,33 @@ def print_token_diff_table(name, before, after, sanity_diff, decimals=18):
     assert diff <= sanity_diff
 
 
+def verify_proofs(tree):
+    """
+    Every claim must verify against the merkle root before it is proposed or approved
+    """
+    with rewardsProfile.stage("verify proofs"):
+        errors = verify_tree(tree)
+    for user, error in errors[:10]:
+        console.print("[red]Invalid claim for {}: {}[/red]".format(user, error))
+    assert len(errors) == 0, "{} of {} claims don't verify against {}".format(
+        len(errors), len(tree["claims"]), tree["merkleRoot"]
+    )
+
+
 def verify_rewards(badger: BadgerSystem, startBlock, endBlock, before_data, after_data):
     before = before_data["claims"]
     after = after_data["claims"]
 
+    verify_proofs(after_data)
+
+    # Each users' cumulative claims must only increase, for every token
+    diff = diff_trees(before_data, after_data)
+    print_tree_diff(diff)
+    assert len(diff.violations) == 0, "{} claims decreased".format(len(diff.violations))
+
     print(startBlock, endBlock)
 
-    periodStartTime = web3.eth.getBlock(int(startBlock))["timestamp"]
-    periodEndTime = web3.eth.getBlock(int(endBlock))["timestamp"]
+    periodStartTime, periodEndTime = block_timestamps([startBlock, endBlock])
 
     digg_contract = get_digg_contract()
     spf = digg_contract._initialSharesPerFragment()
@@ -215,8 +244,6 @@ def compare_rewards(
 
     print(startBlock, endBlock, beforeContentHash)
 
-    metadata = after_file["metadata"]
-
     root = badger.badgerTree.merkleRoot()
     contentHash = badger.badgerTree.merkleContentHash()
     lastUpdateTime = badger.badgerTree.lastPublishTimestamp()
@@ -226,8 +253,7 @@ def compare_rewards(
 
     assert beforeContentHash == expectedContentHash
 
-    periodStartTime = web3.eth.getBlock(startBlock)["timestamp"]
-    periodEndTime = web3.eth.getBlock(endBlock)["timestamp"]
+    periodStartTime, periodEndTime = block_timestamps([startBlock, endBlock])
 
     duration = periodEndTime - periodStartTime
 
@@ -276,59 +302,11 @@ def compare_rewards(
     assert sum_after >= sum_before
     assert sum_after <= sanitySum
     # assert sum_after - (sum_before + expectedGains[Token.badger]) < 10000
-    table = []
-    # Each users' cumulative claims must only increase
-    for user, claim in after.items():
-        afterClaim = int(after[user]["cumulativeAmounts"][0])
-        beforeClaim = 0
-
-        if user in before:
-            beforeClaim = int(before[user]["cumulativeAmounts"][0])
-        diff = afterClaim - beforeClaim
-
-        assert afterClaim >= beforeClaim
-        assert diff >= 0
-
-        if beforeClaim == 0:
-            proportionGained = 1
-        elif diff > 0:
-            proportionGained = afterClaim / beforeClaim
-        else:
-            proportionGained = "+"
-
-        if user in metadata:
-            shareSeconds = metadata[user]["shareSeconds"]
-            # shareSecondsInRange = metadata[user]["shareSecondsInRange"]
-            # shareSecondsBefore = shareSeconds - shareSecondsInRange
-            # proportionInRange = shareSecondsInRange / shareSeconds
-        else:
-            shareSeconds = 0
-            # shareSecondsInRange = 0
-            # shareSecondsBefore = 0
-            # proportionInRange = 0
 
-        table.append(
-            [
-                user,
-                val(beforeClaim),
-                val(afterClaim),
-                val(diff),
-                proportionGained,
-            ]
-        )
-        assert afterClaim >= beforeClaim
-    # print(
-    #     tabulate(
-    #         table,
-    #         headers=[
-    #             "user",
-    #             "before gains",
-    #             "after gains",
-    #             "diff",
-    #             "% gained"
-    #         ],
-    #     )
-    # )
+    # Each users' cumulative claims must only increase, for every token
+    diff = diff_trees(before_file, after_file)
+    print_tree_diff(diff)
+    assert len(diff.violations) == 0
 
 
 def push_rewards(badger: BadgerSystem, afterContentHash):
@@ -382,8 +360,8 @@ def test_claims(badger: BadgerSystem, startBlock, endBlock, before_file, after_f
         claimed = badger.badgerTree.getClaimedFor(user, [badger.token.address])[1][0]
         claimed_digg = badger.badgerTree.getClaimedFor(user, [digg.token.address])[1][0]
 
-        badger_claimable = int(claim["cumulativeAmounts"][0])
-        digg_claimable = int(claim["cumulativeAmounts"][1])
+        badger_claimable = claim_amount(claim, badger.token.address)
+        digg_claimable = claim_amount(claim, digg.token.address)
 
         badger_diff = badger_claimable - claimed
         digg_diff = digg_claimable - claimed_digg
@@ -4,12 +4,18 @@ from rich.console import Console
 from collections import Counter
 from assistant.subgraph.client import (
     fetch_sett_balances,
+    fetch_sett_balances_async,
+    fetch_many_sett_balances_async,
     fetch_geyser_events,
+    fetch_geyser_events_async,
 )
+from assistant.subgraph.sessions import run_queries
+from assistant.rewards.classes.CumulativeLedger import CumulativeLedger
 from assistant.rewards.classes.RewardsList import RewardsList
-from assistant.rewards.classes.UserBalance import UserBalance, UserBalances
+from assistant.rewards.classes.UserBalance import BalanceAccumulator, UserBalances
 from helpers.constants import NO_GEYSERS
 from functools import lru_cache
+from assistant.rewards.classes.InputBundle import inputBundle
 
 blacklist = [
     "0x19D97D8fA813EE2f51aD4B4e04EA08bAf4DFfC28",
@@ -97,26 +103,27 @@ def keccak(value):
 def combine_rewards(rewardsList, cycle, badgerTree):
     combinedRewards = RewardsList(cycle, badgerTree)
     for rewards in rewardsList:
-        for user, claims in rewards.claims.items():
-            for token, claim in claims.items():
-                combinedRewards.increase_user_rewards(user, token, claim)
+        combinedRewards.merge(rewards)
     return combinedRewards
 
 
 def process_cumulative_rewards(current, new: RewardsList):
+    """
+    Cumulative rewards of a cycle, from the previous tree (or its
+    CumulativeLedger) and this cycle's rewards
+    """
     result = RewardsList(new.cycle, new.badgerTree)
 
     # Add new rewards
-    for user, claims in new.claims.items():
-        for token, claim in claims.items():
-            result.increase_user_rewards(user, token, claim)
-
-    # Add existing rewards
-    for user, userData in current["claims"].items():
-        for i in range(len(userData["tokens"])):
-            token = userData["tokens"][i]
-            amount = userData["cumulativeAmounts"][i]
-            result.increase_user_rewards(user, token, int(amount))
+    result.merge(new)
+
+    # Add existing rewards, only users with new rewards are combined claim by claim
+    if not isinstance(current, CumulativeLedger):
+        current = CumulativeLedger.from_claims(current["claims"])
+    result.add_ledger(current)
+    console.log(
+        "{} of {} claims changed this cycle".format(len(new.claims), len(result.claims))
+    )
 
     # result.printState()
     return result
@@ -177,17 +184,51 @@ def calc_balances_from_geyser_events(geyserEvents):
 
 
 def combine_balances(balances):
-    allBalances = UserBalances()
+    allBalances = BalanceAccumulator()
     for userBalances in balances:
-        allBalances = allBalances + userBalances
-    return allBalances
+        allBalances.add_many(userBalances)
+    return allBalances.freeze()
 
 
-@lru_cache(maxsize=None)
-def calculate_sett_balances(badger, name, currentBlock):
-    console.log("Fetching {} sett balances".format(name))
-    sett = badger.getSett(name)
-    underlyingToken = sett.address
+def sett_balance_queries(badger, name, currentBlock):
+    """
+    Subgraph fetches calculate_sett_balances makes for a sett, as (fetcher, args)
+    """
+    settId = badger.getSett(name).address.lower()
+    queries = [(fetch_sett_balances_async, (name, settId, currentBlock))]
+    if name not in NO_GEYSERS:
+        geyserAddr = badger.getGeyser(name).address.lower()
+        queries.append((fetch_geyser_events_async, (geyserAddr, currentBlock)))
+    return queries
+
+
+def prefetch_sett_balances(badger, requests):
+    """
+    Fetch the subgraph data for many (sett name, block) pairs concurrently,
+    later calculate_sett_balances calls for them are served from cache.
+    Pairs already fetched are skipped
+    """
+    queries = []
+    vaults = {}
+    for name, currentBlock in dict.fromkeys(requests):
+        for fetch, args in sett_balance_queries(badger, name, currentBlock):
+            if args in fetch.cache:
+                continue
+            if fetch is fetch_sett_balances_async:
+                # Batched into one aliased query per block below
+                key, settId, block = args
+                vaults.setdefault(block, {})[key] = settId
+            else:
+                queries.append((fetch, args))
+    for block, blockVaults in vaults.items():
+        queries.append((fetch_many_sett_balances_async, (blockVaults, block)))
+    if not queries:
+        return
+    console.log("Prefetching {} subgraph queries".format(len(queries)))
+    run_queries(queries)
+
+
+def sett_type(name):
     settType = ["", ""]
     if "uni" in name or "sushi" in name:
         settType[0] = "halfLP"
@@ -197,17 +238,21 @@ def calculate_sett_balances(badger, name, currentBlock):
         settType[1] = "nonNative"
     else:
         settType[1] = "native"
+    return settType
 
-    settBalances = fetch_sett_balances(name, underlyingToken.lower(), currentBlock)
-    geyserBalances = {}
+
+def build_sett_balances(badger, name, settBalances, geyserBalances):
+    """
+    Combine raw sett share and geyser balances into UserBalances,
+    shares held by the geyser itself are counted through its stakers
+    """
+    underlyingToken = badger.getSett(name).address
+    settType = sett_type(name)
     creamBalances = {}
 
     if name not in NO_GEYSERS:
-
         geyserAddr = badger.getGeyser(name).address.lower()
-        geyserEvents = fetch_geyser_events(geyserAddr, currentBlock)
-        geyserBalances = calc_balances_from_geyser_events(geyserEvents)
-        settBalances[geyserAddr] = 0
+        settBalances = {**settBalances, geyserAddr: 0}
 
     balances = {}
     for b in [settBalances, geyserBalances, creamBalances]:
@@ -219,9 +264,29 @@ def calculate_sett_balances(badger, name, currentBlock):
 
     # Testing for peak address
     # balances["0x41671BA1abcbA387b9b2B752c205e22e916BE6e3".lower()] = 10000
-    userBalances = [
-        UserBalance(addr, bal, underlyingToken, settType)
-        for addr, bal in balances.items()
-    ]
     console.log("\n")
-    return UserBalances(userBalances)
+    return UserBalances.from_columns(
+        balances.keys(),
+        balances.values(),
+        [underlyingToken] * len(balances),
+        [settType] * len(balances),
+    )
+
+
+@lru_cache(maxsize=None)
+def calculate_sett_balances(badger, name, currentBlock):
+    console.log("Fetching {} sett balances".format(name))
+    underlyingToken = badger.getSett(name).address
+    settBalances = fetch_sett_balances(name, underlyingToken.lower(), currentBlock)
+    geyserBalances = {}
+
+    if name not in NO_GEYSERS:
+        geyserAddr = badger.getGeyser(name).address.lower()
+        geyserEvents = fetch_geyser_events(geyserAddr, currentBlock)
+        geyserBalances = calc_balances_from_geyser_events(geyserEvents)
+
+    return build_sett_balances(badger, name, settBalances, geyserBalances)
+
+
+# Balances cached across cycles would bypass the cycle's input bundle
+inputBundle.register_cache(calculate_sett_balances.cache_clear)
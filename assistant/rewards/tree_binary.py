@@ -0,0 +1,377 @@
+import json
+import mmap
+import struct
+from collections.abc import ItemsView, Mapping
+
+from eth_utils import to_checksum_address
+from assistant.rewards.claim_encoder import ADDRESS_SIZE, WORD, encode_claim
+from assistant.rewards.merkle_hash import NODE_SIZE
+from assistant.rewards.tree_io import CLAIMS, dump_tree, load_tree
+
+"""
+Binary container for rewards trees, read in place through mmap.
+
+    header   magic, version, claim and token counts, (offset, size) of each section
+    fields   the other top level fields as JSON, claims as null
+    tokens   interned token addresses, each with its letter case
+    claims   fixed width records sorted by user address
+    amounts  (token id, uint256 amount) pairs addressed by the claim records
+    proofs   32 byte proof nodes addressed by the claim records
+
+The encoded leaf ("node") is not stored, it is encoded again from the claim.
+Only canonical trees, as rewards_to_merkle_tree writes them, are accepted so
+the JSON converts back unchanged
+"""
+
+MAGIC = b"BADGTREE"
+VERSION = 1
+SECTIONS = ["fields", "tokens", "claims", "amounts", "proofs"]
+# user, user is checksummed, index, cycle, token count, proof length,
+# amounts offset, proof offset
+CLAIM = struct.Struct(">20s?IIHHQQ")
+# token is checksummed, token
+TOKEN = struct.Struct(">?20s")
+AMOUNT = struct.Struct(">H32s")
+CLAIM_KEYS = ["index", "user", "cycle", "tokens", "cumulativeAmounts", "proof", "node"]
+
+
+def canonical_hex(value, bits):
+    number = int(value, 16)
+    if hex(number) != value or number >= 1 << bits:
+        raise ValueError("Non canonical hex {}".format(value))
+    return number
+
+
+def raw_address(address):
+    """
+    Raw bytes of a checksummed or lowercase address, and whether it was checksummed
+    """
+    raw = bytes.fromhex(address[2:])
+    if len(raw) == ADDRESS_SIZE:
+        if "0x" + raw.hex() == address:
+            return raw, False
+        if to_checksum_address(raw) == address:
+            return raw, True
+    raise ValueError("Invalid address {}".format(address))
+
+
+def address_string(raw, checksummed):
+    return to_checksum_address(raw) if checksummed else "0x" + raw.hex()
+
+
+def raw_node(node):
+    raw = bytes.fromhex(node[2:])
+    if len(raw) != NODE_SIZE or "0x" + raw.hex() != node:
+        raise ValueError("Invalid proof node {}".format(node))
+    return raw
+
+
+class ClaimEncoder:
+    """
+    Packs claims into the claims, amounts and proofs sections
+    """
+
+    def __init__(self):
+        self.tokens = []
+        self.tokenIds = {}
+        self.records = []
+        self.amounts = bytearray()
+        self.proofs = bytearray()
+
+    def token_id(self, token):
+        tokenId = self.tokenIds.get(token)
+        if tokenId is None:
+            tokenId = len(self.tokens)
+            self.tokenIds[token] = tokenId
+            self.tokens.append(TOKEN.pack(*reversed(raw_address(token))))
+        return tokenId
+
+    def add(self, user, claim):
+        if list(claim) != CLAIM_KEYS or claim["user"] != user:
+            raise ValueError("Unexpected claim layout for {}".format(user))
+        index = canonical_hex(claim["index"], 32)
+        cycle = canonical_hex(claim["cycle"], 32)
+        tokens = claim["tokens"]
+        amounts = [int(amount) for amount in claim["cumulativeAmounts"]]
+        if [str(amount) for amount in amounts] != claim["cumulativeAmounts"]:
+            raise ValueError("Non canonical amounts for {}".format(user))
+        if encode_claim(index, user, cycle, tokens, amounts) != claim["node"]:
+            raise ValueError("Node of {} doesn't match its claim".format(user))
+
+        amountsOffset = len(self.amounts)
+        for token, amount in zip(tokens, amounts):
+            self.amounts += AMOUNT.pack(
+                self.token_id(token), amount.to_bytes(WORD, "big")
+            )
+        proofOffset = len(self.proofs)
+        for node in claim["proof"]:
+            self.proofs += raw_node(node)
+        self.records.append(
+            (
+                *raw_address(user),
+                index,
+                cycle,
+                len(tokens),
+                len(claim["proof"]),
+                amountsOffset,
+                proofOffset,
+            )
+        )
+
+    def claims(self):
+        self.records.sort(key=lambda record: record[0])
+        return b"".join(CLAIM.pack(*record) for record in self.records)
+
+
+def encode_fields(tree):
+    fields = {key: None if key == CLAIMS else value for key, value in tree.items()}
+    return json.dumps(fields).encode()
+
+
+def encode_tree(tree):
+    encoder = ClaimEncoder()
+    for user, claim in tree[CLAIMS].items():
+        encoder.add(user, claim)
+    return encoder
+
+
+def header_struct(sectionCount):
+    # magic, version, claim count, token count, (offset, size) of each section
+    return struct.Struct(">8sIII" + "QQ" * sectionCount)
+
+
+def write_sections(path, magic, encoder, sections):
+    header = header_struct(len(sections))
+    offsets = []
+    offset = header.size
+    for section in sections:
+        offsets += [offset, len(section)]
+        offset += len(section)
+    with open(path, "wb") as f:
+        f.write(
+            header.pack(
+                magic, VERSION, len(encoder.records), len(encoder.tokens), *offsets
+            )
+        )
+        for section in sections:
+            f.write(section)
+
+
+class MappedSections:
+    """
+    A file written by write_sections mapped in memory, with a memoryview of
+    each section
+    """
+
+    def __init__(self, path, magic, names):
+        header = header_struct(len(names))
+        self._file = open(path, "rb")
+        self.buffer = None
+        self.sections = {}
+        try:
+            self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            (
+                fileMagic,
+                version,
+                self.claimCount,
+                self.tokenCount,
+                *offsets,
+            ) = header.unpack_from(self.buffer)
+        except (ValueError, struct.error):
+            fileMagic = version = None
+        if fileMagic != magic or version != VERSION:
+            self.close()
+            raise ValueError("{} is not a {} file".format(path, magic.decode()))
+
+        with memoryview(self.buffer) as view:
+            for i, name in enumerate(names):
+                start, size = offsets[2 * i], offsets[2 * i + 1]
+                self.sections[name] = view[start : start + size]
+
+    def close(self):
+        for section in self.sections.values():
+            section.release()
+        self.sections = {}
+        if self.buffer is not None:
+            self.buffer.close()
+        self._file.close()
+
+
+def dump_binary_tree(tree, path):
+    """
+    Write a tree (a dict, TreeFile or tree with lazy claims) as a binary tree
+    """
+    encoder = encode_tree(tree)
+    sections = [
+        encode_fields(tree),
+        b"".join(encoder.tokens),
+        encoder.claims(),
+        bytes(encoder.amounts),
+        bytes(encoder.proofs),
+    ]
+    write_sections(path, MAGIC, encoder, sections)
+
+
+class ClaimTable(Mapping):
+    """
+    Claims decoded from their records on access. A user is found by binary
+    search over the sorted records, in any letter case. Iteration follows the
+    claim index, the order of the JSON tree
+    """
+
+    def __init__(self, records, tokens, amounts, proofs):
+        self.records = records
+        self.tokens = [
+            address_string(raw, checksummed)
+            for checksummed, raw in TOKEN.iter_unpack(tokens)
+        ]
+        self.amounts = amounts
+        self.proofs = proofs
+        self.count = len(records) // CLAIM.size
+        self._order = None
+
+    def user_at(self, position):
+        start = position * CLAIM.size
+        return self.records[start : start + ADDRESS_SIZE].tobytes()
+
+    def position(self, user):
+        """
+        Position of a user's record, None if the user has no claim
+        """
+        try:
+            raw = bytes.fromhex(user[2:] if user.startswith("0x") else user)
+        except (AttributeError, ValueError):
+            return None
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self.user_at(mid) < raw:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.count and self.user_at(low) == raw:
+            return low
+        return None
+
+    def claim_at(self, position):
+        (
+            user,
+            checksummed,
+            index,
+            cycle,
+            tokenCount,
+            proofCount,
+            amountsOffset,
+            proofOffset,
+        ) = CLAIM.unpack_from(self.records, position * CLAIM.size)
+        user = address_string(user, checksummed)
+        tokens = []
+        amounts = []
+        for i in range(tokenCount):
+            tokenId, amount = AMOUNT.unpack_from(
+                self.amounts, amountsOffset + i * AMOUNT.size
+            )
+            tokens.append(self.tokens[tokenId])
+            amounts.append(int.from_bytes(amount, "big"))
+        proofEnd = proofOffset + proofCount * NODE_SIZE
+        proof = [
+            "0x" + self.proofs[i : i + NODE_SIZE].hex()
+            for i in range(proofOffset, proofEnd, NODE_SIZE)
+        ]
+        return {
+            "index": hex(index),
+            "user": user,
+            "cycle": hex(cycle),
+            "tokens": tokens,
+            "cumulativeAmounts": [str(amount) for amount in amounts],
+            "proof": proof,
+            "node": encode_claim(index, user, cycle, tokens, amounts),
+        }
+
+    @property
+    def order(self):
+        if self._order is None:
+            indexes = [
+                CLAIM.unpack_from(self.records, position * CLAIM.size)[2]
+                for position in range(self.count)
+            ]
+            self._order = sorted(range(self.count), key=indexes.__getitem__)
+        return self._order
+
+    def items(self):
+        return ClaimTableItems(self)
+
+    def __getitem__(self, user):
+        position = self.position(user)
+        if position is None:
+            raise KeyError(user)
+        return self.claim_at(position)
+
+    def __contains__(self, user):
+        return self.position(user) is not None
+
+    def __iter__(self):
+        return (user for user, _ in self.items())
+
+    def __len__(self):
+        return self.count
+
+
+class ClaimTableItems(ItemsView):
+    def __iter__(self):
+        table = self._mapping
+        for position in table.order:
+            claim = table.claim_at(position)
+            yield claim["user"], claim
+
+
+class BinaryTree(Mapping):
+    """
+    A binary tree file mapped in memory. Fields are read on open, claims
+    are decoded one at a time from the mapped file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = MappedSections(path, MAGIC, SECTIONS)
+        sections = self.file.sections
+        self.fields = json.loads(sections["fields"].tobytes())
+        self.claims = ClaimTable(
+            sections["claims"],
+            sections["tokens"],
+            sections["amounts"],
+            sections["proofs"],
+        )
+
+    def __getitem__(self, key):
+        if key == CLAIMS:
+            return self.claims
+        return self.fields[key]
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def close(self):
+        self.file.close()
+
+
+def load_binary_tree(path):
+    return BinaryTree(path)
+
+
+def json_to_binary(source, target):
+    """
+    Convert a JSON tree file to a binary tree, streaming its claims
+    """
+    tree = load_tree(source)
+    dump_binary_tree(tree, target)
+    tree.close()
+
+
+def binary_to_json(source, target, indent=4):
+    tree = load_binary_tree(source)
+    dump_tree(tree, target, indent)
+    tree.close()
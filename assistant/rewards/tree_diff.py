@@ -0,0 +1,187 @@
+from dataclasses import asdict, dataclass
+from typing import Dict, List
+
+import numpy as np
+
+"""
+Vectorized diff of two rewards trees. Claims of both trees are aligned into
+(user x token) matrices of uint256 amounts, each amount split into 32 bit
+limbs held in uint64 so sums and differences stay exact in numpy
+"""
+
+LIMBS = 8
+LIMB_BITS = 32
+LIMB_SCALES = [2.0 ** (LIMB_BITS * (LIMBS - 1 - i)) for i in range(LIMBS)]
+# Claims growing by more than this ratio in one cycle are reported as outliers
+MAX_RATIO = 1.25
+
+
+@dataclass
+class TreeDiff:
+    tokens: List[str]
+    users: int
+    newUsers: int
+    totalsBefore: Dict[str, int]
+    totalsAfter: Dict[str, int]
+    deltas: Dict[str, int]
+    # Claims that went down, users missing from the new tree included
+    violations: List[dict]
+    topGainers: Dict[str, List[dict]]
+    ratioOutliers: List[dict]
+
+    def to_dict(self):
+        return asdict(self)
+
+
+class ClaimMatrixBuilder:
+    """
+    Collects the amounts of one or more trees over a shared user and token index
+    """
+
+    def __init__(self):
+        self.userIds = {}
+        self.users = []
+        self.tokenIds = {}
+        self.tokens = []
+
+    def _id(self, ids, names, name):
+        key = name.lower()
+        nameId = ids.get(key)
+        if nameId is None:
+            nameId = len(names)
+            ids[key] = nameId
+            names.append(name)
+        return nameId
+
+    def read(self, claims):
+        """
+        Rows, columns and big endian uint256 amounts of every claim
+        """
+        rows = []
+        counts = []
+        cols = []
+        amounts = []
+        # Most claims share a handful of token lists
+        tokenCols = {}
+        for user, claim in claims.items():
+            rows.append(self._id(self.userIds, self.users, user))
+            tokens = claim["tokens"]
+            key = tuple(tokens)
+            claimCols = tokenCols.get(key)
+            if claimCols is None:
+                claimCols = [
+                    self._id(self.tokenIds, self.tokens, token) for token in tokens
+                ]
+                tokenCols[key] = claimCols
+            counts.append(len(claimCols))
+            cols += claimCols
+            amounts += claim["cumulativeAmounts"]
+        raw = b"".join([int(amount).to_bytes(32, "big") for amount in amounts])
+        return np.repeat(np.array(rows, dtype=np.int64), counts), cols, raw
+
+    def matrix(self, entries):
+        rows, cols, amounts = entries
+        matrix = np.zeros((len(self.users), len(self.tokens), LIMBS), dtype=np.uint64)
+        limbs = np.frombuffer(amounts, dtype=">u4").reshape(-1, LIMBS)
+        matrix[rows, cols] = limbs
+        return matrix
+
+
+def subtract(a, b):
+    """
+    a - b modulo 2**256, and where the result went negative
+    """
+    out = np.empty_like(a)
+    borrow = np.zeros(a.shape[:-1], dtype=np.int64)
+    for i in reversed(range(LIMBS)):
+        limb = a[..., i].astype(np.int64) - b[..., i].astype(np.int64) - borrow
+        borrow = (limb < 0).astype(np.int64)
+        out[..., i] = (limb + (borrow << LIMB_BITS)).astype(np.uint64)
+    return out, borrow.astype(bool)
+
+
+def to_float(matrix):
+    return sum(matrix[..., i].astype(np.float64) * LIMB_SCALES[i] for i in range(LIMBS))
+
+
+def to_int(limbs):
+    return int.from_bytes(limbs.astype(">u4").tobytes(), "big")
+
+
+def column_totals(matrix):
+    """
+    Exact sum of each token column, limb sums can't overflow below 2**32 users
+    """
+    sums = matrix.sum(axis=0)
+    return [
+        sum(int(limb) << (LIMB_BITS * (LIMBS - 1 - i)) for i, limb in enumerate(column))
+        for column in sums
+    ]
+
+
+def diff_trees(before, after, top=10, maxRatio=MAX_RATIO):
+    """
+    Compare the claims of two trees: per token totals and deltas, claims that
+    decreased, the top gainers of each token and gains above maxRatio
+    """
+    builder = ClaimMatrixBuilder()
+    beforeEntries = builder.read(before["claims"])
+    beforeUsers = len(builder.users)
+    afterEntries = builder.read(after["claims"])
+    beforeMatrix = builder.matrix(beforeEntries)
+    afterMatrix = builder.matrix(afterEntries)
+    users = builder.users
+    tokens = builder.tokens
+
+    delta, decreased = subtract(afterMatrix, beforeMatrix)
+    loss, _ = subtract(beforeMatrix, afterMatrix)
+    totalsBefore = column_totals(beforeMatrix)
+    totalsAfter = column_totals(afterMatrix)
+
+    def cell(row, col, **values):
+        return {
+            "user": users[row],
+            "token": tokens[col],
+            "before": to_int(beforeMatrix[row, col]),
+            "after": to_int(afterMatrix[row, col]),
+            **values,
+        }
+
+    violations = [
+        cell(row, col, delta=-to_int(loss[row, col]))
+        for row, col in zip(*np.nonzero(decreased))
+    ]
+
+    gains = np.where(decreased, 0.0, to_float(delta))
+    topGainers = {}
+    for col, token in enumerate(tokens):
+        column = gains[:, col]
+        count = min(top, int(np.count_nonzero(column)))
+        rows = np.argpartition(-column, count - 1)[:count] if count else []
+        rows = sorted(rows, key=lambda row: -column[row])
+        topGainers[token] = [
+            cell(row, col, delta=to_int(delta[row, col])) for row in rows
+        ]
+
+    beforeFloat = to_float(beforeMatrix)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(beforeFloat > 0, to_float(afterMatrix) / beforeFloat, 0.0)
+    outliers = sorted(zip(*np.nonzero(ratio > maxRatio)), key=lambda c: -ratio[c])
+    ratioOutliers = [
+        cell(row, col, ratio=float(ratio[row, col])) for row, col in outliers
+    ]
+
+    return TreeDiff(
+        tokens=tokens,
+        users=len(users),
+        newUsers=len(users) - beforeUsers,
+        totalsBefore=dict(zip(tokens, totalsBefore)),
+        totalsAfter=dict(zip(tokens, totalsAfter)),
+        deltas={
+            token: totalAfter - totalBefore
+            for token, totalBefore, totalAfter in zip(tokens, totalsBefore, totalsAfter)
+        },
+        violations=violations,
+        topGainers=topGainers,
+        ratioOutliers=ratioOutliers,
+    )
@@ -0,0 +1,277 @@
+import json
+from collections.abc import ItemsView, Mapping
+
+"""
+Streaming reads and writes of rewards tree files. Claims are written one at a
+time instead of dumping the whole tree as one document, and read back one at
+a time without parsing the whole file
+"""
+
+# Bytes read from a tree file at once
+CHUNK_SIZE = 1 << 20
+CLAIMS = "claims"
+WHITESPACE = " \t\n\r"
+
+decoder = json.JSONDecoder()
+
+
+def dumps_at(value, indent, level):
+    """
+    json.dumps of a value nested level objects deep in an indented document
+    """
+    text = json.dumps(value, indent=indent)
+    if indent is None:
+        return text
+    # Newlines inside strings are escaped, these are all layout
+    return text.replace("\n", "\n" + " " * (indent * level))
+
+
+def write_object(fp, items, indent, level, write_value):
+    if indent is None:
+        first, separator, last = "", ", ", ""
+    else:
+        first = "\n" + " " * (indent * (level + 1))
+        separator = "," + first
+        last = "\n" + " " * (indent * level)
+    fp.write("{")
+    empty = True
+    for key, value in items:
+        fp.write(first if empty else separator)
+        empty = False
+        fp.write(json.dumps(key) + ": ")
+        write_value(key, value)
+    fp.write("}" if empty else last + "}")
+
+
+def write_tree(tree, fp, indent=None):
+    """
+    Write a tree to a text file claim by claim. The output is the same as
+    json.dump(tree, fp, indent=indent), claims can be any mapping
+    """
+
+    def write_claim(user, claim):
+        fp.write(dumps_at(claim, indent, 2))
+
+    def write_field(key, value):
+        if key == CLAIMS:
+            write_object(fp, value.items(), indent, 1, write_claim)
+        else:
+            fp.write(dumps_at(value, indent, 1))
+
+    write_object(fp, tree.items(), indent, 0, write_field)
+
+
+def dump_tree(tree, path, indent=4):
+    with open(path, "w") as fp:
+        write_tree(tree, fp, indent)
+
+
+class TreeScanner:
+    """
+    Incremental JSON scanner over a binary file, reading one value at a time
+    and tracking the byte offsets of each. Bytes are decoded as latin-1 so
+    text and file offsets line up, values holding other bytes are decoded
+    again as utf-8
+    """
+
+    def __init__(self, fp, chunkSize=None):
+        self.fp = fp
+        self.chunkSize = chunkSize or CHUNK_SIZE
+        self.text = ""
+        self.pos = 0
+        self.offset = fp.tell()
+
+    def fill(self, size):
+        chunk = self.fp.read(size)
+        self.offset += self.pos
+        self.text = self.text[self.pos :] + chunk.decode("latin-1")
+        self.pos = 0
+        return bool(chunk)
+
+    def peek(self):
+        while True:
+            text = self.text
+            while self.pos < len(text) and text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(text):
+                return text[self.pos]
+            if not self.fill(self.chunkSize):
+                raise ValueError("Unexpected end of tree file")
+
+    def take(self, char):
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.take(char):
+            raise ValueError(
+                "Expected {!r} at byte {} of tree file".format(
+                    char, self.offset + self.pos
+                )
+            )
+
+    def value(self):
+        """
+        Next value, with its start and end offsets in the file
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                # Value cut at the end of the chunk, read at least as much again
+                if not self.fill(max(self.chunkSize, len(self.text))):
+                    raise
+                continue
+            # A number at the end of the chunk may go on in the next one
+            if end < len(self.text) or not self.fill(self.chunkSize):
+                break
+        raw = self.text[self.pos : end]
+        if not raw.isascii():
+            value = json.loads(raw.encode("latin-1").decode("utf-8"))
+        start = self.offset + self.pos
+        self.pos = end
+        return value, start, self.offset + end
+
+
+def iter_tree(fp, chunkSize=None):
+    """
+    Parse a tree file one piece at a time. Yields ("field", key, value) for
+    each top level field, with a None value for the claims, and
+    ("claim", user, claim, start, end) for each claim
+    """
+    scanner = TreeScanner(fp, chunkSize)
+    scanner.expect("{")
+    if scanner.take("}"):
+        return
+    while True:
+        key, _, _ = scanner.value()
+        scanner.expect(":")
+        if key == CLAIMS:
+            yield ("field", key, None)
+            scanner.expect("{")
+            if not scanner.take("}"):
+                while True:
+                    user, _, _ = scanner.value()
+                    scanner.expect(":")
+                    claim, start, end = scanner.value()
+                    yield ("claim", user, claim, start, end)
+                    if not scanner.take(","):
+                        scanner.expect("}")
+                        break
+        else:
+            value, _, _ = scanner.value()
+            yield ("field", key, value)
+        if not scanner.take(","):
+            scanner.expect("}")
+            return
+
+
+def iter_claims(path):
+    """
+    (user, claim) pairs of a tree file, read one at a time
+    """
+    with open(path, "rb") as fp:
+        for event in iter_tree(fp):
+            if event[0] == "claim":
+                yield event[1], event[2]
+
+
+class StreamedClaimItems(ItemsView):
+    def __iter__(self):
+        return iter_claims(self._mapping.tree.path)
+
+
+class TreeFileClaims(Mapping):
+    """
+    Claims of a tree file. Iterating streams them from the file, single
+    claims are read through the offsets index of the tree
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self._fp = None
+
+    def items(self):
+        return StreamedClaimItems(self)
+
+    def __getitem__(self, user):
+        start, end = self.tree.index[user]
+        if self._fp is None:
+            self._fp = open(self.tree.path, "rb")
+        self._fp.seek(start)
+        return json.loads(self._fp.read(end - start))
+
+    def __contains__(self, user):
+        return user in self.tree.index
+
+    def __iter__(self):
+        if self.tree._index is not None:
+            return iter(self.tree._index)
+        return (user for user, _ in self.items())
+
+    def __len__(self):
+        return len(self.tree.index)
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+class TreeFile(Mapping):
+    """
+    A rewards tree file read lazily in place of json.load. The other fields
+    and an index of claim offsets are read in one pass the first time they
+    are needed, the claims themselves stay in the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.claims = TreeFileClaims(self)
+        self._fields = None
+        self._index = None
+
+    def scan(self):
+        fields = {}
+        index = {}
+        with open(self.path, "rb") as fp:
+            for event in iter_tree(fp):
+                if event[0] == "claim":
+                    index[event[1]] = (event[3], event[4])
+                else:
+                    fields[event[1]] = event[2]
+        self._fields = fields
+        self._index = index
+
+    @property
+    def fields(self):
+        if self._fields is None:
+            self.scan()
+        return self._fields
+
+    @property
+    def index(self):
+        if self._index is None:
+            self.scan()
+        return self._index
+
+    def __getitem__(self, key):
+        if key == CLAIMS:
+            return self.claims
+        return self.fields[key]
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def close(self):
+        self.claims.close()
+
+
+def load_tree(path):
+    return TreeFile(path)
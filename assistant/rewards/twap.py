@@ -1,6 +1,7 @@
 from brownie import *
 from rich.console import Console
 from statistics import mean
+from assistant.rewards.block_cache import block_timestamps
 
 diggBTCOracleContract = "0xe49ca29a3ad94713fc14f065125e74906a6503bb"
 console = Console()
@@ -14,8 +15,7 @@ TARGET = 1.0
 
 
 def digg_btc_twap(start, end):
-    startTimestamp = web3.eth.getBlock(start)["timestamp"]
-    endTimestamp = web3.eth.getBlock(end)["timestamp"]
+    startTimestamp, endTimestamp = block_timestamps([start, end])
     diggBTCOracle = Contract.from_explorer(diggBTCOracleContract)
     latestRound = diggBTCOracle.latestRound()
     ratios = []
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from config.env_config import env_config
+from graphql import print_ast
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def query_hash(query):
+    return _sha256(print_ast(query))
+
+
+class QueryCache:
+    """
+    Content addressed on-disk cache for subgraph results of queries pinned to a block.
+    Data at a fixed block height never changes, so entries are only dropped
+    (least recently used first) to keep the cache under maxBytes
+    """
+
+    def __init__(self, directory, maxBytes):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.size = sum(os.path.getsize(path) for path in self._entries())
+
+    def key(self, subgraph, query, variables, block):
+        queryHash = query_hash(query)
+        return _sha256(
+            json.dumps(
+                {
+                    "subgraph": subgraph,
+                    "query": queryHash,
+                    "variables": variables,
+                    "block": block,
+                },
+                sort_keys=True,
+            )
+        )
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        # Bump the access time used for eviction
+        os.utime(path)
+        return result
+
+    def put(self, key, result):
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        data = json.dumps(result)
+        # A unique temporary file, other processes may be writing the same key
+        fd, tmpPath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        try:
+            self.size -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        os.replace(tmpPath, path)
+        self.size += len(data)
+        if self.size > self.maxBytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is at 90% of maxBytes
+        """
+        entries = sorted(self._entries(), key=os.path.getmtime)
+        target = self.maxBytes * 0.9
+        for path in entries:
+            if self.size <= target:
+                break
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _entries(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(self.directory)
+            for name in names
+            if name.endswith(".json")
+        ]
+
+
+_query_cache = None
+
+
+def query_cache():
+    """
+    The shared on-disk cache, None when disabled. Opened on first use, as
+    opening it sizes every entry
+    """
+    global _query_cache
+    if _query_cache is None and env_config.subgraph_cache:
+        _query_cache = QueryCache(
+            env_config.subgraph_cache_dir, env_config.subgraph_cache_max_bytes
+        )
+    return _query_cache
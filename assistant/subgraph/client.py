@@ -1,5 +1,9 @@
+import asyncio
+
+from assistant.rewards.classes.InputBundle import inputBundle
 from assistant.subgraph.config import subgraph_config
-from assistant.subgraph.utils import make_gql_client
+from assistant.subgraph.utils import execute_query, make_gql_client
+from assistant.subgraph.sessions import memoized, paginate, run_query
 from brownie import interface
 from rich.console import Console
 from gql import gql, Client
@@ -22,7 +26,7 @@ harvests_transport = AIOHTTPTransport(url=harvest_subgraph_url)
 harvests_client = Client(transport=harvests_transport)
 
 
-def fetch_tree_distributions(startBlock, endBlock):
+async def fetch_tree_distributions_async(sessions, startBlock, endBlock):
     query = gql(
         """
         query tree_distributions(
@@ -41,24 +45,28 @@ def fetch_tree_distributions(startBlock, endBlock):
             }
         """
     )
-    lastDistId = "0x0000000000000000000000000000000000000000"
     variables = {"blockHeight": {"number": endBlock}}
     treeDistributions = []
-    while True:
-        variables["lastDistId"] = {"id_gt": lastDistId}
-        results = harvests_client.execute(query, variable_values=variables)
-        distData = results["treeDistributions"]
-        if len(distData) == 0:
-            break
-        else:
-            treeDistributions = [*treeDistributions, *distData]
-        if len(distData) > 0:
-            lastDistId = distData[-1]["id"]
+    async for distData in paginate(
+        sessions,
+        "harvests",
+        query,
+        variables,
+        lambda lastDistId: {"lastDistId": {"id_gt": lastDistId}},
+        lambda results: results["treeDistributions"],
+        lastId="0x0000000000000000000000000000000000000000",
+        block=endBlock,
+    ):
+        treeDistributions = [*treeDistributions, *distData]
     return [td for td in treeDistributions if int(td["blockNumber"]) > int(startBlock)]
 
 
-@lru_cache(maxsize=None)
-def fetch_sett_balances(key, settId, startBlock):
+def fetch_tree_distributions(startBlock, endBlock):
+    return run_query(fetch_tree_distributions_async, startBlock, endBlock)
+
+
+@memoized
+async def fetch_sett_balances_async(sessions, key, settId, startBlock):
     query = gql(
         """
         query balances_and_events($vaultID: Vault_filter, $blockHeight: Block_height,$lastBalanceId:AccountVaultBalance_filter) {
@@ -74,34 +82,121 @@ def fetch_sett_balances(key, settId, startBlock):
             }
         """
     )
-    lastBalanceId = ""
     variables = {"blockHeight": {"number": startBlock}, "vaultID": {"id": settId}}
     balances = {}
-    while True:
-        variables["lastBalanceId"] = {"id_gt": lastBalanceId}
 
-        results = sett_client.execute(query, variable_values=variables)
+    def balances_page(results):
         if len(results["vaults"]) == 0:
-            return {}
+            return None
+        return results["vaults"][0]["balances"]
+
+    async for balance_data in paginate(
+        sessions,
+        "setts",
+        query,
+        variables,
+        lambda lastBalanceId: {"lastBalanceId": {"id_gt": lastBalanceId}},
+        balances_page,
+        block=startBlock,
+    ):
         newBalances = {}
-        balance_data = results["vaults"][0]["balances"]
         for result in balance_data:
             account = result["id"].split("-")[0]
             newBalances[account] = int(result["shareBalanceRaw"])
 
-        if len(balance_data) == 0:
-            break
-
-        if len(balance_data) > 0:
-            lastBalanceId = balance_data[-1]["id"]
-
         balances = {**newBalances, **balances}
     console.log("Processing {} balances".format(len(balances)))
     return balances
 
 
-@lru_cache(maxsize=None)
-def fetch_geyser_events(geyserId, startBlock):
+def fetch_sett_balances(key, settId, startBlock):
+    return run_query(fetch_sett_balances_async, key, settId, startBlock)
+
+
+# Vaults aliased into a single query, bigger documents slow down the subgraph
+VAULTS_PER_QUERY = 20
+
+
+def many_sett_balances_query(aliases):
+    params = "".join(
+        ", ${0}: Vault_filter, ${0}Last: AccountVaultBalance_filter".format(alias)
+        for alias in aliases
+    )
+    fields = "".join(
+        """
+            {0}: vaults(block: $blockHeight, where: ${0}) {{
+                balances(first:1000,where: ${0}Last) {{
+                    id
+                    account {{
+                        id
+                    }}
+                    shareBalanceRaw
+                }}
+            }}
+        """.format(
+            alias
+        )
+        for alias in aliases
+    )
+    return gql(
+        "query many_sett_balances($blockHeight: Block_height{}) {{{}}}".format(
+            params, fields
+        )
+    )
+
+
+async def fetch_many_sett_balances_async(sessions, vaults, startBlock):
+    """
+    Fetch balances for a dict of key -> vault address at one block, aliasing up to
+    VAULTS_PER_QUERY vaults into each query. Every alias pages independently and
+    drops out of the query once its balances are exhausted.
+    Results also fill the fetch_sett_balances_async cache
+    """
+    keys = list(vaults)
+    balances = {key: {} for key in keys}
+
+    async def fetch_chunk(chunk):
+        lastIds = {key: "" for key in chunk}
+        while lastIds:
+            aliases = {"v{}".format(i): key for i, key in enumerate(lastIds)}
+            variables = {"blockHeight": {"number": startBlock}}
+            for alias, key in aliases.items():
+                variables[alias] = {"id": vaults[key]}
+                variables[alias + "Last"] = {"id_gt": lastIds[key]}
+            results = await sessions.execute(
+                "setts", many_sett_balances_query(aliases), variables, startBlock
+            )
+
+            for alias, key in aliases.items():
+                page = results[alias][0]["balances"] if results[alias] else []
+                if len(page) == 0:
+                    del lastIds[key]
+                    continue
+                newBalances = {}
+                for result in page:
+                    account = result["id"].split("-")[0]
+                    newBalances[account] = int(result["shareBalanceRaw"])
+                balances[key] = {**newBalances, **balances[key]}
+                lastIds[key] = page[-1]["id"]
+
+    await asyncio.gather(
+        *[
+            fetch_chunk(keys[i : i + VAULTS_PER_QUERY])
+            for i in range(0, len(keys), VAULTS_PER_QUERY)
+        ]
+    )
+    for key in keys:
+        console.log("Processing {} balances".format(len(balances[key])))
+        fetch_sett_balances_async.cache[(key, vaults[key], startBlock)] = balances[key]
+    return balances
+
+
+def fetch_many_sett_balances(vaults, startBlock):
+    return run_query(fetch_many_sett_balances_async, vaults, startBlock)
+
+
+@memoized
+async def fetch_geyser_events_async(sessions, geyserId, startBlock):
     console.print(
         "[bold green] Fetching Geyser Events {}[/bold green]".format(geyserId)
     )
@@ -140,7 +235,7 @@ def fetch_geyser_events(geyserId, startBlock):
     while True:
         variables["lastStakedId"] = {"id_gt": lastStakedId}
         variables["lastUnstakedId"] = {"id_gt": lastUnstakedId}
-        result = sett_client.execute(query, variable_values=variables)
+        result = await sessions.execute("setts", query, variables, startBlock)
 
         if len(result["geysers"]) == 0:
             return {"stakes": [], "unstakes": [], "totalStaked": 0}
@@ -162,6 +257,10 @@ def fetch_geyser_events(geyserId, startBlock):
     return {"stakes": stakes, "unstakes": unstakes, "totalStaked": totalStaked}
 
 
+def fetch_geyser_events(geyserId, startBlock):
+    return run_query(fetch_geyser_events_async, geyserId, startBlock)
+
+
 @lru_cache(maxsize=None)
 def fetch_sett_transfers(settID, startBlock, endBlock):
     console.print(
@@ -201,7 +300,7 @@ def fetch_sett_transfers(settID, startBlock, endBlock):
     )
     variables = {"vaultID": {"id": settID}, "blockHeight": {"number": endBlock}}
 
-    results = sett_client.execute(query, variable_values=variables)
+    results = execute_query(sett_client, "setts", query, variables)
 
     def filter_by_startBlock(transfer):
         return int(transfer["transaction"]["blockNumber"]) > startBlock
@@ -232,6 +331,9 @@ def fetch_sett_transfers(settID, startBlock, endBlock):
     )
 
 
+inputBundle.register_cache(fetch_sett_transfers.cache_clear)
+
+
 def fetch_farm_harvest_events():
     query = gql(
         """
@@ -247,7 +349,7 @@ def fetch_farm_harvest_events():
 
     """
     )
-    results = harvests_client.execute(query)
+    results = execute_query(harvests_client, "harvests", query)
     for event in results["farmHarvestEvents"]:
         event["rewardAmount"] = event.pop("farmToRewards")
 
@@ -271,7 +373,7 @@ def fetch_sushi_harvest_events():
         }
     """
     )
-    results = harvests_client.execute(query)
+    results = execute_query(harvests_client, "harvests", query)
     wbtcEthEvents = []
     wbtcBadgerEvents = []
     wbtcDiggEvents = []
@@ -296,8 +398,8 @@ def fetch_sushi_harvest_events():
     }
 
 
-@lru_cache(maxsize=None)
-def fetch_wallet_balances(sharesPerFragment, blockNumber):
+@memoized
+async def fetch_wallet_balances_async(sessions, sharesPerFragment, blockNumber):
     increment = 1000
     query = gql(
         """
@@ -314,53 +416,53 @@ def fetch_wallet_balances(sharesPerFragment, blockNumber):
     )
 
     ## Paginate this for more than 1000 balances
-    continueFetching = True
-    lastID = "0x0000000000000000000000000000000000000000"
+    variables = {
+        "firstAmount": increment,
+        "blockNumber": {"number": blockNumber},
+    }
 
     badger_balances = {}
     digg_balances = {}
     ibbtc_balances = {}
     console.log(sharesPerFragment)
-    while continueFetching:
-        variables = {
-            "firstAmount": increment,
-            "lastID": lastID,
-            "blockNumber": {"number": blockNumber},
-        }
-        nextPage = tokens_client.execute(query, variable_values=variables)
-        if len(nextPage["tokenBalances"]) == 0:
-            continueFetching = False
-        else:
-            lastID = nextPage["tokenBalances"][-1]["id"]
-            console.log(
-                "Fetching {} token balances".format(len(nextPage["tokenBalances"]))
-            )
-            for entry in nextPage["tokenBalances"]:
-                address = entry["id"].split("-")[0]
-                amount = float(entry["balance"])
-                if amount > 0:
-                    if entry["token"]["symbol"] == "BADGER":
-                        badger_balances[address] = amount / 1e18
-                    if entry["token"]["symbol"] == "DIGG":
-                        # Speed this up
-                        if entry["balance"] == 0:
-                            fragmentBalance = 0
-                        else:
-                            fragmentBalance = sharesPerFragment / amount
-                        digg_balances[address] = float(fragmentBalance) / 1e9
-                    if entry["token"]["symbol"] == "ibBTC":
-                        if (
-                            address
-                            == "0x18d98D452072Ac2EB7b74ce3DB723374360539f1".lower()
-                        ):
-                            # Ignore sushiswap pool
-                            ibbtc_balances[address] = 0
-                        else:
-                            ibbtc_balances[address] = amount / 1e18
+    async for tokenBalances in paginate(
+        sessions,
+        "tokens",
+        query,
+        variables,
+        lambda lastID: {"lastID": lastID},
+        lambda nextPage: nextPage["tokenBalances"],
+        lastId="0x0000000000000000000000000000000000000000",
+        block=blockNumber,
+    ):
+        console.log("Fetching {} token balances".format(len(tokenBalances)))
+        for entry in tokenBalances:
+            address = entry["id"].split("-")[0]
+            amount = float(entry["balance"])
+            if amount > 0:
+                if entry["token"]["symbol"] == "BADGER":
+                    badger_balances[address] = amount / 1e18
+                if entry["token"]["symbol"] == "DIGG":
+                    # Speed this up
+                    if entry["balance"] == 0:
+                        fragmentBalance = 0
+                    else:
+                        fragmentBalance = sharesPerFragment / amount
+                    digg_balances[address] = float(fragmentBalance) / 1e9
+                if entry["token"]["symbol"] == "ibBTC":
+                    if address == "0x18d98D452072Ac2EB7b74ce3DB723374360539f1".lower():
+                        # Ignore sushiswap pool
+                        ibbtc_balances[address] = 0
+                    else:
+                        ibbtc_balances[address] = amount / 1e18
 
     return badger_balances, digg_balances, ibbtc_balances
 
 
+def fetch_wallet_balances(sharesPerFragment, blockNumber):
+    return run_query(fetch_wallet_balances_async, sharesPerFragment, blockNumber)
+
+
 def fetch_cream_balances(tokenSymbol, blockNumber):
     cream_transport = AIOHTTPTransport(url=subgraph_config["cream_url"])
     cream_sett_client = Client(
@@ -407,7 +509,7 @@ def fetch_cream_balances(tokenSymbol, blockNumber):
             "symbol": tokenSymbol,
             "blockNumber": {"number": blockNumber},
         }
-        nextPage = cream_sett_client.execute(query, variable_values=variables)
+        nextPage = execute_query(cream_sett_client, "cream_url", query, variables)
         if len(nextPage["accountCTokens"]) == 0:
             if len(nextPage["markets"]) == 0:
                 console.log("No Cream deposits found for {}".format(tokenSymbol))
@@ -0,0 +1,171 @@
+import asyncio
+import atexit
+from functools import wraps
+
+from assistant.rewards.classes.InputBundle import inputBundle
+from assistant.rewards.classes.RewardsProfile import rewardsProfile
+from assistant.subgraph.cache import query_cache, query_hash
+from assistant.subgraph.config import subgraph_config
+from gql import Client
+from gql.transport.aiohttp import AIOHTTPTransport
+
+# Upper bound on requests in flight across all subgraphs
+MAX_CONCURRENT_QUERIES = 8
+# Subgraphs whose clients validate queries against the introspected schema,
+# the others skip that round trip
+SCHEMA_SUBGRAPHS = {"tokens", "setts"}
+
+
+class SubgraphSessions:
+    """
+    One connected gql session (and aiohttp connection pool) per subgraph,
+    shared by every query run inside the same event loop. Schemas are
+    fetched once, when a subgraph's session connects
+    """
+
+    def __init__(self, concurrency=MAX_CONCURRENT_QUERIES, cache=None):
+        self.concurrency = concurrency
+        self.cache = query_cache() if cache is None else cache
+        self._clients = {}
+        self._sessions = {}
+        self._lock = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self._lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        for client in self._clients.values():
+            await client.__aexit__(None, None, None)
+        self._clients = {}
+        self._sessions = {}
+
+    async def session(self, name):
+        async with self._lock:
+            if name not in self._sessions:
+                transport = AIOHTTPTransport(url=subgraph_config[name])
+                client = Client(
+                    transport=transport,
+                    fetch_schema_from_transport=name in SCHEMA_SUBGRAPHS,
+                )
+                self._sessions[name] = await client.__aenter__()
+                self._clients[name] = client
+        return self._sessions[name]
+
+    async def execute(self, name, query, variables=None, block=None):
+        """
+        Results of queries pinned to a block are immutable and go through the
+        on-disk cache, unpinned queries (block=None) always hit the subgraph.
+        Results are recorded into (or replayed from) the cycle's input bundle
+        """
+        inputArgs = (name, query_hash(query), variables, block)
+        if inputBundle.replaying:
+            return inputBundle.replayed("subgraph", *inputArgs)
+
+        key = None
+        if block is not None and self.cache is not None:
+            key = self.cache.key(name, query, variables, block)
+            result = self.cache.get(key)
+            if result is not None:
+                rewardsProfile.count("subgraph.cache_hits")
+                return inputBundle.captured(result, "subgraph", *inputArgs)
+
+        session = await self.session(name)
+        async with self._semaphore:
+            result = await session.execute(query, variable_values=variables)
+        rewardsProfile.count("subgraph.pages")
+
+        if key is not None:
+            self.cache.put(key, result)
+        return inputBundle.captured(result, "subgraph", *inputArgs)
+
+
+async def paginate(
+    sessions, name, query, variables, cursor, page, lastId="", block=None
+):
+    """
+    Yield pages of entities ordered by id until an empty page comes back.
+    cursor(lastId) returns the variables selecting the next page and
+    page(result) the list of entities in a result
+    """
+    while True:
+        result = await sessions.execute(
+            name, query, {**variables, **cursor(lastId)}, block
+        )
+        entities = page(result)
+        if not entities:
+            return
+        yield entities
+        lastId = entities[-1]["id"]
+
+
+def memoized(fetch):
+    """
+    Cache the result of an async fetcher by its arguments (excluding the sessions)
+    """
+    cache = {}
+
+    @wraps(fetch)
+    async def wrapper(sessions, *args):
+        if args not in cache:
+            cache[args] = await fetch(sessions, *args)
+        return cache[args]
+
+    wrapper.cache = cache
+    # Cached results would bypass the cycle's input bundle
+    inputBundle.register_cache(cache.clear)
+    return wrapper
+
+
+class SessionLoop:
+    """
+    An event loop with one SubgraphSessions open on it, kept for the life
+    of the process so every sync fetch reuses the same connections
+    """
+
+    def __init__(self, concurrency=MAX_CONCURRENT_QUERIES):
+        self.loop = asyncio.new_event_loop()
+        self.sessions = SubgraphSessions(concurrency)
+        self.run(self.sessions.__aenter__())
+
+    def run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def close(self):
+        self.run(self.sessions.__aexit__(None, None, None))
+        self.loop.close()
+
+
+_session_loop = None
+
+
+def session_loop():
+    """
+    The process wide SessionLoop, opened on first use
+    """
+    global _session_loop
+    if _session_loop is None:
+        _session_loop = SessionLoop()
+        atexit.register(_session_loop.close)
+    return _session_loop
+
+
+def run_query(fetch, *args):
+    return run_queries([(fetch, args)])[0]
+
+
+def run_queries(calls):
+    """
+    Run a list of (async fetcher, args) concurrently over the shared sessions,
+    returning their results in order
+    """
+    shared = session_loop()
+
+    async def run():
+        return await asyncio.gather(
+            *[fetch(shared.sessions, *args) for fetch, args in calls]
+        )
+
+    return shared.run(run())
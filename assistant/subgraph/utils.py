@@ -1,3 +1,5 @@
+from assistant.rewards.classes.InputBundle import inputBundle
+from assistant.subgraph.cache import query_hash
 from assistant.subgraph.config import subgraph_config
 from gql import Client
 from gql.transport.aiohttp import AIOHTTPTransport
@@ -7,3 +9,18 @@ def make_gql_client(name):
     subgraph_url = subgraph_config[name]
     transport = AIOHTTPTransport(url=subgraph_url)
     return Client(transport=transport, fetch_schema_from_transport=True)
+
+
+def execute_query(client, name, query, variables=None):
+    """
+    Run a query on a synchronous client, recorded into (or replayed from)
+    the cycle's input bundle like SubgraphSessions.execute
+    """
+    return inputBundle.fetch(
+        lambda: client.execute(query, variable_values=variables),
+        "subgraph",
+        name,
+        query_hash(query),
+        variables,
+        None,
+    )
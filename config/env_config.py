@@ -11,6 +11,40 @@ class EnvConfig:
             "AWS_SECRET_ACCESS_KEY", default=""
         )
         self.debug = debug
+        # On-disk cache for subgraph queries pinned to a block
+        self.subgraph_cache = decouple.config("SUBGRAPH_CACHE", default=True, cast=bool)
+        self.subgraph_cache_dir = decouple.config(
+            "SUBGRAPH_CACHE_DIR", default=".cache/subgraph"
+        )
+        self.subgraph_cache_max_bytes = decouple.config(
+            "SUBGRAPH_CACHE_MAX_BYTES", default=2 * 1024 ** 3, cast=int
+        )
+        # SQLite database of locally indexed contract events
+        self.indexer_db = decouple.config("INDEXER_DB", default=".cache/indexer.sqlite")
+        # SQLite file of finalized block headers, empty to keep them in memory only
+        self.block_cache_db = decouple.config(
+            "BLOCK_CACHE_DB", default=".cache/blocks.sqlite"
+        )
+        # Downloaded rewards trees, named by content hash
+        self.tree_cache_dir = decouple.config("TREE_CACHE_DIR", default=".cache/trees")
+        # Merkle layers of the last cycles built, reused when a cycle is rebuilt
+        self.merkle_layers_dir = decouple.config(
+            "MERKLE_LAYERS_DIR", default=".cache/merkle-layers"
+        )
+        self.merkle_layers_keep = decouple.config(
+            "MERKLE_LAYERS_KEEP", default=5, cast=int
+        )
+        # Compact cumulative claims of the trees built, read by the next cycle
+        self.ledger_dir = decouple.config("LEDGER_DIR", default=".cache/ledgers")
+        self.ledger_keep = decouple.config("LEDGER_KEEP", default=10, cast=int)
+        # Recorded cycle inputs, named by content hash
+        self.input_bundle_dir = decouple.config(
+            "INPUT_BUNDLE_DIR", default=".cache/inputs"
+        )
+        # Bundles kept there, older ones are removed as new ones are saved
+        self.input_bundle_keep = decouple.config(
+            "INPUT_BUNDLE_KEEP", default=100, cast=int
+        )
 
 
 env_config = EnvConfig()
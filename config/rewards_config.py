@@ -7,6 +7,10 @@ class RewardsConfig:
         self.rootUpdateMinInterval = hours(0.9)
         self.maxStartBlockAge = 3200
         self.debug = False
+        # Hand out the wei lost to float rounding in snapshot distributions
+        self.exactDistribution = False
+        # Processes used to compute sett snapshots, 1 computes them in-process
+        self.snapshotWorkers = 1
 
 
 rewards_config = RewardsConfig()
@@ -0,0 +1,52 @@
+import random
+import time
+
+from rich.console import Console
+from assistant.rewards.boost_calc import balance_column, calc_boosts, usd_balances
+from assistant.rewards.addresses import AddressTable
+from assistant.rewards.classes.UserBalance import UserBalance, UserBalances
+
+console = Console()
+
+ADDRESSES = 200000
+
+
+def synthetic_balances(rng, addresses, share, token):
+    """
+    USD balances for a random share of the addresses, dust included
+    """
+    users = rng.sample(addresses, int(len(addresses) * share))
+    balances = usd_balances([rng.getrandbits(72) for _ in users], 0.5, 40.0, 18)
+    return UserBalances(
+        [UserBalance(addr, bal, token) for addr, bal in zip(users, balances.tolist())]
+    )
+
+
+def main(addresses=ADDRESSES, seed=0):
+    rng = random.Random(seed)
+    addresses = ["0x{:040x}".format(rng.getrandbits(160)) for _ in range(addresses)]
+    diggSetts = synthetic_balances(rng, addresses, 0.1, "digg")
+    badgerSetts = synthetic_balances(rng, addresses, 0.4, "badger")
+    nonNativeSetts = synthetic_balances(rng, addresses, 0.8, "sett")
+
+    start = time.perf_counter()
+    table = AddressTable()
+    columns = [
+        balance_column(table, balances)
+        for balances in (diggSetts, badgerSetts, nonNativeSetts)
+    ]
+    columnsTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    badgerBoost, boostInfo = calc_boosts(table.addresses, *columns)
+    boostTime = time.perf_counter() - start
+
+    console.log(
+        "{} addresses, {} boosted: columns {:.3f}s, boosts {:.3f}s".format(
+            len(boostInfo), len(badgerBoost), columnsTime, boostTime
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
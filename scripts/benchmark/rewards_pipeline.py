@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import time
+
+from rich.console import Console
+from tabulate import tabulate
+from assistant.rewards.boost_calc import balance_column, calc_boosts
+from assistant.rewards.calc_snapshot import SnapshotInputs, compute_snapshots
+from assistant.rewards.addresses import AddressTable, checksum_address
+from assistant.rewards.classes.MerkleTree import rewards_to_merkle_tree
+from assistant.rewards.classes.RewardsList import RewardsList
+from assistant.rewards.classes.RewardsProfile import RewardsProfile
+from assistant.rewards.classes.UserBalance import UserBalances
+from assistant.rewards.distribution import distribute
+from assistant.rewards.rewards_utils import combine_rewards, process_cumulative_rewards
+from helpers.constants import BADGER, DIGG, NON_NATIVE_SETTS
+
+"""
+Synthetic rewards cycles for benchmarking the rewards engine without mainnet
+or the subgraph. Stand-in balances, harvests and past trees drive the same
+code the rewards assistant runs, each step timed as a stage. Results are
+appended to RESULTS_FILE and compared with the last run of the same size
+"""
+
+console = Console()
+
+RESULTS_FILE = "benchmarks/rewards_pipeline.jsonl"
+
+
+def random_address(rng):
+    return checksum_address("0x{:040x}".format(rng.getrandbits(160)))
+
+
+class SyntheticCycle:
+    """
+    Stand-in data sources for one cycle: users holding sett shares, harvests
+    to distribute and the tree of the previous cycle
+    """
+
+    def __init__(self, users, setts, harvests, pastUsers, seed=0):
+        rng = random.Random(seed)
+        self.users = [random_address(rng) for _ in range(max(users, pastUsers))]
+        self.tokens = [BADGER, DIGG] + [random_address(rng) for _ in range(4)]
+        self.settNames = [
+            NON_NATIVE_SETTS[i % len(NON_NATIVE_SETTS)]
+            if i % 2 == 0
+            else "native.synthetic{}".format(i)
+            for i in range(setts)
+        ]
+        self.settBalances = {}
+        for name in self.settNames:
+            holders = rng.sample(self.users[:users], max(1, users // 4))
+            self.settBalances[name] = UserBalances.from_columns(
+                [h.lower() for h in holders],
+                [rng.getrandbits(80) for _ in holders],
+                [name] * len(holders),
+                [["", "native"]] * len(holders),
+            )
+        self.harvests = [
+            (rng.choice(self.settNames), rng.choice(self.tokens), rng.getrandbits(75))
+            for _ in range(harvests)
+        ]
+        self.pastClaims = {
+            user: {
+                "tokens": self.tokens[:3],
+                "cumulativeAmounts": [str(rng.getrandbits(72)) for _ in range(3)],
+            }
+            for user in self.users[:pastUsers]
+        }
+        self.boostColumns = self._boost_columns(rng, users)
+
+    def _boost_columns(self, rng, users):
+        self.boostTable = AddressTable()
+        columns = []
+        for share in (0.1, 0.4, 0.8):
+            holders = rng.sample(self.users[:users], int(users * share))
+            balances = UserBalances.from_columns(
+                [h.lower() for h in holders],
+                [rng.random() * 1e5 for _ in holders],
+                [""] * len(holders),
+                [[]] * len(holders),
+            )
+            columns.append(balance_column(self.boostTable, balances))
+        return columns
+
+    def snapshot_inputs(self):
+        return [
+            SnapshotInputs(name, self.settBalances[name], [(BADGER, 10 ** 23)])
+            for name in self.settNames
+        ]
+
+    def harvest_rewards(self, cycle):
+        rewards = RewardsList(cycle, None)
+        for name, token, amount in self.harvests:
+            balances = self.settBalances[name]
+            rewards.increase_users_rewards(
+                [checksum_address(a) for a in balances.addresses],
+                token,
+                distribute(balances.balances, amount),
+            )
+        return rewards
+
+
+def run_cycle(synthetic, workers=1, cycle=2):
+    profile = RewardsProfile()
+    with profile.stage("boost"):
+        boosts, _ = calc_boosts(synthetic.boostTable.addresses, *synthetic.boostColumns)
+    with profile.stage("snapshots"):
+        snapshots = compute_snapshots(
+            synthetic.snapshot_inputs(), cycle, boosts, {}, workers
+        )
+    with profile.stage("harvests"):
+        harvestRewards = synthetic.harvest_rewards(cycle)
+    with profile.stage("combine rewards"):
+        newRewards = combine_rewards(
+            [rewards for rewards, _ in snapshots] + [harvestRewards], cycle, None
+        )
+    with profile.stage("cumulative rewards"):
+        cumulative = process_cumulative_rewards(
+            {"claims": synthetic.pastClaims}, newRewards
+        )
+    with profile.stage("merkle tree and proofs"):
+        tree = rewards_to_merkle_tree(cumulative, 0, 1, {})
+    profile.count("claims", len(tree["claims"]))
+    return profile
+
+
+def git_revision():
+    try:
+        return (
+            subprocess.check_output(["git", "rev-parse", "--short", "HEAD"])
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(path, params):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    return [r for r in results if r["params"] == params]
+
+
+def main(users=20000, setts=12, harvests=20, pastUsers=30000, workers=1, seed=0):
+    params = {
+        "users": int(users),
+        "setts": int(setts),
+        "harvests": int(harvests),
+        "pastUsers": int(pastUsers),
+        "workers": int(workers),
+        "seed": int(seed),
+    }
+    console.log("Generating synthetic cycle {}".format(params))
+    synthetic = SyntheticCycle(
+        params["users"],
+        params["setts"],
+        params["harvests"],
+        params["pastUsers"],
+        params["seed"],
+    )
+
+    start = time.perf_counter()
+    profile = run_cycle(synthetic, params["workers"])
+    total = time.perf_counter() - start
+    claims = profile.counts["claims"]
+    stages = {
+        stage["name"]: {
+            "seconds": stage["seconds"],
+            "claimsPerSecond": claims / stage["seconds"] if stage["seconds"] else None,
+            "maxRssMb": stage["maxRssMb"],
+        }
+        for stage in profile.stages
+    }
+    result = {
+        "revision": git_revision(),
+        "time": int(time.time()),
+        "params": params,
+        "claims": claims,
+        "seconds": total,
+        "stages": stages,
+    }
+
+    previous = load_results(RESULTS_FILE, params)
+    last = previous[-1] if previous else None
+    table = []
+    for name, stage in stages.items():
+        before = last["stages"].get(name) if last else None
+        table.append(
+            [
+                name,
+                "{:.3f}".format(stage["seconds"]),
+                "{:,.0f}".format(stage["claimsPerSecond"] or 0),
+                "{:.0f}".format(stage["maxRssMb"]),
+                "{:.3f}".format(before["seconds"]) if before else "",
+                "{:+.0%}".format(stage["seconds"] / before["seconds"] - 1)
+                if before and before["seconds"]
+                else "",
+            ]
+        )
+    print(
+        tabulate(
+            table,
+            headers=[
+                "stage",
+                "seconds",
+                "claims/s",
+                "max rss (MB)",
+                "last run ({})".format(last["revision"]) if last else "last run",
+                "change",
+            ],
+        )
+    )
+    console.log("{} claims in {:.2f}s".format(claims, total))
+
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, "a") as f:
+        f.write(json.dumps(result) + "\n")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic rewards cycle benchmark")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--setts", type=int, default=12)
+    parser.add_argument("--harvests", type=int, default=20)
+    parser.add_argument("--past-users", type=int, default=30000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(
+        args.users, args.setts, args.harvests, args.past_users, args.workers, args.seed
+    )
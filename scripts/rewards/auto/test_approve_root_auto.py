@@ -10,6 +10,7 @@ from assistant.rewards.rewards_assistant import (
     run_action,
 )
 from assistant.rewards.rewards_checker import verify_rewards
+from assistant.rewards.tree_io import dump_tree
 from brownie import *
 from config.badger_config import badger_config
 from helpers.gas_utils import gas_strategies
@@ -52,8 +53,7 @@ def approve_root(badger: BadgerSystem):
     contentFileName = content_hash_to_filename(rootHash)
     print("Uploading to file " + contentFileName)
 
-    with open(contentFileName, "w") as outfile:
-        json.dump(proposedRewards, outfile, indent=4)
+    dump_tree(proposedRewards, contentFileName)
 
     with open(contentFileName) as f:
         after_file = json.load(f)
@@ -0,0 +1,17 @@
+from rich.console import Console
+
+from assistant.rewards.tree_binary import binary_to_json, json_to_binary
+
+console = Console()
+
+
+def main(source, target):
+    """
+    Convert a rewards tree between JSON and the binary format, by extension:
+    brownie run scripts/rewards/convert_tree.py main rewards.json rewards.tree
+    """
+    if source.endswith(".json"):
+        json_to_binary(source, target)
+    else:
+        binary_to_json(source, target)
+    console.print("Converted {} to {}".format(source, target))
@@ -0,0 +1,15 @@
+from rich.console import Console
+
+from assistant.rewards.proof_index import open_proof_index
+
+console = Console()
+
+
+def main(prefix, address):
+    """
+    Print one user's claim and proof from the proof index of a tree:
+    brownie run scripts/rewards/get_claim.py main rewards-1-0x... 0x...
+    """
+    index = open_proof_index(prefix)
+    console.print(index.get_claim(address))
+    index.close()
@@ -0,0 +1,62 @@
+from rich.console import Console
+from tabulate import tabulate
+
+from assistant.rewards.aws_utils import download_tree_file
+from assistant.rewards.classes.InputBundle import (
+    canonical_json,
+    diff_bundles,
+    load_bundle,
+)
+from assistant.rewards.rewards_assistant import generate_rewards_in_range
+from assistant.rewards.tree_io import load_tree
+from config.badger_config import badger_config
+from scripts.systems.badger_system import connect_badger
+
+console = Console()
+
+
+def input_row(change, entry):
+    args = canonical_json(entry["args"])
+    return [change, entry["kind"], args if len(args) <= 100 else args[:97] + "..."]
+
+
+def print_bundle_diff(before, after):
+    diff = diff_bundles(before, after)
+    rows = [input_row("changed", e) for e in diff["changed"]]
+    rows += [input_row("only in first", e) for e in diff["onlyBefore"]]
+    rows += [input_row("only in second", e) for e in diff["onlyAfter"]]
+    console.print(
+        "{} inputs differ between {} and {}".format(
+            len(rows), before["hash"], after["hash"]
+        )
+    )
+    if rows:
+        print(tabulate(rows, headers=["", "input", "arguments"]))
+
+
+def main(bundlePath, otherBundlePath=""):
+    """
+    Replay a recorded rewards cycle from its input bundle and print the root
+    it produces, without subgraph, API or chain reads:
+    brownie run scripts/rewards/replay_cycle.py main .cache/inputs/inputs-....json.gz
+    With a second bundle of the same cycle (the guardian's, or one recorded
+    later) the inputs that differ between the two are listed first
+    """
+    inputs = load_bundle(bundlePath)
+    if otherBundlePath:
+        print_bundle_diff(inputs, load_bundle(otherBundlePath))
+
+    badger = connect_badger(badger_config.prod_json)
+    meta = inputs["meta"]
+    pastRewards = load_tree(download_tree_file(meta["pastRewards"]))
+    rewards_data = generate_rewards_in_range(
+        badger, meta["startBlock"], meta["endBlock"], pastRewards, False, inputs
+    )
+    pastRewards.close()
+    console.print(
+        {
+            "merkleRoot": rewards_data["merkleTree"]["merkleRoot"],
+            "rootHash": str(rewards_data["rootHash"]),
+            "cycle": rewards_data["merkleTree"]["cycle"],
+        }
+    )
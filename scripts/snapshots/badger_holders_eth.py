@@ -8,20 +8,14 @@ def main():
     block = 12428803
     badger = connect_badger()
 
-    bbadger = list(
-        calculate_sett_balances(badger, "native.badger", block).userBalances.keys()
-    )
+    bbadger = list(calculate_sett_balances(badger, "native.badger", block).addresses)
 
     uniBadger = list(
-        calculate_sett_balances(
-            badger, "native.uniBadgerWbtc", block
-        ).userBalances.keys()
+        calculate_sett_balances(badger, "native.uniBadgerWbtc", block).addresses
     )
 
     sushiBadger = list(
-        calculate_sett_balances(
-            badger, "native.sushiBadgerWbtc", block
-        ).userBalances.keys()
+        calculate_sett_balances(badger, "native.sushiBadgerWbtc", block).addresses
     )
 
     badger_holders, digg_holders = fetch_wallet_balances(1, 1, badger.digg, block)
@@ -0,0 +1,17 @@
+from assistant.rewards.addresses import (
+    addressTable,
+    checksum_address,
+    intern_address,
+    lower_address,
+)
+
+BADGER = "0x3472A5A71965499acd81997a54BBA8D852C6E53d"
+
+
+def test_every_spelling_interns_to_the_same_address():
+    forms = [intern_address(a) for a in (BADGER, BADGER.lower(), BADGER.upper())]
+
+    assert len(set(forms)) == 1
+    assert checksum_address(BADGER.lower()) == BADGER
+    assert lower_address(BADGER) == BADGER.lower()
+    assert addressTable.addresses[forms[0].id] == BADGER
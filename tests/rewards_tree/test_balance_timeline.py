@@ -0,0 +1,191 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+from hexbytes import HexBytes
+
+from assistant.rewards import balance_timeline
+from assistant.rewards.balance_timeline import (
+    TRANSFER_TOPIC,
+    ZERO_ADDRESS,
+    SettBalanceTimeline,
+    subgraph_order,
+)
+from assistant.subgraph.client import fetch_sett_balances_async
+from tests.rewards_tree.tree_helpers import random_address
+
+SETT = "0x" + "5e" * 20
+GEYSER = "0x" + "9e" * 20
+
+
+class Badger:
+    def getSett(self, name):
+        return SimpleNamespace(address=SETT)
+
+    def getGeyser(self, name):
+        return SimpleNamespace(address=GEYSER)
+
+
+def topic(address):
+    return HexBytes(bytes(12) + bytes.fromhex(address[2:]))
+
+
+class Chain:
+    """
+    Transfer logs of the sett token and its balances at every block
+    """
+
+    def __init__(self, seed, blocks):
+        rng = random.Random(seed)
+        holders = [random_address(rng) for _ in range(8)]
+        balances = {}
+        self.logs = []
+        self.balances = {}
+        for block in blocks:
+            for logIndex in range(rng.randint(0, 4)):
+                holding = [h for h in holders if balances.get(h, 0) > 0]
+                kind = rng.choice(["mint", "burn", "transfer"]) if holding else "mint"
+                sender = ZERO_ADDRESS if kind == "mint" else rng.choice(holding)
+                recipient = ZERO_ADDRESS if kind == "burn" else rng.choice(holders)
+                if kind == "mint":
+                    value = rng.getrandbits(100)
+                else:
+                    value = rng.randint(1, balances[sender])
+                if sender != ZERO_ADDRESS:
+                    balances[sender] -= value
+                if recipient != ZERO_ADDRESS:
+                    balances[recipient] = balances.get(recipient, 0) + value
+                self.logs.append(
+                    {
+                        "blockNumber": block,
+                        "logIndex": logIndex,
+                        "topics": [
+                            HexBytes(TRANSFER_TOPIC),
+                            topic(sender),
+                            topic(recipient),
+                        ],
+                        "data": "0x{:064x}".format(value),
+                    }
+                )
+            self.balances[block] = dict(balances)
+        self.eth = self
+
+    def getLogs(self, params):
+        assert params["topics"] == [TRANSFER_TOPIC]
+        logs = [
+            log
+            for log in self.logs
+            if params["fromBlock"] <= log["blockNumber"] <= params["toBlock"]
+        ]
+        # Providers don't promise any order
+        return list(reversed(logs))
+
+    def toChecksumAddress(self, address):
+        return address
+
+    def sett_balances(self, key, settId, block):
+        return subgraph_order(self.balances[block])
+
+
+def timeline(monkeypatch, chain, blocks, geyserEvents=None):
+    monkeypatch.setattr(balance_timeline, "web3", chain)
+    monkeypatch.setattr(balance_timeline, "LOG_BLOCK_RANGE", 3)
+    monkeypatch.setattr(balance_timeline, "fetch_sett_balances", chain.sett_balances)
+    monkeypatch.setattr(
+        balance_timeline,
+        "fetch_geyser_events",
+        lambda geyser, block: geyserEvents or {"stakes": [], "unstakes": []},
+    )
+    monkeypatch.setattr(balance_timeline, "block_timestamp", lambda block: block * 10)
+    monkeypatch.setattr(
+        balance_timeline,
+        "build_sett_balances",
+        lambda badger, name, settBalances, geyserBalances: (
+            settBalances,
+            geyserBalances,
+        ),
+    )
+    return SettBalanceTimeline(Badger(), "native.badger", blocks)
+
+
+def test_replayed_transfers_match_balances_at_each_block(monkeypatch):
+    blocks = list(range(100, 130))
+    chain = Chain(1, blocks)
+    kinds = {(log["topics"][1], log["topics"][2]) for log in chain.logs}
+    assert any(sender == topic(ZERO_ADDRESS) for sender, _ in kinds)
+    assert any(recipient == topic(ZERO_ADDRESS) for _, recipient in kinds)
+
+    settTimeline = timeline(monkeypatch, chain, blocks[::3] + [blocks[-1]])
+    # Out of order lookups replay again from the snapshot
+    for block in reversed(settTimeline.blocks):
+        balances, _ = settTimeline.balances_at(block)
+        assert settTimeline.verified
+        assert list(balances.items()) == list(
+            subgraph_order(chain.balances[block]).items()
+        )
+
+
+def test_subgraph_order_matches_paged_balances():
+    rng = random.Random(2)
+    accounts = {random_address(rng): rng.getrandbits(90) for _ in range(2500)}
+
+    class Sessions:
+        async def execute(self, name, query, variables, block):
+            lastId = variables["lastBalanceId"]["id_gt"]
+            ids = sorted("{}-{}".format(account, SETT) for account in accounts)
+            page = [i for i in ids if i > lastId][:1000]
+            return {
+                "vaults": [
+                    {
+                        "balances": [
+                            {
+                                "id": i,
+                                "shareBalanceRaw": str(accounts[i.split("-")[0]]),
+                            }
+                            for i in page
+                        ]
+                    }
+                ]
+            }
+
+    balances = asyncio.run(
+        fetch_sett_balances_async.__wrapped__(Sessions(), "native.badger", SETT, 1)
+    )
+    assert list(balances.items()) == list(subgraph_order(accounts).items())
+
+
+def test_mismatch_falls_back_to_subgraph_balances(monkeypatch):
+    blocks = list(range(100, 110))
+    chain = Chain(3, blocks)
+    chain.balances[blocks[-1]][random_address(random.Random(4))] = 1
+    settTimeline = timeline(monkeypatch, chain, blocks)
+    calls = []
+    monkeypatch.setattr(
+        balance_timeline,
+        "calculate_sett_balances",
+        lambda badger, name, block: calls.append((name, block)) or "fetched",
+    )
+
+    assert settTimeline.balances_at(blocks[4]) == "fetched"
+    assert not settTimeline.verified
+    assert calls == [("native.badger", blocks[4])]
+
+
+def test_geyser_events_are_filtered_by_block_timestamp(monkeypatch):
+    blocks = [100, 101, 102]
+    user, other = "0x" + "aa" * 20, "0x" + "bb" * 20
+    geyserEvents = {
+        "stakes": [
+            {"user": user, "timestamp": "1000", "total": "5"},
+            {"user": other, "timestamp": "1013", "total": "7"},
+            {"user": user, "timestamp": "1020", "total": "9"},
+        ],
+        "unstakes": [{"user": other, "timestamp": "1015", "total": "2"}],
+    }
+    settTimeline = timeline(monkeypatch, Chain(5, blocks), blocks, geyserEvents)
+    timestamps = {100: 1005, 101: 1013, 102: 1019}
+    monkeypatch.setattr(balance_timeline, "block_timestamp", timestamps.__getitem__)
+
+    assert settTimeline.balances_at(100)[1] == {user: 5}
+    assert settTimeline.balances_at(101)[1] == {user: 5, other: 7}
+    assert settTimeline.balances_at(102)[1] == {user: 5, other: 2}
@@ -0,0 +1,30 @@
+from brownie import chain, web3
+
+from assistant.rewards.block_cache import BlockHeaderCache
+
+
+def test_timestamps_match_chain():
+    start = chain.height
+    chain.mine(5)
+    blocks = list(range(start, chain.height + 1))
+    cache = BlockHeaderCache()
+
+    assert cache.timestamps(blocks) == [
+        web3.eth.getBlock(block)["timestamp"] for block in blocks
+    ]
+    assert (
+        cache.header(blocks[-1])["hash"] == web3.eth.getBlock(blocks[-1])["hash"].hex()
+    )
+
+
+def test_block_at_timestamp():
+    start = chain.height
+    for _ in range(5):
+        chain.sleep(100)
+        chain.mine()
+    cache = BlockHeaderCache()
+
+    for block in range(start + 1, chain.height + 1):
+        timestamp = cache.timestamp(block)
+        assert cache.block_at_timestamp(timestamp, start, chain.height) == block
+        assert cache.block_at_timestamp(timestamp + 50, start, chain.height) == block
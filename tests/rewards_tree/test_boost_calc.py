@@ -0,0 +1,154 @@
+import json
+import random
+
+import pytest
+from assistant.rewards.boost_calc import (
+    balance_column,
+    calc_boosts,
+    snapshot_balances,
+)
+from assistant.rewards.addresses import AddressTable
+from assistant.rewards.classes.UserBalance import (
+    BalanceAccumulator,
+    UserBalance,
+    UserBalances,
+)
+from helpers.constants import MAX_BOOST
+
+
+def reference_boosts(diggSetts, badgerSetts, nonNativeSetts):
+    """
+    The per address boost calculation calc_boosts replaces
+    """
+
+    def filter_dust(balances):
+        return UserBalances([user for user in balances if user.balance > 1])
+
+    def balance(balances, address):
+        return getattr(balances[address], "balance", 0)
+
+    badgerSetts = filter_dust(badgerSetts)
+    diggSetts = filter_dust(diggSetts)
+    allAddresses = {user.address for user in diggSetts}
+    allAddresses |= {user.address for user in badgerSetts}
+    allAddresses |= {user.address for user in nonNativeSetts}
+    nonNativeSetts = filter_dust(nonNativeSetts)
+
+    stakeRatios = {}
+    boostInfo = {}
+    for addr in allAddresses:
+        nonNativeBalance = balance(nonNativeSetts, addr)
+        if nonNativeBalance == 0:
+            stakeRatios[addr] = 0
+        else:
+            stakeRatios[addr] = (
+                balance(diggSetts, addr) + balance(badgerSetts, addr)
+            ) / nonNativeBalance
+        boostInfo[addr.lower()] = {
+            "nativeBalance": 0,
+            "nonNativeBalance": 0,
+            "stakeRatio": stakeRatios[addr],
+        }
+    for user in badgerSetts:
+        boostInfo[user.address.lower()]["nativeBalance"] += user.balance
+    for user in diggSetts:
+        boostInfo[user.address.lower()]["nativeBalance"] += user.balance
+    for user in nonNativeSetts:
+        boostInfo[user.address.lower()]["nonNativeBalance"] += user.balance
+
+    sortedNonNative = sorted(
+        nonNativeSetts, key=lambda u: stakeRatios[u.address], reverse=True
+    )
+    nonNativeTotal = sum(user.balance for user in sortedNonNative)
+    badgerBoost = {}
+    cumulative = 0
+    for user in sortedNonNative:
+        cumulative += user.balance / nonNativeTotal
+        boost = MAX_BOOST - (cumulative * (MAX_BOOST - 1))
+        if boost < 1 or stakeRatios[user.address] == 0:
+            boost = 1
+        badgerBoost[user.address] = boost
+    return badgerBoost, boostInfo
+
+
+def random_balances(rng, addresses, token):
+    return UserBalances(
+        [
+            UserBalance(addr, rng.choice([rng.random(), rng.random() * 1e6]), token)
+            for addr in rng.sample(addresses, len(addresses) // 2)
+        ]
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_calc_boosts_matches_reference(seed):
+    rng = random.Random(seed)
+    addresses = ["0x{:040x}".format(rng.getrandbits(160)) for _ in range(2000)]
+    diggSetts, badgerSetts, nonNativeSetts = [
+        random_balances(rng, addresses, token) for token in ("digg", "badger", "sett")
+    ]
+    # Users with equal stake ratios keep their order
+    nonNativeSetts = nonNativeSetts.with_balances(
+        [10.0] * 50 + list(nonNativeSetts.balances[50:])
+    )
+
+    table = AddressTable()
+    columns = [
+        balance_column(table, balances)
+        for balances in (diggSetts, badgerSetts, nonNativeSetts)
+    ]
+    badgerBoost, boostInfo = calc_boosts(table.addresses, *columns)
+    expectedBoost, expectedInfo = reference_boosts(
+        diggSetts, badgerSetts, nonNativeSetts
+    )
+
+    assert list(badgerBoost.items()) == list(expectedBoost.items())
+    # Same values and same int/float types
+    assert json.dumps(badgerBoost) == json.dumps(expectedBoost)
+    assert json.dumps(boostInfo, sort_keys=True) == json.dumps(
+        expectedInfo, sort_keys=True
+    )
+
+
+def test_calc_boosts_without_non_native_balances():
+    user = "0x{:040x}".format(0xABC)
+    table = AddressTable()
+    badger = UserBalances([UserBalance(user, 100.0, "badger")])
+    columns = [
+        balance_column(table, balances)
+        for balances in (UserBalances(), badger, UserBalances())
+    ]
+    badgerBoost, boostInfo = calc_boosts(table.addresses, *columns)
+
+    assert badgerBoost == {}
+    assert boostInfo == {
+        user: {"nativeBalance": 100.0, "nonNativeBalance": 0, "stakeRatio": 0}
+    }
+
+
+def test_snapshot_balances_credit_group_totals_to_the_first_sett():
+    first = UserBalances(
+        [UserBalance("0xa", 10.0, "sett1"), UserBalance("0xb", 1.5, "sett1")]
+    )
+    second = UserBalances(
+        [UserBalance("0xb", 4.0, "sett2"), UserBalance("0xc", 6.0, "sett2")]
+    )
+    third = UserBalances(
+        [UserBalance("0xa", 0.25, "sett3"), UserBalance("0xc", 2.0, "sett3")]
+    )
+    group = BalanceAccumulator()
+    for balances in (first, second, third):
+        group.add_many(balances)
+    group.add("0xa", 3.0, "badger")
+    group.add("0xd", 8.0, "badger")
+
+    balances = snapshot_balances(
+        {"sett1": first, "sett2": second, "sett3": third}, group.freeze()
+    )
+
+    # Wallet balances count towards the first sett, wallet only users get none
+    assert balances["sett1"].addresses == ("0xa", "0xb")
+    assert balances["sett1"].balances == (13.25, 5.5)
+    assert balances["sett2"].balances == (4.0, 8.0)
+    assert balances["sett3"].balances == (0.25, 2.0)
+    assert first.balances == (10.0, 1.5)
@@ -0,0 +1,162 @@
+import random
+from types import SimpleNamespace
+
+from assistant.rewards import boost, calc_snapshot
+from assistant.rewards.addresses import checksum_address
+from assistant.rewards.boost import badger_boost
+from assistant.rewards.calc_snapshot import (
+    SnapshotInputs,
+    compute_snapshot,
+    compute_snapshots,
+    snapshot_inputs,
+)
+from assistant.rewards.classes.UserBalance import UserBalance, UserBalances
+from helpers.constants import BADGER, BADGER_TREE, DIGG
+from tests.rewards_tree.tree_helpers import random_address
+
+USERS = ["0x" + "a1" * 20, "0x" + "b2" * 20, "0x" + "c3" * 20]
+SETTS = {
+    "native.badger": "0x" + "1e" * 20,
+    "native.renCrv": "0x" + "2e" * 20,
+    "native.sbtcCrv": "0x" + "3e" * 20,
+}
+
+
+class Badger:
+    """
+    The parts of a BadgerSystem boost and snapshots read
+    """
+
+    def __init__(self, schedules):
+        self.sett_system = SimpleNamespace(
+            vaults={
+                name: SimpleNamespace(address=address)
+                for name, address in SETTS.items()
+            }
+        )
+        self.digg = SimpleNamespace(
+            logic=SimpleNamespace(
+                UFragments=SimpleNamespace(_sharesPerFragment=lambda: 1)
+            )
+        )
+        self.rewardsLogger = SimpleNamespace(
+            getAllUnlockSchedulesFor=lambda sett: schedules
+        )
+
+    def getSett(self, name):
+        return self.sett_system.vaults[name]
+
+
+def sett_balances(name, balances):
+    return UserBalances(
+        [
+            UserBalance(user, balance, SETTS[name], ["", "native"])
+            for user, balance in zip(USERS, balances)
+            if balance
+        ]
+    )
+
+
+def test_snapshots_distribute_on_boosts_usd_group_balances(monkeypatch):
+    block = 200
+    balances = {
+        ("native.badger", block): sett_balances("native.badger", [10 ** 18, 0, 0]),
+        ("native.renCrv", block): sett_balances(
+            "native.renCrv", [3 * 10 ** 18, 10 ** 18, 10]
+        ),
+        ("native.sbtcCrv", block): sett_balances(
+            "native.sbtcCrv", [2 * 10 ** 18, 0, 10 ** 18]
+        ),
+    }
+    for module in (boost, calc_snapshot):
+        monkeypatch.setattr(
+            module,
+            "calculate_sett_balances",
+            lambda badger, name, block: balances[(name, block)],
+        )
+    monkeypatch.setattr(boost, "prefetch_sett_balances", lambda badger, requests: None)
+    monkeypatch.setattr(
+        boost,
+        "interface",
+        SimpleNamespace(IERC20=lambda address: SimpleNamespace(decimals=lambda: 18)),
+    )
+    monkeypatch.setattr(
+        boost,
+        "fetch_token_prices",
+        lambda: {BADGER: 30.0, DIGG: 40000.0, **{a: 50.0 for a in SETTS.values()}},
+    )
+    monkeypatch.setattr(
+        boost, "fetch_wallet_balances", lambda sharesPerFragment, block: ({}, {}, {})
+    )
+    monkeypatch.setattr(
+        calc_snapshot, "block_timestamps", lambda blocks: [b * 10 for b in blocks]
+    )
+    # 1000 BADGER unlocked linearly from 0 to 10000, 100 between the blocks
+    badger = Badger(
+        [(SETTS["native.renCrv"], BADGER, 1000 * 10 ** 18, 0, 10000, 10000)]
+    )
+
+    boosts, _, settBalances = badger_boost(badger, block)
+    inputs = snapshot_inputs(
+        badger, "native.renCrv", 100, block, settBalances["native.renCrv"]
+    )
+    rewards, apyBoosts = compute_snapshot(inputs, 2, boosts, {})
+
+    assert boosts == {USERS[0]: 1.5714285714285714, USERS[1]: 1, USERS[2]: 1}
+    # USD balances, with a user's total across the non native setts in the
+    # first of them they hold
+    assert inputs.userBalances.balances == (250.0, 50.0, 50.0)
+    assert inputs.tokenDistributions == [(BADGER, 100 * 10 ** 18)]
+    assert rewards.claims.toDict() == {
+        checksum_address(USERS[0]): {BADGER: 79710144927536234496},
+        checksum_address(USERS[1]): {BADGER: 10144927536231884800},
+        checksum_address(USERS[2]): {BADGER: 10144927536231884800},
+    }
+    assert apyBoosts == {
+        USERS[0]: 1.115942028985507,
+        USERS[1]: 0.7101449275362319,
+        USERS[2]: 0.7101449275362319,
+    }
+    # The cached sett balances are left as they were
+    assert balances[("native.renCrv", block)].balances == (3 * 10 ** 18, 10 ** 18, 10)
+
+
+def synthetic_inputs(rng):
+    users = [random_address(rng) for _ in range(300)]
+    tokens = [BADGER, DIGG]
+    inputs = []
+    for name in ["native.renCrv", "native.cvx", "native.badger", "native.cvxCrv"]:
+        holders = rng.sample(users, 120) + [BADGER_TREE.lower()]
+        rng.shuffle(holders)
+        balances = UserBalances(
+            [
+                UserBalance(user, rng.getrandbits(90), name, ["", "native"])
+                for user in holders
+            ]
+        )
+        distributions = [(token, rng.getrandbits(75)) for token in tokens]
+        inputs.append(SnapshotInputs(name, balances, distributions + [(BADGER, 0)]))
+    boosts = {user: 1 + rng.random() * 2 for user in rng.sample(users, 150)}
+    unclaimedBalances = {
+        key: {user: rng.getrandbits(80) for user in rng.sample(users, 40)}
+        for key in ("bCvx", "bCvxCrv")
+    }
+    return inputs, boosts, unclaimedBalances
+
+
+def test_snapshot_pool_matches_a_single_process():
+    inputs, boosts, unclaimedBalances = synthetic_inputs(random.Random(1))
+
+    single = compute_snapshots(inputs, 3, boosts, unclaimedBalances, workers=1)
+    pooled = compute_snapshots(inputs, 3, boosts, unclaimedBalances, workers=2)
+
+    assert len(pooled) == len(inputs)
+    for (rewards, apyBoosts), (expected, expectedBoosts) in zip(pooled, single):
+        assert list(rewards.claims.items()) == list(expected.claims.items())
+        assert list(rewards.totals.items()) == list(expected.totals.items())
+        assert rewards.to_merkle_format() == expected.to_merkle_format()
+        assert list(apyBoosts.items()) == list(expectedBoosts.items())
+    # The tree's share went to unclaimed balance holders, not to the tree
+    cvxRewards = dict(single[1][0].claims.items())
+    assert checksum_address(BADGER_TREE) not in cvxRewards
+    assert set(map(checksum_address, unclaimedBalances["bCvx"])) <= set(cvxRewards)
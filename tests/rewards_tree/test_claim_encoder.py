@@ -0,0 +1,52 @@
+import random
+
+import pytest
+from eth_abi import encode_abi
+from eth_utils import encode_hex, to_checksum_address
+from assistant.rewards.claim_encoder import encode_claim, encode_claims
+from tests.rewards_tree.tree_helpers import random_address
+
+CLAIM_TYPES = ["uint", "address", "uint", "address[]", "uint[]"]
+
+
+def random_checksum_address(rng):
+    return to_checksum_address(random_address(rng))
+
+
+def random_claim(rng):
+    tokenCount = rng.randint(0, 8)
+    return (
+        rng.getrandbits(rng.choice([8, 32, 256])),
+        random_checksum_address(rng),
+        rng.getrandbits(rng.choice([8, 64])),
+        [random_checksum_address(rng) for _ in range(tokenCount)],
+        [rng.getrandbits(rng.choice([1, 64, 128, 256])) for _ in range(tokenCount)],
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_encode_claim_matches_encode_abi(seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        claim = random_claim(rng)
+        assert encode_claim(*claim) == encode_hex(encode_abi(CLAIM_TYPES, claim))
+
+
+def test_encode_claims_matches_single_encoding():
+    rng = random.Random(42)
+    claims = [random_claim(rng) for _ in range(250)]
+    assert encode_claims(claims) == [encode_claim(*claim) for claim in claims]
+
+
+def test_encode_claim_rejects_invalid_values():
+    rng = random.Random(7)
+    user = random_checksum_address(rng)
+    token = random_checksum_address(rng)
+    with pytest.raises(ValueError):
+        encode_claim(0, user, 1, [token], [1, 2])
+    with pytest.raises(ValueError):
+        encode_claim(0, user[:-2], 1, [token], [1])
+    with pytest.raises(OverflowError):
+        encode_claim(0, user, 1, [token], [-1])
+    with pytest.raises(OverflowError):
+        encode_claim(0, user, 1, [token], [2 ** 256])
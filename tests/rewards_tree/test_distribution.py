@@ -0,0 +1,35 @@
+import random
+
+import pytest
+from assistant.rewards.distribution import distribute
+
+
+def random_balances(rng, count):
+    return [
+        rng.choice([rng.getrandbits(70), rng.getrandbits(80) * rng.random()])
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_float_mode_matches_per_user_distribution(seed):
+    rng = random.Random(seed)
+    balances = random_balances(rng, 500)
+    amount = rng.getrandbits(90)
+    rewardsUnit = amount / sum(balances)
+    assert distribute(balances, amount) == [
+        int(balance * rewardsUnit) for balance in balances
+    ]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_exact_mode_reconciles_to_the_wei(seed):
+    rng = random.Random(seed)
+    balances = random_balances(rng, 500)
+    amount = rng.getrandbits(90)
+    shares = distribute(balances, amount, exact=True)
+    total = sum(int(balance) for balance in balances)
+
+    assert sum(shares) == amount
+    for balance, share in zip(balances, shares):
+        assert abs(share - int(balance) * amount / total) <= 1
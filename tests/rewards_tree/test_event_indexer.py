@@ -0,0 +1,157 @@
+from brownie import MockToken, accounts, chain
+from hexbytes import HexBytes
+
+from assistant.indexer.client import (
+    fetch_claimed,
+    fetch_geyser_events,
+    fetch_sett_balances,
+)
+from assistant.indexer.indexer import (
+    CLAIMED_TOPIC,
+    STAKED_TOPIC,
+    UNSTAKED_TOPIC,
+    SOURCES,
+    index_events,
+)
+from assistant.indexer.store import EventStore
+
+GEYSER = "0x" + "11" * 20
+TREE = "0x" + "22" * 20
+TOKEN = "0x" + "33" * 20
+USERS = ["0x" + "a1" * 20, "0x" + "b2" * 20]
+
+
+def topic(value):
+    if isinstance(value, str):
+        value = int(value, 16)
+    return HexBytes(value.to_bytes(32, "big"))
+
+
+def log(block, logIndex, topics, words):
+    return {
+        "blockNumber": block,
+        "logIndex": logIndex,
+        "transactionHash": HexBytes(bytes([block, logIndex]) * 16),
+        "topics": [HexBytes(t) if isinstance(t, str) else t for t in topics],
+        "data": "0x" + "".join("{:064x}".format(word) for word in words),
+    }
+
+
+def geyser_log(block, logIndex, eventTopic, user, amount, total, timestamp):
+    return log(
+        block,
+        logIndex,
+        [eventTopic, topic(user), topic(timestamp), topic(block)],
+        # amount, total and the offset and length of the empty bytes
+        [amount, total, 0x80, 0],
+    )
+
+
+def claim_log(block, logIndex, user, token, amount, cycle, timestamp):
+    return log(
+        block,
+        logIndex,
+        [CLAIMED_TOPIC, topic(user), topic(token), topic(cycle)],
+        [amount, timestamp, block],
+    )
+
+
+def index_logs(store, kind, contract, logs, toBlock):
+    table, _, decode = SOURCES[kind]
+    store.write(
+        table, contract, kind, [decode(contract, entry) for entry in logs], toBlock
+    )
+
+
+def test_indexed_balances_match_chain(tmp_path):
+    deployer = accounts[0]
+    holders = accounts[1:5]
+    token = MockToken.deploy({"from": deployer})
+    token.initialize(holders, [10 ** 18] * len(holders), {"from": deployer})
+
+    blocks = [chain.height]
+    for i, holder in enumerate(holders):
+        token.transfer(holders[(i + 1) % len(holders)], 10 ** 17 * i, {"from": holder})
+        blocks.append(chain.height)
+    token.burn(holders[0], 10 ** 17, {"from": deployer})
+    token.mint(accounts[5], 10 ** 18, {"from": deployer})
+    blocks.append(chain.height)
+
+    store = EventStore(str(tmp_path / "events.sqlite"))
+    settId = token.address.lower()
+
+    # Index part of the history first, later lookups resume from there
+    index_events(store, "transfers", settId, blocks[2], workers=2, blockRange=2)
+    assert store.last_block(settId, "transfers") == blocks[2]
+
+    for block in blocks:
+        balances = fetch_sett_balances("mock", settId, block, store)
+        for account in accounts[1:6]:
+            assert balances.get(account.address.lower(), 0) == token.balanceOf(
+                account, block_identifier=block
+            )
+    assert store.last_block(settId, "transfers") == blocks[-1]
+
+
+def test_geyser_events_in_subgraph_shape(tmp_path):
+    store = EventStore(str(tmp_path / "events.sqlite"))
+    logs = [
+        geyser_log(10, 0, STAKED_TOPIC, USERS[0], 100, 100, 1000),
+        geyser_log(11, 3, STAKED_TOPIC, USERS[1], 10 ** 30, 10 ** 30, 1010),
+        geyser_log(12, 1, UNSTAKED_TOPIC, USERS[0], 40, 60, 1020),
+        geyser_log(20, 0, STAKED_TOPIC, USERS[0], 5, 65, 1100),
+    ]
+    index_logs(store, "geyser", GEYSER, logs, 30)
+
+    def event_id(entry):
+        return "{}-{}".format(entry["transactionHash"].hex(), entry["logIndex"])
+
+    events = fetch_geyser_events(GEYSER, 12, store)
+    assert events == {
+        "stakes": [
+            {
+                "id": event_id(logs[0]),
+                "user": USERS[0],
+                "amount": "100",
+                "timestamp": "1000",
+                "total": "100",
+            },
+            {
+                "id": event_id(logs[1]),
+                "user": USERS[1],
+                "amount": str(10 ** 30),
+                "timestamp": "1010",
+                "total": str(10 ** 30),
+            },
+        ],
+        "unstakes": [
+            {
+                "id": event_id(logs[2]),
+                "user": USERS[0],
+                "amount": "40",
+                "timestamp": "1020",
+                "total": "60",
+            }
+        ],
+        "totalStaked": 60 + 10 ** 30,
+    }
+    assert len(fetch_geyser_events(GEYSER, 30, store)["stakes"]) == 3
+
+
+def test_claims_are_summed_per_user_and_token(tmp_path):
+    store = EventStore(str(tmp_path / "events.sqlite"))
+    otherToken = "0x" + "44" * 20
+    logs = [
+        claim_log(10, 0, USERS[0], TOKEN, 100, 1, 1000),
+        claim_log(11, 0, USERS[0], TOKEN, 50, 2, 1010),
+        claim_log(11, 1, USERS[0], otherToken, 7, 2, 1010),
+        claim_log(12, 0, USERS[1], TOKEN, 10 ** 30, 3, 1020),
+    ]
+    index_logs(store, "claims", TREE, logs, 20)
+
+    assert store.claims(TREE, 20)[0] == (USERS[0], TOKEN, "100", 1, 10)
+    assert fetch_claimed(TREE, 11, store) == {USERS[0]: {TOKEN: 150, otherToken: 7}}
+    assert fetch_claimed(TREE, 20, store) == {
+        USERS[0]: {TOKEN: 150, otherToken: 7},
+        USERS[1]: {TOKEN: 10 ** 30},
+    }
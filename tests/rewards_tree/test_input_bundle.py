@@ -0,0 +1,168 @@
+import asyncio
+import gzip
+import json
+import os
+
+import pytest
+from brownie import chain, web3
+
+from assistant.rewards.classes.InputBundle import (
+    InputBundle,
+    MissingInputError,
+    diff_bundles,
+    inputBundle,
+    load_bundle,
+)
+from assistant.rewards.rewards_utils import calculate_sett_balances
+from assistant.subgraph.sessions import memoized
+
+
+def record_cycle(bundle, prices, balances, blocks=()):
+    with bundle.record({"startBlock": 1, "endBlock": 2}):
+        results = [
+            bundle.fetch(lambda: prices, "prices"),
+            bundle.fetch(lambda: balances, "claimable balances", ["0x1", "0x2"]),
+            bundle.captured({"vaults": [{"id": "0x1"}]}, "subgraph", "setts", 2),
+        ]
+        for block in blocks:
+            bundle.captured({"number": block}, "block header", block)
+    return results
+
+
+def test_replay_returns_recorded_inputs(tmp_path):
+    bundle = InputBundle()
+    prices = {"0xbadger": 1.5, "0xdigg": 30000.25}
+    balances = {"0x1": [{"address": "0xbcvx", "balance": str(10 ** 30)}], "0x2": []}
+    recorded = record_cycle(bundle, prices, balances)
+    assert recorded[:2] == [prices, balances]
+
+    inputs = load_bundle(bundle.save(str(tmp_path)))
+    assert inputs["meta"] == {"startBlock": 1, "endBlock": 2}
+
+    def offline():
+        raise AssertionError("replay went to the network")
+
+    with bundle.replay(inputs):
+        assert bundle.fetch(offline, "prices") == prices
+        assert bundle.unused() != []
+        assert bundle.fetch(offline, "claimable balances", ["0x1", "0x2"]) == balances
+        assert bundle.replayed("subgraph", "setts", 2) == recorded[2]
+        assert bundle.unused() == []
+        with pytest.raises(MissingInputError):
+            bundle.fetch(offline, "claimable balances", ["0x1"])
+    # Live again outside of a replay
+    assert bundle.fetch(lambda: {}, "prices") == {}
+
+
+def test_inputs_keep_their_first_value():
+    bundle = InputBundle()
+    with bundle.record():
+        assert bundle.fetch(lambda: {"price": 1}, "prices") == {"price": 1}
+        assert bundle.fetch(lambda: {"price": 2}, "prices") == {"price": 1}
+        # Values are shared by hash
+        bundle.fetch(lambda: {"price": 1}, "prices", "other")
+    assert len(bundle.manifest) == 2
+    assert len(bundle.blobs) == 1
+
+
+def test_bundles_are_content_addressed(tmp_path):
+    first, second = InputBundle(), InputBundle()
+    record_cycle(first, {"0xbadger": 1.5}, {"0x1": []})
+    record_cycle(second, {"0xbadger": 1.5}, {"0x1": []})
+    path = first.save(str(tmp_path))
+    assert second.save(str(tmp_path)) == path
+
+    with gzip.open(path, "rt") as f:
+        data = json.load(f)
+    blob = next(iter(data["blobs"]))
+    data["blobs"][blob] = {"tampered": True}
+    with gzip.open(path, "wt") as f:
+        json.dump(data, f)
+    with pytest.raises(ValueError):
+        load_bundle(path)
+
+
+def test_diff_localizes_changed_inputs(tmp_path):
+    first, second = InputBundle(), InputBundle()
+    record_cycle(first, {"0xbadger": 1.5}, {"0x1": []})
+    record_cycle(second, {"0xbadger": 1.6}, {"0x1": []}, blocks=[5])
+
+    diff = diff_bundles(
+        load_bundle(first.save(str(tmp_path))), load_bundle(second.save(str(tmp_path)))
+    )
+    assert [(e["kind"], e["args"]) for e in diff["changed"]] == [("prices", [])]
+    assert diff["onlyBefore"] == []
+    assert [(e["kind"], e["args"]) for e in diff["onlyAfter"]] == [
+        ("block header", [5])
+    ]
+
+
+class Sessions:
+    """
+    Stands in for SubgraphSessions, answering through the input bundle
+    """
+
+    def __init__(self):
+        self.queries = 0
+
+    async def execute(self, name, query, variables=None, block=None):
+        def live():
+            self.queries += 1
+            return {"balance": block * 10}
+
+        return inputBundle.fetch(live, "subgraph", name, query, variables, block)
+
+
+def test_memoized_inputs_are_recorded_every_cycle(tmp_path):
+    @memoized
+    async def fetch_balance(sessions, block):
+        return await sessions.execute("setts", "balances", {}, block)
+
+    sessions = Sessions()
+
+    def cycle():
+        return asyncio.run(fetch_balance(sessions, 100))
+
+    with inputBundle.record({"cycle": 1}):
+        assert cycle() == {"balance": 1000}
+    # A re-proposal in the same process asks for the same block again
+    with inputBundle.record({"cycle": 2}):
+        assert calculate_sett_balances.cache_info().currsize == 0
+        assert cycle() == {"balance": 1000}
+    assert sessions.queries == 2
+    path = inputBundle.save(str(tmp_path))
+
+    # A live call outside of a cycle warms the memo again, the replay
+    # still reads the bundle
+    cycle()
+    assert sessions.queries == 3
+    with inputBundle.replay(load_bundle(path)):
+        assert cycle() == {"balance": 1000}
+        assert inputBundle.unused() == []
+    assert sessions.queries == 3
+
+
+def test_old_bundles_are_pruned(tmp_path):
+    bundle = InputBundle()
+    paths = []
+    for price in range(4):
+        record_cycle(bundle, {"0xbadger": price}, {})
+        paths.append(bundle.save(str(tmp_path), keep=2))
+        os.utime(paths[-1], (price, price))
+    assert sorted(os.listdir(str(tmp_path))) == sorted(
+        os.path.basename(path) for path in paths[2:]
+    )
+
+
+def test_rpc_reads_are_replayed():
+    bundle = InputBundle()
+    bundle.capture_rpc(web3)
+
+    with bundle.record():
+        block = web3.eth.getBlock("latest")
+    chain.mine()
+
+    inputs = {"meta": bundle.meta, "manifest": bundle.manifest, "blobs": bundle.blobs}
+    with bundle.replay(inputs):
+        assert web3.eth.getBlock("latest") == block
+    assert web3.eth.getBlock("latest")["number"] == block["number"] + 1
@@ -0,0 +1,134 @@
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from itertools import zip_longest
+
+import pytest
+from assistant.rewards import merkle_hash
+from assistant.rewards.classes import MerkleTree as merkle_tree
+from assistant.rewards.classes.MerkleTree import MerkleTree
+from assistant.rewards.merkle_hash import (
+    build_layers,
+    dirty_positions,
+    hash_leaf,
+    hash_pair,
+    load_layers,
+    update_layers,
+)
+from eth_hash.auto import keccak
+from eth_utils import decode_hex, encode_hex
+from tests.rewards_tree.tree_helpers import random_tree
+
+
+def random_nodes(count):
+    return ["0x" + secrets.token_hex(32 * 7) for _ in range(count)]
+
+
+def baseline_tree(nodes):
+    """
+    Root and proofs as the tree built them one node at a time, sorting each
+    pair with sorted() before hashing it with keccak like web3.keccak
+    """
+    elements = sorted(set(keccak(decode_hex(node)) for node in nodes))
+    layers = [elements]
+    while len(layers[-1]) > 1:
+        layers.append(
+            [
+                a if b is None else keccak(b"".join(sorted([a, b])))
+                for a, b in zip_longest(layers[-1][::2], layers[-1][1::2])
+            ]
+        )
+
+    def proof(node):
+        idx = elements.index(keccak(decode_hex(node)))
+        proof = []
+        for layer in layers:
+            pairIdx = idx + 1 if idx % 2 == 0 else idx - 1
+            if pairIdx < len(layer):
+                proof.append(encode_hex(layer[pairIdx]))
+            idx //= 2
+        return proof
+
+    return layers[-1][0], {node: proof(node) for node in nodes}
+
+
+def assert_matches_baseline(tree, nodes):
+    root, proofs = baseline_tree(nodes)
+    assert tree.root == root
+    assert {node: tree.get_proof(node) for node in nodes} == proofs
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7, 64, 257])
+def test_batch_hashing_matches_baseline(count):
+    nodes = random_nodes(count)
+    assert_matches_baseline(MerkleTree(nodes, workers=1), nodes)
+
+
+def test_pooled_hashing_matches_baseline(monkeypatch):
+    pools = []
+
+    class Pool(ProcessPoolExecutor):
+        def __init__(self, max_workers):
+            pools.append(max_workers)
+            super().__init__(max_workers=max_workers)
+
+    monkeypatch.setattr(merkle_hash, "PARALLEL_THRESHOLD", 8)
+    monkeypatch.setattr(merkle_hash, "ProcessPoolExecutor", Pool)
+    nodes = random_nodes(301)
+
+    assert_matches_baseline(MerkleTree(nodes, workers=2), nodes)
+    assert pools == [2]
+    leaves = b"".join(sorted(keccak(decode_hex(node)) for node in nodes))
+    assert build_layers(leaves, 3) == build_layers(leaves, 1)
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7, 64, 257])
+def test_proofs_hash_up_to_the_root(count):
+    nodes = random_nodes(count)
+    tree = MerkleTree(nodes)
+
+    for node in nodes:
+        computed = hash_leaf(node)
+        for sibling in tree.get_proof(node):
+            computed = hash_pair(computed, decode_hex(sibling))
+        assert computed == tree.root
+
+
+@pytest.mark.parametrize("count", [2, 3, 33, 1000])
+def test_incremental_layers_match_full_rebuild(count):
+    leaves = [secrets.token_bytes(32) for _ in range(count)]
+    previousLayers = build_layers(b"".join(leaves), 1)
+
+    changed = list(leaves)
+    for idx in {0, count // 2, count - 1}:
+        changed[idx] = secrets.token_bytes(32)
+    buffer = b"".join(changed)
+
+    dirty = dirty_positions(previousLayers[0], buffer)
+    assert update_layers(previousLayers, buffer, dirty) == build_layers(buffer, 1)
+
+
+def test_saved_layers_are_reused(tmp_path):
+    nodes = random_nodes(21)
+    tree = MerkleTree(nodes)
+    path = str(tmp_path / "layers.bin")
+    tree.save(path)
+
+    previousLayers = load_layers(path)
+    assert previousLayers == [b"".join(layer) for layer in tree.layers]
+
+    rebuilt = MerkleTree(nodes, previousLayers=previousLayers)
+    assert rebuilt.layers == tree.layers
+    for node in nodes:
+        assert rebuilt.get_proof(node) == tree.get_proof(node)
+
+
+def test_claims_passes_share_encoded_layers(monkeypatch):
+    tree = random_tree(4, 50, lazyClaims=True)
+    claims = tree["claims"]
+    first = dict(claims.items())
+
+    encoded = []
+    monkeypatch.setattr(merkle_tree, "encode_hex", encoded.append)
+    for _ in range(4):
+        assert dict(claims.items()) == first
+    assert encoded == []
@@ -0,0 +1,115 @@
+import asyncio
+from types import SimpleNamespace
+
+from assistant.rewards import rewards_utils
+from assistant.subgraph.client import (
+    fetch_geyser_events_async,
+    fetch_many_sett_balances_async,
+    fetch_sett_balances_async,
+)
+
+
+class Badger:
+    def getSett(self, name):
+        return SimpleNamespace(address="0x" + name.encode().hex().rjust(40, "0"))
+
+    def getGeyser(self, name):
+        return SimpleNamespace(address="0x" + name.encode().hex().rjust(40, "1"))
+
+
+def test_prefetch_skips_fetched_pairs(monkeypatch):
+    badger = Badger()
+    ran = []
+    monkeypatch.setattr(rewards_utils, "run_queries", ran.append)
+    monkeypatch.setattr(fetch_sett_balances_async, "cache", {})
+    monkeypatch.setattr(fetch_geyser_events_async, "cache", {})
+
+    requests = [("native.badger", 100), ("native.renCrv", 100)]
+    for fetch, args in rewards_utils.sett_balance_queries(badger, *requests[0]):
+        fetch.cache[args] = {}
+
+    rewards_utils.prefetch_sett_balances(badger, requests)
+    (queries,) = ran
+    settId = badger.getSett("native.renCrv").address.lower()
+    geyserId = badger.getGeyser("native.renCrv").address.lower()
+    assert queries == [
+        (fetch_geyser_events_async, (geyserId, 100)),
+        (fetch_many_sett_balances_async, ({"native.renCrv": settId}, 100)),
+    ]
+
+    # Everything fetched, nothing goes to the subgraph
+    for fetch, args in rewards_utils.sett_balance_queries(badger, *requests[1]):
+        fetch.cache[args] = {}
+    rewards_utils.prefetch_sett_balances(badger, requests)
+    assert len(ran) == 1
+
+
+def test_many_sett_balances_drop_exhausted_aliases(monkeypatch):
+    monkeypatch.setattr(fetch_sett_balances_async, "cache", {})
+    vaults = {
+        "native.badger": "0x" + "1e" * 20,
+        "native.renCrv": "0x" + "2e" * 20,
+        "native.sbtcCrv": "0x" + "3e" * 20,
+    }
+    # Pages of 2: renCrv holds 3 pages, badger 1 and sbtcCrv isn't indexed yet
+    holdings = {
+        vaults["native.badger"]: {"0x" + "a1" * 20: 1, "0x" + "a2" * 20: 2},
+        vaults["native.renCrv"]: {
+            "0x" + "b{}".format(i) * 20: 10 + i for i in range(1, 6)
+        },
+    }
+
+    class Sessions:
+        def __init__(self):
+            self.sent = []
+
+        async def execute(self, name, query, variables, block):
+            assert (name, block) == ("setts", 100)
+            assert variables["blockHeight"] == {"number": 100}
+            aliases = [
+                field.alias.value
+                for field in query.definitions[0].selection_set.selections
+            ]
+            self.sent.append(
+                {
+                    alias: (variables[alias]["id"], variables[alias + "Last"]["id_gt"])
+                    for alias in aliases
+                }
+            )
+            results = {}
+            for alias in aliases:
+                vault = variables[alias]["id"]
+                if vault not in holdings:
+                    results[alias] = []
+                    continue
+                ids = sorted(
+                    "{}-{}".format(account, vault) for account in holdings[vault]
+                )
+                lastId = variables[alias + "Last"]["id_gt"]
+                page = [i for i in ids if i > lastId][:2]
+                balances = [
+                    {"id": i, "shareBalanceRaw": str(holdings[vault][i[:42]])}
+                    for i in page
+                ]
+                results[alias] = [{"balances": balances}]
+            return results
+
+    sessions = Sessions()
+    balances = asyncio.run(fetch_many_sett_balances_async(sessions, vaults, 100))
+
+    badger, renCrv, sbtcCrv = vaults.values()
+    renIds = sorted("{}-{}".format(a, renCrv) for a in holdings[renCrv])
+    # Exhausted vaults leave the document and the rest are aliased again from v0
+    assert sessions.sent == [
+        {"v0": (badger, ""), "v1": (renCrv, ""), "v2": (sbtcCrv, "")},
+        {"v0": (badger, "0x" + "a2" * 20 + "-" + badger), "v1": (renCrv, renIds[1])},
+        {"v0": (renCrv, renIds[3])},
+        {"v0": (renCrv, renIds[4])},
+    ]
+    assert balances == {
+        "native.badger": holdings[badger],
+        "native.renCrv": holdings[renCrv],
+        "native.sbtcCrv": {},
+    }
+    for key, vault in vaults.items():
+        assert fetch_sett_balances_async.cache[(key, vault, 100)] == balances[key]
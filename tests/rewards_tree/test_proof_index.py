@@ -0,0 +1,30 @@
+import pytest
+from assistant.rewards.proof_index import build_proof_index, open_proof_index
+from tests.rewards_tree.tree_helpers import random_tree
+
+
+def test_get_claim_matches_tree(tmp_path):
+    tree = random_tree(1, 80, lazyClaims=True)
+    prefix = str(tmp_path / "rewards")
+    build_proof_index(tree, prefix)
+
+    index = open_proof_index(prefix)
+    assert len(index) == len(tree["claims"])
+    assert index.fields["merkleRoot"] == tree["merkleRoot"]
+    for user, claim in tree["claims"].items():
+        assert index.get_claim(user) == claim
+        assert index.get_claim(user.lower()) == claim
+    assert index.get_claim("0x" + "ff" * 20) is None
+    assert index.get_claim("not an address") is None
+    index.close()
+
+
+def test_mismatched_files_are_rejected(tmp_path):
+    first = str(tmp_path / "first")
+    second = str(tmp_path / "second")
+    build_proof_index(random_tree(2, lazyClaims=True), first)
+    build_proof_index(random_tree(3, lazyClaims=True), second)
+    (tmp_path / "first.dat").write_bytes((tmp_path / "second.dat").read_bytes())
+
+    with pytest.raises(ValueError):
+        open_proof_index(first)
@@ -0,0 +1,35 @@
+import copy
+
+import pytest
+from assistant.rewards import proof_verifier
+from assistant.rewards.proof_verifier import verify_tree
+from tests.rewards_tree.tree_helpers import random_tree
+
+
+@pytest.mark.parametrize("users", [1, 2, 5, 100])
+def test_valid_tree_verifies(users):
+    assert verify_tree(random_tree(users, users), workers=1) == []
+
+
+def test_invalid_claims_are_reported(monkeypatch):
+    # Small chunks so the claims are spread over the pool
+    monkeypatch.setattr(proof_verifier, "VERIFY_CHUNK_SIZE", 8)
+    monkeypatch.setattr(proof_verifier, "PARALLEL_THRESHOLD", 16)
+    tree = random_tree(1, 60)
+    assert verify_tree(tree, workers=2) == []
+
+    tampered = copy.deepcopy(tree)
+    users = list(tampered["claims"])
+    amounts = tampered["claims"][users[3]]["cumulativeAmounts"]
+    amounts[0] = str(int(amounts[0]) + 1)
+    proof = tampered["claims"][users[40]]["proof"]
+    proof[0] = "0x" + "00" * 32
+    del tampered["claims"][users[50]]["node"]
+
+    errors = dict(verify_tree(tampered, workers=2))
+    assert set(errors) == {users[3], users[40], users[50]}
+    assert errors[users[3]] == "node doesn't match the claim"
+    assert errors[users[40]] == "proof doesn't lead to the merkle root"
+
+    tampered = dict(tree, merkleRoot="0x" + "11" * 32)
+    assert len(verify_tree(tampered, workers=2)) == len(tree["claims"])
@@ -0,0 +1,99 @@
+import pickle
+import random
+
+from assistant.rewards.classes.CumulativeLedger import CumulativeLedger
+from assistant.rewards.classes.MerkleTree import rewards_to_merkle_tree
+from assistant.rewards.classes.RewardsList import RewardsList
+from assistant.rewards.rewards_utils import process_cumulative_rewards
+from tests.rewards_tree.tree_helpers import random_address
+
+
+def random_rewards(rng, users, tokens):
+    rewards = RewardsList(1, None)
+    for user in rng.sample(users, len(users) // 2):
+        for token in rng.sample(tokens, rng.randint(1, len(tokens))):
+            amount = rng.choice([rng.getrandbits(80), rng.random() * 1e18])
+            rewards.increase_user_rewards(user, token, amount)
+    return rewards
+
+
+def test_merge_matches_claim_by_claim():
+    rng = random.Random(1)
+    users = [random_address(rng) for _ in range(200)]
+    tokens = [random_address(rng) for _ in range(4)]
+    lists = [random_rewards(rng, users, tokens) for _ in range(3)]
+
+    merged = RewardsList(2, None)
+    expected = RewardsList(2, None)
+    for rewards in lists:
+        merged.merge(rewards)
+        for user, claims in rewards.claims.items():
+            for token, claim in claims.items():
+                expected.increase_user_rewards(user, token, claim)
+
+    assert list(merged.claims.items()) == list(expected.claims.items())
+    assert list(merged.totals.items()) == list(expected.totals.items())
+    assert merged.to_merkle_format() == expected.to_merkle_format()
+
+
+def test_pickled_rewards_keep_claims():
+    rng = random.Random(2)
+    users = [random_address(rng) for _ in range(50)]
+    tokens = [random_address(rng) for _ in range(3)]
+    rewards = random_rewards(rng, users, tokens)
+
+    restored = pickle.loads(pickle.dumps(rewards))
+    assert list(restored.claims.items()) == list(rewards.claims.items())
+    assert restored.totals == rewards.totals
+    assert restored.cycle == rewards.cycle
+
+
+def test_past_claims_match_claim_by_claim():
+    rng = random.Random(3)
+    users = [random_address(rng) for _ in range(200)]
+    tokens = [random_address(rng) for _ in range(4)]
+    new = random_rewards(rng, users, tokens)
+    pastClaims = {}
+    for user in rng.sample(users, 150):
+        userTokens = rng.sample(tokens, rng.randint(0, len(tokens)))
+        pastClaims[user] = {
+            "tokens": userTokens,
+            "cumulativeAmounts": [str(rng.getrandbits(80)) for _ in userTokens],
+        }
+
+    ledger = CumulativeLedger.from_claims(pastClaims)
+    result = RewardsList(2, None).merge(new).add_ledger(ledger)
+    expected = RewardsList(2, None).merge(new)
+    for user, userData in pastClaims.items():
+        for token, amount in zip(userData["tokens"], userData["cumulativeAmounts"]):
+            expected.increase_user_rewards(user, token, int(amount))
+
+    assert list(result.claims.items()) == list(expected.claims.items())
+    assert list(result.totals.items()) == list(expected.totals.items())
+    # Float totals keep their summation order
+    assert any(isinstance(total, float) for total in result.totals.values())
+
+
+def test_saved_ledger_matches_the_tree(tmp_path):
+    rng = random.Random(4)
+    users = [random_address(rng) for _ in range(200)]
+    tokens = [random_address(rng) for _ in range(4)]
+    rewards = random_rewards(rng, users, tokens)
+    tree = rewards_to_merkle_tree(rewards, 1, 2, {})
+
+    path = str(tmp_path / "ledger.pickle")
+    CumulativeLedger.from_rewards(rewards).save(path)
+    loaded = CumulativeLedger.load(path)
+    fromTree = CumulativeLedger.from_claims(tree["claims"])
+
+    assert list(loaded.claims.items()) == list(fromTree.claims.items())
+    assert list(loaded.totals.items()) == list(fromTree.totals.items())
+    assert loaded.holders(tokens[:1]) == [
+        user for user, claim in tree["claims"].items() if tokens[0] in claim["tokens"]
+    ]
+
+    new = random_rewards(rng, users, tokens)
+    cumulative = process_cumulative_rewards(loaded, new)
+    expected = process_cumulative_rewards(tree, new)
+    assert cumulative.to_merkle_format() == expected.to_merkle_format()
+    assert list(cumulative.totals.items()) == list(expected.totals.items())
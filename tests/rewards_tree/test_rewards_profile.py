@@ -0,0 +1,38 @@
+import json
+
+from brownie import web3
+
+from assistant.rewards.classes.RewardsProfile import RewardsProfile
+
+
+def test_nested_stages_count_their_own_work():
+    profile = RewardsProfile()
+    with profile.stage("cycle"):
+        profile.count("subgraph.pages", 2)
+        with profile.stage("boost"):
+            profile.count("subgraph.pages", 3)
+        with profile.stage("snapshots"):
+            pass
+
+    report = profile.report(10)
+    (cycle,) = report["stages"]
+    boost, snapshots = cycle["stages"]
+
+    assert cycle["counts"] == {"subgraph.pages": 5}
+    assert boost["counts"] == {"subgraph.pages": 3}
+    assert snapshots["counts"] == {}
+    assert cycle["seconds"] >= boost["seconds"] + snapshots["seconds"]
+    assert report["counts"] == {"subgraph.pages": 5}
+    assert [row[0] for row in profile.rows()] == ["cycle", "  boost", "  snapshots"]
+    json.dumps(report)
+
+
+def test_rpc_requests_are_counted_by_method():
+    profile = RewardsProfile()
+    profile.count_rpc(web3)
+
+    with profile.stage("rpc"):
+        web3.eth.getBlock("latest")
+        web3.eth.getBlock("latest")
+
+    assert profile.stages[0]["counts"]["rpc.eth_getBlockByNumber"] == 2
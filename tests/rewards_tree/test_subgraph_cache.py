@@ -0,0 +1,53 @@
+import json
+import os
+
+from assistant.subgraph.cache import QueryCache
+from gql import gql
+
+QUERY = gql(
+    """
+    query balances($blockHeight: Block_height) {
+        vaults(block: $blockHeight) {
+            id
+        }
+    }
+    """
+)
+
+
+def test_cache_is_keyed_by_block(tmp_path):
+    cache = QueryCache(str(tmp_path), 1024 ** 2)
+    key = cache.key("setts", QUERY, {"blockHeight": {"number": 100}}, 100)
+    otherKey = cache.key("setts", QUERY, {"blockHeight": {"number": 101}}, 101)
+    assert key != otherKey
+
+    cache.put(key, {"vaults": [{"id": "0x1"}]})
+    assert cache.get(key) == {"vaults": [{"id": "0x1"}]}
+    assert cache.get(otherKey) is None
+    assert QueryCache(str(tmp_path), 1024 ** 2).size == cache.size
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    result = {"vaults": [{"id": "0x" + "0" * 40}] * 10}
+    maxBytes = 4 * len(json.dumps(result))
+    cache = QueryCache(str(tmp_path), maxBytes)
+    keys = [cache.key("setts", QUERY, {}, block) for block in range(4)]
+    for block, key in enumerate(keys):
+        cache.put(key, result)
+        path = cache._path(key)
+        os.utime(path, (block, block))
+
+    cache.put(cache.key("setts", QUERY, {}, 4), result)
+    assert cache.size <= maxBytes
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[-1]) == result
+
+
+def test_overwriting_a_key_keeps_the_size(tmp_path):
+    cache = QueryCache(str(tmp_path), 1024 ** 2)
+    key = cache.key("setts", QUERY, {}, 1)
+    cache.put(key, {"vaults": [{"id": "0x1"}] * 10})
+    cache.put(key, {"vaults": []})
+    assert cache.size == os.path.getsize(cache._path(key))
+    assert cache.size == QueryCache(str(tmp_path), 1024 ** 2).size
+    assert os.listdir(os.path.dirname(cache._path(key))) == [key + ".json"]
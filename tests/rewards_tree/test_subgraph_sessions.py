@@ -0,0 +1,66 @@
+from gql import gql
+
+from assistant.subgraph import sessions
+from assistant.subgraph.sessions import SessionLoop, run_queries
+
+
+QUERY = gql("{ vaults { id } }")
+
+
+class Client:
+    """
+    Stands in for a gql Client, counting connections and schema fetches
+    """
+
+    clients = []
+
+    def __init__(self, transport, fetch_schema_from_transport=False):
+        self.url = transport
+        self.fetchSchema = fetch_schema_from_transport
+        self.connections = 0
+        self.queries = 0
+        Client.clients.append(self)
+
+    async def __aenter__(self):
+        self.connections += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, query, variable_values=None):
+        self.queries += 1
+        return {"page": variable_values["page"]}
+
+
+async def fetch(sessions, name, page):
+    return await sessions.execute(name, QUERY, {"page": page})
+
+
+def test_sync_fetches_share_one_session_per_subgraph(monkeypatch):
+    monkeypatch.setattr(sessions, "Client", Client)
+    monkeypatch.setattr(sessions, "AIOHTTPTransport", lambda url: url)
+    monkeypatch.setattr(Client, "clients", [])
+    shared = SessionLoop()
+    shared.sessions.cache = None
+    monkeypatch.setattr(sessions, "_session_loop", shared)
+
+    assert run_queries([(fetch, ("setts", 1)), (fetch, ("harvests", 1))]) == [
+        {"page": 1},
+        {"page": 1},
+    ]
+    for page in range(2, 5):
+        assert sessions.run_query(fetch, "setts", page)["page"] == page
+    run_queries([(fetch, ("harvests", 2)), (fetch, ("setts", 5))])
+    shared.close()
+
+    clients = {client.url: client for client in Client.clients}
+    assert len(Client.clients) == len(clients) == 2
+    setts = clients[sessions.subgraph_config["setts"]]
+    harvests = clients[sessions.subgraph_config["harvests"]]
+    assert (setts.connections, setts.queries, setts.fetchSchema) == (1, 5, True)
+    assert (harvests.connections, harvests.queries, harvests.fetchSchema) == (
+        1,
+        2,
+        False,
+    )
@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+from assistant.rewards.tree_binary import (
+    binary_to_json,
+    dump_binary_tree,
+    json_to_binary,
+    load_binary_tree,
+)
+from assistant.rewards.tree_io import dump_tree
+from tests.rewards_tree.tree_helpers import random_tree
+
+
+def test_json_round_trip_is_lossless(tmp_path):
+    tree = random_tree(1)
+    source = str(tmp_path / "tree.json")
+    binary = str(tmp_path / "tree.bin")
+    target = str(tmp_path / "back.json")
+    dump_tree(tree, source)
+
+    json_to_binary(source, binary)
+    binary_to_json(binary, target)
+    with open(source) as a, open(target) as b:
+        assert a.read() == b.read()
+    assert os.path.getsize(binary) < os.path.getsize(source) / 3
+
+
+def test_single_claim_lookup(tmp_path):
+    tree = random_tree(2)
+    path = str(tmp_path / "tree.bin")
+    dump_binary_tree(tree, path)
+
+    binary = load_binary_tree(path)
+    assert binary["merkleRoot"] == tree["merkleRoot"]
+    assert list(binary.keys()) == list(tree.keys())
+    assert len(binary["claims"]) == len(tree["claims"])
+    for user, claim in tree["claims"].items():
+        assert binary["claims"][user] == claim
+        assert binary["claims"][user.lower()] == claim
+    assert "0x" + "00" * 20 not in binary["claims"]
+    assert "0x0" not in binary["claims"]
+    with pytest.raises(KeyError):
+        binary["claims"]["0x" + "00" * 20]
+    binary.close()
+
+
+def test_rejects_trees_it_cannot_restore(tmp_path):
+    tree = random_tree(3, users=3)
+    user = next(iter(tree["claims"]))
+    tree["claims"][user]["cumulativeAmounts"][0] += "0"
+    with pytest.raises(ValueError):
+        dump_binary_tree(tree, str(tmp_path / "tree.bin"))
+
+    path = str(tmp_path / "tree.json")
+    with open(path, "w") as f:
+        json.dump({"claims": {}}, f)
+    with pytest.raises(ValueError):
+        load_binary_tree(path)
@@ -0,0 +1,91 @@
+import json
+import random
+
+from assistant.rewards.tree_diff import diff_trees
+from tests.rewards_tree.tree_helpers import random_address
+
+
+def random_claims(rng, users, tokens):
+    claims = {}
+    for user in users:
+        userTokens = rng.sample(tokens, rng.randint(1, len(tokens)))
+        claims[user] = {
+            "tokens": userTokens,
+            "cumulativeAmounts": [
+                str(rng.getrandbits(rng.choice([10, 90, 200, 255]))) for _ in userTokens
+            ],
+        }
+    return claims
+
+
+def amounts(claims):
+    return {
+        (user, token): int(amount)
+        for user, claim in claims.items()
+        for token, amount in zip(claim["tokens"], claim["cumulativeAmounts"])
+    }
+
+
+def test_diff_matches_claim_by_claim():
+    rng = random.Random(1)
+    tokens = [random_address(rng) for _ in range(4)]
+    users = [random_address(rng) for _ in range(300)]
+    before = {"claims": random_claims(rng, users[:250], tokens[:3])}
+    after = {"claims": json.loads(json.dumps(before["claims"]))}
+    for user in users[:250]:
+        claim = after["claims"][user]
+        claim["cumulativeAmounts"] = [
+            str(int(amount) + rng.choice([0, rng.getrandbits(80)]))
+            for amount in claim["cumulativeAmounts"]
+        ]
+    after["claims"].update(random_claims(rng, users[250:], tokens))
+    # A decrease, a dropped token and a dropped user
+    after["claims"][users[0]]["cumulativeAmounts"][0] = "1"
+    del after["claims"][users[1]]["tokens"][0]
+    del after["claims"][users[1]]["cumulativeAmounts"][0]
+    del after["claims"][users[2]]
+
+    diff = diff_trees(before, after, top=5)
+    a = amounts(before["claims"])
+    b = amounts(after["claims"])
+    keys = set(a) | set(b)
+
+    assert diff.users == 300
+    assert diff.newUsers == 50
+    for token in tokens:
+        totalBefore = sum(v for (u, t), v in a.items() if t == token)
+        totalAfter = sum(v for (u, t), v in b.items() if t == token)
+        assert diff.totalsBefore.get(token, 0) == totalBefore
+        assert diff.totalsAfter[token] == totalAfter
+        assert diff.deltas[token] == totalAfter - totalBefore
+
+    expected = {k for k in keys if b.get(k, 0) < a.get(k, 0)}
+    assert {(v["user"], v["token"]) for v in diff.violations} == expected
+    for v in diff.violations:
+        key = (v["user"], v["token"])
+        assert v["delta"] == b.get(key, 0) - a.get(key, 0)
+    assert len(expected) >= 3
+
+    for token in tokens:
+        gains = sorted(
+            (b.get(k, 0) - a.get(k, 0) for k in keys if k[1] == token), reverse=True
+        )
+        gains = [g for g in gains if g > 0][:5]
+        assert [g["delta"] for g in diff.topGainers[token]] == gains
+
+    outliers = {k for k in keys if a.get(k, 0) > 0 and b.get(k, 0) / a.get(k, 0) > 1.25}
+    assert {(o["user"], o["token"]) for o in diff.ratioOutliers} == outliers
+    json.dumps(diff.to_dict())
+
+
+def test_identical_trees_have_no_changes():
+    rng = random.Random(2)
+    tokens = [random_address(rng) for _ in range(2)]
+    tree = {
+        "claims": random_claims(rng, [random_address(rng) for _ in range(20)], tokens)
+    }
+    diff = diff_trees(tree, tree)
+    assert diff.violations == []
+    assert diff.ratioOutliers == []
+    assert all(delta == 0 for delta in diff.deltas.values())
+    assert all(gainers == [] for gainers in diff.topGainers.values())
@@ -0,0 +1,94 @@
+import io
+import json
+import random
+
+import pytest
+from assistant.rewards import tree_io
+from assistant.rewards.classes.MerkleTree import rewards_to_merkle_tree
+from assistant.rewards.classes.RewardsList import RewardsList
+from assistant.rewards.rewards_utils import process_cumulative_rewards
+from assistant.rewards.tree_io import dump_tree, iter_claims, load_tree, write_tree
+from tests.rewards_tree.tree_helpers import random_address
+
+
+def random_tree(rng, users=50):
+    tokens = [random_address(rng) for _ in range(3)]
+    claims = {}
+    for _ in range(users):
+        user = random_address(rng)
+        claims[user] = {
+            "index": hex(len(claims)),
+            "user": user,
+            "cycle": hex(7),
+            "tokens": tokens[: rng.randint(1, 3)],
+            "cumulativeAmounts": [str(rng.getrandbits(90)) for _ in range(3)],
+            "proof": ["0x{:064x}".format(rng.getrandbits(256)) for _ in range(6)],
+            "node": "0x{:0320x}".format(rng.getrandbits(1280)),
+        }
+    return {
+        "merkleRoot": "0x{:064x}".format(rng.getrandbits(256)),
+        "cycle": 7,
+        "startBlock": "100",
+        "endBlock": "200",
+        "tokenTotals": {token: rng.getrandbits(100) for token in tokens},
+        "claims": claims,
+        "metadata": {"note": "café ☃", "lines": "a\nb"},
+    }
+
+
+@pytest.mark.parametrize("indent", [None, 4])
+def test_write_tree_matches_json_dump(indent):
+    rng = random.Random(1)
+    for tree in [random_tree(rng), dict(random_tree(rng), claims={}, metadata={})]:
+        out = io.StringIO()
+        write_tree(tree, out, indent)
+        assert out.getvalue() == json.dumps(tree, indent=indent)
+
+
+@pytest.mark.parametrize("indent", [None, 4])
+def test_tree_file_reads_back(tmp_path, monkeypatch, indent):
+    # Small chunks make values cross chunk boundaries
+    monkeypatch.setattr(tree_io, "CHUNK_SIZE", 7)
+    tree = random_tree(random.Random(2))
+    path = str(tmp_path / "tree.json")
+    with open(path, "w") as f:
+        json.dump(tree, f, indent=indent, ensure_ascii=False)
+
+    assert list(iter_claims(path)) == list(tree["claims"].items())
+
+    loaded = load_tree(path)
+    assert list(loaded.claims.items()) == list(tree["claims"].items())
+    assert dict(loaded.items()) == tree
+    assert list(loaded.keys()) == list(tree.keys())
+    assert len(loaded["claims"]) == len(tree["claims"])
+    for user, claim in tree["claims"].items():
+        assert user in loaded["claims"]
+        assert loaded["claims"][user] == claim
+    assert "0x0" not in loaded["claims"]
+    loaded.close()
+
+
+def test_lazy_merkle_tree_round_trip(tmp_path):
+    rng = random.Random(3)
+    users = [random_address(rng) for _ in range(40)]
+    tokens = [random_address(rng) for _ in range(3)]
+    rewards = RewardsList(2, None)
+    for user in users:
+        for token in rng.sample(tokens, rng.randint(1, 3)):
+            rewards.increase_user_rewards(user, token, rng.getrandbits(80))
+
+    eager = rewards_to_merkle_tree(rewards, 1, 2, {})
+    lazy = rewards_to_merkle_tree(rewards, 1, 2, {}, lazyClaims=True)
+    assert lazy == eager
+
+    path = str(tmp_path / "tree.json")
+    dump_tree(lazy, path)
+    with open(path) as f:
+        assert f.read() == json.dumps(eager, indent=4)
+
+    # The previous tree is streamed into the next cycle's cumulative rewards
+    new = RewardsList(3, None)
+    new.increase_user_rewards(users[0], tokens[0], 10)
+    streamed = process_cumulative_rewards(load_tree(path), new)
+    loaded = process_cumulative_rewards(eager, new)
+    assert streamed.to_merkle_format() == loaded.to_merkle_format()
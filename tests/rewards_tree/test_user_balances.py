@@ -0,0 +1,66 @@
+import pickle
+
+from assistant.rewards.classes.UserBalance import (
+    BalanceAccumulator,
+    UserBalance,
+    UserBalances,
+)
+from assistant.rewards.rewards_utils import combine_balances
+
+
+def sett_balances(token, balances):
+    return UserBalances(
+        [UserBalance(addr, bal, token, ["", "native"]) for addr, bal in balances]
+    )
+
+
+def test_combine_balances_sums_without_mutating_inputs():
+    first = sett_balances("sett1", [("0xa", 10), ("0xb", 20)])
+    second = sett_balances("sett2", [("0xb", 5), ("0xc", 7)])
+
+    combined = combine_balances([first, second])
+
+    assert combined.addresses == ("0xa", "0xb", "0xc")
+    assert combined.balances == (10, 25, 7)
+    # First set a user appears in keeps its token
+    assert combined["0xb"].token == "sett1"
+    assert combined["0xc"].token == "sett2"
+    assert first.balances == (10, 20)
+    assert second.balances == (5, 7)
+
+
+def test_accumulator_matches_sequential_float_sums():
+    sets = [
+        sett_balances("sett{}".format(i), [("0xa", 0.1 * i), ("0xb", 1 / (i + 3))])
+        for i in range(1, 6)
+    ]
+    accumulator = BalanceAccumulator()
+    for userBalances in sets:
+        accumulator.add_many(userBalances)
+    accumulator.add("0xa", 0.3, "wallet")
+
+    expected = 0.1
+    for i in range(2, 6):
+        expected += 0.1 * i
+    expected += 0.3
+    assert accumulator.freeze()["0xa"].balance == expected
+
+
+def test_boost_balances_returns_a_new_set():
+    balances = sett_balances("sett", [("0xa", 10), ("0xb", 30)])
+
+    boosted = balances.boost_balances({"0xa": 3})
+
+    assert boosted.balances == (30, 30)
+    assert balances.balances == (10, 30)
+    assert balances.total_balance() == 40
+    assert boosted.percentage_of_total("0xa") == 0.5
+
+
+def test_user_balances_pickle():
+    balances = sett_balances("sett", [("0xa", 10 ** 30), ("0xb", 1)])
+
+    loaded = pickle.loads(pickle.dumps(balances))
+
+    assert list(loaded) == list(balances)
+    assert loaded.percentage_of_total("0xb") == balances.percentage_of_total("0xb")
@@ -0,0 +1,27 @@
+import random
+
+from assistant.rewards.classes.MerkleTree import rewards_to_merkle_tree
+from assistant.rewards.classes.RewardsList import RewardsList
+
+"""
+Random addresses and rewards trees shared by the rewards tree tests
+"""
+
+
+def random_address(rng):
+    return "0x{:040x}".format(rng.getrandbits(160))
+
+
+def random_tree(seed, users=60, tokens=4, cycle=5, bits=200, lazyClaims=False):
+    """
+    Merkle tree of a RewardsList giving each of users random amounts of up
+    to tokens tokens
+    """
+    rng = random.Random(seed)
+    tokens = [random_address(rng) for _ in range(tokens)]
+    rewards = RewardsList(cycle, None)
+    for _ in range(users):
+        user = random_address(rng)
+        for token in rng.sample(tokens, rng.randint(1, len(tokens))):
+            rewards.increase_user_rewards(user, token, rng.getrandbits(bits))
+    return rewards_to_merkle_tree(rewards, 10, 20, {}, lazyClaims=lazyClaims)